@@ -79,6 +79,8 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+# Dokumentsökningen (documents/search.py) är indexerad på SQLite med FTS5 och
+# på PostgreSQL; andra databaser söker med icontains över all text.
 
 DATABASES = {
     "default": {
@@ -143,6 +145,34 @@ LOGOUT_REDIRECT_URL = "accounts:login"
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_DOCUMENT_TYPES = ["txt", "pdf", "jpg", "jpeg", "png", "gif"]
 
+# Större uppladdningar sparas i mediarotens .uploads-katalog och flyttas sedan
+# på plats utan ny kopia (se documents/uploads.py)
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "documents.uploads.StagingFileUploadHandler",
+]
+
+# Uppladdning i delar (se documents/chunked.py): föreslagen och största tillåtna delstorlek,
+# samt största tillåtna filstorlek (filen förallokeras när uppladdningen startar)
+DOCUMENT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+# Closure-tabell för anor/ättlingar (kör "manage.py rebuild_ancestry" efter aktivering)
+ANCESTRY_CLOSURE_ENABLED = os.environ.get("ANCESTRY_CLOSURE_ENABLED", "1") == "1"
+
+# Cache för renderade släktdiagram (SVG/PDF)
+CHART_CACHE_DIR = Path(os.environ.get("CHART_CACHE_DIR", str(BASE_DIR / "cache" / "charts")))
+
+# Bakgrundsjobb (trådpool i processen, se core/background.py)
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "1"))
+
+# Nedladdning av dokument (se documents/delivery.py):
+# "" = Django strömmar filen, "x-accel-redirect" = nginx, "x-sendfile" = Apache/lighttpd.
+# För nginx ska DOCUMENT_SENDFILE_PREFIX vara en "internal" location med media-roten som alias.
+DOCUMENT_SENDFILE = os.environ.get("DOCUMENT_SENDFILE", "")
+DOCUMENT_SENDFILE_PREFIX = os.environ.get("DOCUMENT_SENDFILE_PREFIX", "/protected-media/")
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
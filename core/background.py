@@ -0,0 +1,44 @@
+"""
+Enkel bakgrundskörning av långa jobb.
+
+Jobben körs i en trådpool i samma process efter att aktuell transaktion
+har committats, så att en request kan returnera direkt. Det finns ingen
+beständig kö - ett jobb som avbryts (t.ex. vid omstart) måste köras om med
+motsvarande management command.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_WORKERS', 1),
+            thread_name_prefix='genlib-background'
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Bakgrundsjobbet {func.__name__} misslyckades")
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Schemalägg func(*args, **kwargs) i bakgrunden när transaktionen committats"""
+    transaction.on_commit(
+        lambda: _get_executor().submit(_run, func, args, kwargs)
+    )
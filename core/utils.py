@@ -2,6 +2,9 @@
 from django.conf import settings
 from pathlib import Path
 
+# Filtyper (filändelser) som visas som bilder i gallerierna och har EXIF
+IMAGE_TYPES = ['jpg', 'jpeg', 'png', 'gif', 'bmp']
+
 
 def get_media_root():
     """
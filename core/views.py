@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.contrib import messages
 from django.http import FileResponse, HttpResponse
 from persons.models import Person
+from persons import checklist_rollups
 from documents.models import Document
 from .models import SetupStatus, SystemConfig
 from .forms import InitialSetupForm, GedcomImportForm
@@ -42,6 +43,14 @@ def dashboard(request):
     # Formatera total storlek
     size_display = format_file_size(total_size)
 
+    # Avklarade checklistobjekt över tid (läses från dagliga sammanställningar)
+    try:
+        period = int(request.GET.get('period', checklist_rollups.DEFAULT_PERIOD))
+    except ValueError:
+        period = checklist_rollups.DEFAULT_PERIOD
+    if period not in checklist_rollups.PERIODS:
+        period = checklist_rollups.DEFAULT_PERIOD
+
     context = {
         'total_persons': total_persons,
         'total_documents': total_documents,
@@ -50,6 +59,8 @@ def dashboard(request):
         'file_types': file_types,
         'recent_persons': recent_persons,
         'recent_documents': recent_documents,
+        'checklist_trend': checklist_rollups.get_trend(request.user, period),
+        'checklist_periods': checklist_rollups.PERIODS,
     }
 
     return render(request, 'core/dashboard.html', context)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import DocumentType, Document
+from django.db.models import Count
+from .models import DocumentType, Document, DocumentSyncState, ExifBatchJob, Tag, UploadSession
 
 
 @admin.register(DocumentType)
@@ -27,3 +28,58 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('relative_path', 'file_size', 'file_type', 'file_modified_at', 'created_at', 'updated_at')
         }),
     )
+
+
+@admin.register(DocumentSyncState)
+class DocumentSyncStateAdmin(admin.ModelAdmin):
+    """Tillstånd för manage.py sync_documents - ta bort en rad för att tvinga omsynk"""
+    list_display = ['person', 'file_count', 'synced_at']
+    search_fields = ['person__firstname', 'person__surname', 'person__directory_name']
+    readonly_fields = ['person', 'tree_mtime_ns', 'manifest_hash', 'file_count', 'synced_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    """Pågående uppladdningar i delar - avbrutna städas bort med manage.py clear_uploads"""
+    list_display = ['filename', 'person', 'document_type', 'total_size', 'updated_at']
+    search_fields = ['filename', 'person__firstname', 'person__surname']
+    readonly_fields = ['id', 'person', 'document_type', 'filename', 'total_size', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ExifBatchJob)
+class ExifBatchJobAdmin(admin.ModelAdmin):
+    """EXIF-ändringar i många bilder (se documents/exif_batch.py)"""
+    list_display = ['pk', 'user', 'status', 'processed', 'total', 'failed', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = [
+        'user', 'updates', 'document_ids', 'status', 'total', 'processed', 'failed',
+        'errors', 'created_at', 'finished_at',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    """Taggar byts namn på och tas bort via dokumentens taggsida (documents/tags/)"""
+    list_display = ['name', 'user', 'document_count']
+    list_filter = ['user']
+    search_fields = ['name', 'key']
+    readonly_fields = ['user', 'name', 'key']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(document_count=Count('document_tags'))
+
+    @admin.display(description='Dokument', ordering='document_count')
+    def document_count(self, obj):
+        return obj.document_count
+
+    def has_add_permission(self, request):
+        return False
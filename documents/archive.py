@@ -0,0 +1,178 @@
+"""
+ZIP-arkiv med personers alla filer, strömmat direkt till klienten.
+
+Arkivet byggs medan det skickas: zipfile skriver till en buffert utan
+seek, som töms efter varje block. Varken hela arkivet eller hela filer
+hålls i minnet, och inget skrivs till disk. Eftersom bufferten inte går
+att spola tillbaka skriver zipfile storlek och CRC i en data descriptor
+efter varje fil i stället för i filhuvudet.
+
+Filer som redan är komprimerade (bilder, PDF, ZIP) lagras okomprimerade
+(ZIP_STORED); övriga filer komprimeras med deflate.
+
+Först i arkivet ligger manifest.json med personernas metadata, deras
+dokument och en lista över filerna i arkivet.
+"""
+import json
+import os
+import time
+import zipfile
+from typing import Iterable, Iterator, List, Tuple
+
+from django.utils import timezone
+
+from .delivery import CHUNK_SIZE
+from .models import Document
+from .sync import file_modified_at, get_person_dir, scan_files
+
+MANIFEST_NAME = 'manifest.json'
+
+# Filtyper som inte blir mindre av att komprimeras igen
+COMPRESSED_TYPES = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'pdf', 'zip'}
+
+# Tidigaste tid som kan lagras i ett ZIP-filhuvud
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class _StreamBuffer:
+    """Skrivbar ström utan seek som samlar det zipfile skrivit tills det hämtas"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        """Det som skrivits sedan förra anropet"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def compress_type(filename: str) -> int:
+    """ZIP_STORED för redan komprimerade filtyper, annars ZIP_DEFLATED"""
+    _, ext = os.path.splitext(filename)
+    if ext.lstrip('.').lower() in COMPRESSED_TYPES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _zip_info(arcname: str, stat: os.stat_result) -> zipfile.ZipInfo:
+    """Filhuvud med filens ändringstid, rättigheter och förväntade storlek"""
+    date_time = time.localtime(stat.st_mtime)[:6]
+    zinfo = zipfile.ZipInfo(arcname, date_time=max(date_time, ZIP_EPOCH))
+    zinfo.compress_type = compress_type(arcname)
+    zinfo.external_attr = (stat.st_mode & 0xFFFF) << 16
+    # Avgör om filen behöver ZIP64 (den verkliga storleken skrivs efteråt)
+    zinfo.file_size = stat.st_size
+    return zinfo
+
+
+def person_manifest(person, files: List[Tuple[str, os.stat_result]]) -> dict:
+    """Personens metadata, dokument och filer i arkivet"""
+    documents = (
+        Document.objects.filter(person=person)
+        .select_related('document_type')
+        .order_by('relative_path')
+    )
+    return {
+        'firstname': person.firstname,
+        'surname': person.surname,
+        'birth_date': person.birth_date.isoformat() if person.birth_date else None,
+        'death_date': person.death_date.isoformat() if person.death_date else None,
+        'notes': person.notes,
+        'directory_name': person.directory_name,
+        'created_at': person.created_at.isoformat(),
+        'updated_at': person.updated_at.isoformat(),
+        'documents': [
+            {
+                'filename': doc.filename,
+                'relative_path': doc.relative_path,
+                'document_type': doc.document_type.name,
+                'file_type': doc.file_type,
+                'file_size': doc.file_size,
+                'content_hash': doc.content_hash,
+                'tags': doc.tags,
+                'exif': doc.exif,
+                'created_at': doc.created_at.isoformat(),
+            }
+            for doc in documents
+        ],
+        'files': [
+            {
+                'path': f'{person.directory_name}/{rel_path}',
+                'size': stat.st_size,
+                'modified_at': file_modified_at(stat).isoformat(),
+            }
+            for rel_path, stat in files
+        ],
+    }
+
+
+def _list_files(person) -> List[Tuple[str, os.stat_result]]:
+    """Filerna i personens katalog sorterade på sökväg (tom lista om katalogen saknas)"""
+    try:
+        return sorted(scan_files(get_person_dir(person)), key=lambda item: item[0])
+    except FileNotFoundError:
+        return []
+
+
+def stream_archive(persons: Iterable) -> Iterator[bytes]:
+    """
+    Generera ett ZIP-arkiv med personernas kataloger och manifest.json.
+
+    Varje persons filer läggs under personens katalognamn. Katalogerna gås
+    igenom (en stat per fil) innan något skickas, så att manifestet kan
+    ligga först; innehållet läses sedan fil för fil i block om CHUNK_SIZE.
+    En fil som försvunnit sedan genomgången hoppas över.
+
+    Yields:
+        Arkivet i bitar, lämpligt för StreamingHttpResponse
+    """
+    persons = list(persons)
+    listing = [(person, _list_files(person)) for person in persons]
+
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        manifest = {
+            'generated_at': timezone.now().isoformat(),
+            'persons': [person_manifest(person, files) for person, files in listing],
+        }
+        archive.writestr(
+            MANIFEST_NAME,
+            json.dumps(manifest, ensure_ascii=False, indent=2),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+        yield from _drain(buffer)
+
+        for person, files in listing:
+            person_dir = get_person_dir(person)
+            for rel_path, stat in files:
+                try:
+                    source = open(person_dir / rel_path, 'rb')
+                except FileNotFoundError:
+                    continue
+                zinfo = _zip_info(f'{person.directory_name}/{rel_path}', stat)
+                with source, archive.open(zinfo, 'w') as target:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield from _drain(buffer)
+                yield from _drain(buffer)
+
+    # Central katalog och slutpost
+    yield from _drain(buffer)
+
+
+def _drain(buffer: _StreamBuffer) -> Iterator[bytes]:
+    """Det som skrivits till bufferten, om något"""
+    data = buffer.drain()
+    if data:
+        yield data
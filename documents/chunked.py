@@ -0,0 +1,270 @@
+"""
+Uppladdning i delar som kan återupptas, för stora skanningar.
+
+Protokollet (vyerna i documents/views.py svarar med JSON):
+
+1. POST uploads/ med person, filename, size och valfri document_type skapar
+   en UploadSession och en lika stor (gles) fil i uppladdningskatalogen.
+2. PUT uploads/<id>/<offset>/ med delens byte som body. Delen skrivs med
+   os.pwrite direkt på sin plats i filen, så delar kan skickas parallellt
+   och i valfri ordning. Varje mottagen del sparas som en UploadChunk.
+3. GET uploads/<id>/ returnerar mottagna och saknade intervall, så att en
+   klient kan återuppta efter ett avbrott och bara skicka det som saknas.
+4. POST uploads/<id>/finalize/ hashar filen, flyttar den på plats och
+   skapar Document-posten. DELETE uploads/<id>/ avbryter uppladdningen.
+
+Utan document_type räknas filen som en bild, precis som vid ImageUploadView.
+Avbrutna uppladdningar städas bort med manage.py clear_uploads.
+"""
+import os
+from datetime import timedelta
+from pathlib import Path
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.utils import get_media_root
+
+from .hashing import hash_file
+from .models import Document, UploadChunk, UploadSession
+from .uploads import (
+    UPLOAD_IMAGE_TYPES, get_image_document_type, get_staging_dir, move_into_place, unique_path
+)
+
+READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Fel i en uppladdning; status är HTTP-statuskoden att svara med"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def staging_path(session) -> str:
+    """Sökväg till uppladdningens temporära fil"""
+    return os.path.join(get_staging_dir(), f'{session.pk}.part')
+
+
+def clean_filename(name: str) -> str:
+    """Filnamnet utan katalogdelar (klienten styr inte var filen hamnar)"""
+    name = os.path.basename((name or '').replace('\\', '/')).strip()
+    if name in ('', '.', '..'):
+        raise UploadError('Ogiltigt filnamn.')
+    return name
+
+
+def create_session(person, filename: str, total_size: int, document_type=None) -> UploadSession:
+    """
+    Starta en uppladdning och skapa den temporära filen.
+
+    Raises:
+        UploadError: Om filnamn, storlek eller dokumenttyp inte godtas
+    """
+    filename = clean_filename(filename)
+    if total_size < 0:
+        raise UploadError('Ogiltig filstorlek.')
+    if total_size > settings.DOCUMENT_UPLOAD_MAX_SIZE:
+        raise UploadError('Filen är för stor.', status=413)
+
+    # Samma filtyp som finalize_session sparar i Document.file_type
+    file_type = Path(filename).suffix.lstrip('.').lower()
+    if len(file_type) > Document._meta.get_field('file_type').max_length:
+        raise UploadError(f'{filename}: Filändelsen är för lång')
+
+    if document_type is None:
+        document_type = get_image_document_type()
+        if document_type is None:
+            raise UploadError('Ingen dokumenttyp för bilder hittades.')
+        if file_type not in UPLOAD_IMAGE_TYPES:
+            raise UploadError(f'{filename}: Inte en giltig bildfiltyp')
+
+    session = UploadSession.objects.create(
+        person=person,
+        document_type=document_type,
+        filename=filename,
+        total_size=total_size,
+    )
+    fd = os.open(staging_path(session), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.ftruncate(fd, total_size)
+    finally:
+        os.close(fd)
+    return session
+
+
+def merge_ranges(ranges) -> List[List[int]]:
+    """Slå ihop överlappande och angränsande intervall [start, end)"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def received_ranges(session) -> List[List[int]]:
+    return merge_ranges(session.chunks.values_list('start', 'end'))
+
+
+def missing_ranges(received: List[List[int]], total_size: int) -> List[List[int]]:
+    """Intervallen som ännu inte tagits emot"""
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+
+def write_chunk(session, offset: int, stream, length: int) -> None:
+    """
+    Skriv length byte från stream till uppladdningens fil med början på offset.
+
+    Delen registreras bara om alla byte tagits emot; en avbruten del kan
+    skickas om.
+
+    Raises:
+        UploadError: Om delen är för stor, ligger utanför filen eller avbröts
+    """
+    if length > settings.DOCUMENT_UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError('Delen är för stor.', status=413)
+    if offset < 0 or offset + length > session.total_size:
+        raise UploadError('Delen ligger utanför filen.', status=416)
+
+    try:
+        fd = os.open(staging_path(session), os.O_WRONLY)
+    except FileNotFoundError:
+        raise UploadError('Uppladdningen finns inte längre.', status=404)
+
+    position = offset
+    remaining = length
+    try:
+        while remaining:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, position)
+                position += written
+                view = view[written:]
+    finally:
+        os.close(fd)
+
+    if remaining:
+        raise UploadError('Delen avbröts innan alla byte tagits emot.')
+
+    UploadChunk.objects.create(session=session, start=offset, end=offset + length)
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+
+
+def finalize_session(session, expected_hash: str = '') -> Document:
+    """
+    Flytta den färdiga filen till personens katalog och skapa dokumentet.
+
+    Args:
+        expected_hash: SHA-256 som klienten beräknat (kontrolleras om angiven)
+
+    Raises:
+        UploadError: Om delar saknas, filen är borta eller hashen inte stämmer
+    """
+    moved_to = None
+    try:
+        with transaction.atomic():
+            # Låset gör att samtidiga anrop för samma uppladdning körs i tur och
+            # ordning; det andra hittar inte längre uppladdningen
+            if not UploadSession.objects.select_for_update().filter(pk=session.pk).exists():
+                raise UploadError('Uppladdningen finns inte längre.', status=404)
+            if missing_ranges(received_ranges(session), session.total_size):
+                raise UploadError('Alla delar har inte tagits emot.', status=409)
+
+            temp_path = staging_path(session)
+            try:
+                content_hash = hash_file(temp_path)
+            except FileNotFoundError:
+                raise UploadError('Uppladdningen finns inte längre.', status=404)
+            if expected_hash and expected_hash.lower() != content_hash:
+                raise UploadError('Kontrollsumman stämmer inte.', status=422)
+
+            person = session.person
+            doc_type = session.document_type
+            directory = Path(get_media_root()) / 'persons' / person.directory_name / doc_type.target_directory
+            directory.mkdir(parents=True, exist_ok=True)
+            file_path = unique_path(directory, session.filename)
+            try:
+                move_into_place(temp_path, file_path)
+            except FileNotFoundError:
+                raise UploadError('Uppladdningen finns inte längre.', status=404)
+            moved_to = file_path
+
+            relative_path = f"{doc_type.target_directory}/{file_path.name}"
+            document = Document(
+                person=person,
+                document_type=doc_type,
+                filename=file_path.name,
+                relative_path=relative_path,
+                file_size=session.total_size,
+                file_type=file_path.suffix.lstrip('.').lower(),
+                content_hash=content_hash,
+            )
+            document.file.name = f"persons/{person.directory_name}/{relative_path}"
+
+            document.save()
+            session.delete()
+    except BaseException:
+        # Lämna ingen fil utan dokument i personens katalog; lägg tillbaka
+        # filen så att uppladdningen kan avslutas igen
+        if moved_to is not None:
+            try:
+                os.replace(moved_to, temp_path)
+            except OSError:
+                moved_to.unlink(missing_ok=True)
+        raise
+    return document
+
+
+def abort_session(session) -> None:
+    """Avbryt uppladdningen och ta bort den temporära filen"""
+    try:
+        os.unlink(staging_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
+
+
+def clear_stale(max_age: timedelta) -> int:
+    """
+    Ta bort uppladdningar som inte fått någon del på max_age, och filer i
+    uppladdningskatalogen som är äldre än så och inte hör till en uppladdning.
+
+    Returns:
+        Antal borttagna uppladdningar och filer
+    """
+    cutoff = timezone.now() - max_age
+    removed = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff):
+        abort_session(session)
+        removed += 1
+
+    active = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+    cutoff_timestamp = cutoff.timestamp()
+    with os.scandir(get_staging_dir()) as entries:
+        for entry in entries:
+            if entry.name in active or not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff_timestamp:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+    return removed
@@ -0,0 +1,161 @@
+"""
+Leverans av dokumentfiler med villkorlig GET, byte-intervall och X-Sendfile.
+
+- ETag och Last-Modified bygger på filens mtime och storlek (en stat), så
+  If-None-Match/If-Modified-Since ger 304 utan att filen öppnas.
+- Range: bytes=start-slut ger 206 med bara den begärda delen, så att
+  PDF-visare och återupptagna nedladdningar inte läser om hela filen.
+  If-Range respekteras; flera intervall i samma begäran ger hela filen.
+- Med settings.DOCUMENT_SENDFILE lämnas själva överföringen till
+  webbservern (X-Accel-Redirect för nginx, X-Sendfile för Apache/lighttpd),
+  som då även sköter Range.
+"""
+import mimetypes
+import os
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    """ETag från filens mtime och storlek"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Tolka ett Range-huvud med ett enda intervall.
+
+    Returns:
+        (start, slut) inklusive, None om huvudet saknas eller inte stöds
+        (hela filen skickas), eller False om intervallet ligger utanför filen
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if size == 0:
+        # En tom fil har inga byte att skicka för något intervall
+        return False
+
+    if not first:
+        # Suffix: de sista N byten
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, mtime):
+    """If-Range: skicka bara ett intervall om filen är oförändrad"""
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    parsed = parse_http_date_safe(value)
+    return parsed is not None and int(mtime) <= parsed
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(path, content_type):
+    """Låt webbservern skicka filen"""
+    mode = settings.DOCUMENT_SENDFILE.lower()
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        from core.utils import get_media_root
+
+        relative = Path(path).resolve().relative_to(Path(get_media_root()).resolve())
+        prefix = settings.DOCUMENT_SENDFILE_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(relative.as_posix())}'
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = os.fspath(path)
+    else:
+        raise ValueError(f'Okänt värde för DOCUMENT_SENDFILE: {settings.DOCUMENT_SENDFILE}')
+    return response
+
+
+def serve_file(request, path, filename, as_attachment=True):
+    """
+    Skicka en fil med stöd för villkorlig GET, Range och X-Sendfile.
+
+    Raises:
+        FileNotFoundError: Om filen inte finns
+    """
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = http_date(stat.st_mtime)
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if conditional is not None:
+        return finish(conditional)
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+
+    if settings.DOCUMENT_SENDFILE:
+        response = _sendfile_response(path, content_type)
+        response['Content-Disposition'] = disposition
+        return finish(response)
+
+    byte_range = None
+    if request.method == 'GET' and _if_range_matches(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return finish(response)
+
+    if byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_range(path, start, length), status=206, content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Disposition'] = disposition
+        return finish(response)
+
+    response = FileResponse(
+        open(path, 'rb'), as_attachment=as_attachment, filename=filename,
+        content_type=content_type
+    )
+    return finish(response)
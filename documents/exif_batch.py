@@ -0,0 +1,147 @@
+"""
+Samma EXIF-ändring i många bilder.
+
+Bilderna väljs som ett urval av dokument, en persons alla bilder eller alla
+bilder med en tagg (eller en kombination). ``start_batch`` sparar en
+ExifBatchJob och kör den i bakgrunden med core.background, så att vyn kan
+svara direkt och sidan hämtar förloppet från jobbet.
+
+Filerna skrivs om parallellt i en trådpool. rewrite_exif byter bara
+EXIF-segmentet, så arbetet är I/O och inte avkodning av bilder. Förloppet
+och fel per fil sparas på jobbet med jämna mellanrum, och dokumentens
+filstorlek, content_hash och exif skrivs med bulk_update.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Optional
+
+from django.utils import timezone
+
+from core.background import run_in_background
+from core.utils import get_media_root
+
+from .exif_utils import EXIF_WRITABLE_TYPES, extract_exif, rewrite_exif
+from .hashing import document_path, hash_file
+from .models import Document, ExifBatchJob
+from .tagging import filter_by_tag
+
+logger = logging.getLogger(__name__)
+
+# Fält som kan sättas för många bilder på en gång
+EDITABLE_FIELDS = [
+    'DateTime', 'DateTimeOriginal', 'Make', 'Model', 'Artist',
+    'Copyright', 'ImageDescription',
+]
+
+DEFAULT_WORKERS = 4
+BATCH_SIZE = 500
+
+# Förloppet sparas efter så här många filer
+PROGRESS_INTERVAL = 10
+
+
+def select_images(user, document_ids: Optional[Iterable[int]] = None, person=None, tag: str = ''):
+    """
+    Användarens bilder, begränsade till de angivna dokumenten, personen och taggen.
+
+    Bara JPEG- och PNG-bilder väljs, eftersom EXIF inte kan skrivas i andra
+    format utan att bilden kodas om (se rewrite_exif).
+
+    Returns:
+        Queryset med bilddokument
+    """
+    documents = Document.objects.filter(person__user=user, file_type__in=EXIF_WRITABLE_TYPES)
+    if document_ids is not None:
+        documents = documents.filter(pk__in=list(document_ids))
+    if person is not None:
+        documents = documents.filter(person=person)
+    if tag and tag.strip():
+        documents = filter_by_tag(documents, tag)
+    return documents
+
+
+def start_batch(user, documents, updates: Dict[str, str]) -> ExifBatchJob:
+    """
+    Skapa ett jobb för dokumenten och kör det i bakgrunden.
+
+    Args:
+        documents: Queryset från select_images
+        updates: EXIF-fält (EDITABLE_FIELDS) -> värde; tomma värden hoppas över
+    """
+    updates = {field: value for field, value in updates.items() if field in EDITABLE_FIELDS and value}
+    document_ids = list(documents.order_by('pk').values_list('pk', flat=True))
+    job = ExifBatchJob.objects.create(
+        user=user,
+        updates=updates,
+        document_ids=document_ids,
+        total=len(document_ids),
+    )
+    run_in_background(run_batch, job.pk)
+    return job
+
+
+def _rewrite(path, updates: Dict[str, str]):
+    """Skriv EXIF i en fil; körs i trådpoolen och rör inte databasen"""
+    rewrite_exif(path, updates)
+    return os.path.getsize(path), hash_file(path), extract_exif(path)
+
+
+def run_batch(job_id: int, workers: int = DEFAULT_WORKERS) -> ExifBatchJob:
+    """
+    Kör jobbet: skriv EXIF-fälten i alla bilderna och uppdatera dokumenten.
+
+    En fil som inte kan skrivas hindrar inte de andra; felet sparas i
+    job.errors. Jobbet får status FAILED bara om körningen som helhet avbryts.
+    """
+    job = ExifBatchJob.objects.get(pk=job_id)
+    documents = list(
+        Document.objects.filter(pk__in=job.document_ids, person__user=job.user)
+        .select_related('person')
+    )
+    job.status = ExifBatchJob.Status.RUNNING
+    job.total = len(documents)
+    job.save(update_fields=['status', 'total'])
+
+    media_root = get_media_root()
+    changed = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_rewrite, document_path(doc, media_root), job.updates): doc
+                for doc in documents
+            }
+            for processed, future in enumerate(as_completed(futures), 1):
+                doc = futures[future]
+                try:
+                    doc.file_size, doc.content_hash, doc.exif = future.result()
+                except Exception as e:
+                    job.errors.append({'document': doc.pk, 'filename': doc.filename, 'error': str(e)})
+                else:
+                    doc.updated_at = timezone.now()
+                    changed.append(doc)
+
+                if len(changed) >= BATCH_SIZE:
+                    _save_documents(changed)
+                    changed = []
+                if processed % PROGRESS_INTERVAL == 0 or processed == len(futures):
+                    job.processed = processed
+                    job.failed = len(job.errors)
+                    job.save(update_fields=['processed', 'failed', 'errors'])
+
+        _save_documents(changed)
+        job.status = ExifBatchJob.Status.DONE
+    except Exception:
+        logger.exception(f"EXIF-ändringen {job.pk} avbröts")
+        _save_documents(changed)
+        job.status = ExifBatchJob.Status.FAILED
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    return job
+
+
+def _save_documents(documents) -> None:
+    Document.objects.bulk_update(
+        documents, ['file_size', 'content_hash', 'exif', 'updated_at'], batch_size=BATCH_SIZE
+    )
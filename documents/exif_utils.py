@@ -1,8 +1,52 @@
-"""EXIF-hantering för bilder"""
+"""
+EXIF-hantering för bilder.
+
+EXIF-fälten som visas och redigeras extraheras en gång (vid uppladdning,
+synkning och redigering) och sparas i Document.exif, så att vyerna inte
+behöver öppna bildfilerna. ``update_exif`` fyller i fälten för många
+bilder i en processpool (manage.py extract_exif).
+
+``rewrite_exif`` byter bara ut EXIF-segmentet i JPEG- och PNG-filer och
+kopierar resten av filen som den är, så bilden kodas aldrig om. Andra
+format skrivs inte alls, eftersom Pillow då skulle koda om bilden och
+bara spara första sidan eller bildrutan.
+
+Modulen importerar inte Django-modeller på toppnivå, så att
+processpoolens arbetsprocesser bara behöver Pillow.
+"""
+import errno
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from PIL import Image
-from PIL.ExifTags import TAGS
+from PIL.ExifTags import IFD, TAGS
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
+
+from core.utils import IMAGE_TYPES
+
+# Textfält som sparas i Document.exif (utöver Width, Height och Orientation)
+STORED_FIELDS = [
+    'DateTime', 'DateTimeOriginal', 'Make', 'Model', 'Artist',
+    'Copyright', 'ImageDescription', 'Software',
+]
+
+ORIENTATION_TAG = 0x0112
+
+JPEG_SOI = b'\xff\xd8'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_HEADER = b'Exif\x00\x00'
+COPY_SIZE = 1024 * 1024
+
+# Filtyper där EXIF kan skrivas utan att bilden kodas om
+EXIF_WRITABLE_TYPES = ['jpg', 'jpeg', 'png']
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+BATCH_SIZE = 500
 
 
 def read_exif_data(image_path: Path) -> Dict[str, str]:
@@ -63,7 +107,7 @@ def get_common_exif_fields(exif_data: Dict[str, str]) -> Dict[str, str]:
 
 def write_exif_data(image_path: Path, exif_updates: Dict[str, str]) -> bool:
     """
-    Skriv/uppdatera EXIF-data i en bild.
+    Skriv/uppdatera EXIF-data i en bild (se rewrite_exif).
 
     Args:
         image_path: Sökväg till bilden
@@ -73,25 +117,332 @@ def write_exif_data(image_path: Path, exif_updates: Dict[str, str]) -> bool:
         True om lyckad, False annars
     """
     try:
-        image = Image.open(image_path)
-
-        # Hämta befintlig EXIF-data
-        exifdata = image.getexif()
-
-        # Omvänd mappning: tagnamn -> tag_id
-        tag_to_id = {v: k for k, v in TAGS.items()}
-
-        # Uppdatera EXIF-data
-        for tag_name, value in exif_updates.items():
-            if value:  # Endast uppdatera om värdet inte är tomt
-                tag_id = tag_to_id.get(tag_name)
-                if tag_id:
-                    exifdata[tag_id] = value
-
-        # Spara bilden med uppdaterad EXIF
-        image.save(image_path, exif=exifdata)
+        rewrite_exif(image_path, exif_updates)
         return True
 
     except Exception as e:
         print(f"Fel vid skrivning av EXIF: {e}")
         return False
+
+
+def rewrite_exif(image_path, exif_updates: Dict[str, str]) -> None:
+    """
+    Uppdatera EXIF-fälten i IFD0 och ersätt filen.
+
+    Bara JPEG och PNG stöds, och de skrivs om utan att bilden kodas om:
+    bara EXIF-segmentet (APP1 respektive eXIf-chunken) byts ut och resten
+    av filen kopieras oförändrad. Filen ersätts atomärt med en ny fil, så
+    andra hårda länkar till den gamla filen påverkas inte.
+
+    Raises:
+        OSError, ValueError: Om filen inte kunde läsas eller skrivas, eller
+            är i ett annat format än JPEG eller PNG
+    """
+    with open(image_path, 'rb') as f:
+        signature = f.read(len(PNG_SIGNATURE))
+    if signature.startswith(JPEG_SOI):
+        _write_jpeg_exif(image_path, exif_updates)
+    elif signature == PNG_SIGNATURE:
+        _write_png_exif(image_path, exif_updates)
+    else:
+        # Pillow skulle koda om bilden och tappa sidor och bildrutor
+        raise ValueError('EXIF kan bara skrivas i JPEG- och PNG-filer')
+
+
+def _apply_updates(exifdata: Image.Exif, exif_updates: Dict[str, str]) -> None:
+    """Sätt fälten i IFD0; tomma värden och okända tagnamn hoppas över"""
+    # Omvänd mappning: tagnamn -> tag_id
+    tag_to_id = {v: k for k, v in TAGS.items()}
+
+    for tag_name, value in exif_updates.items():
+        if value:  # Endast uppdatera om värdet inte är tomt
+            tag_id = tag_to_id.get(tag_name)
+            if tag_id:
+                # Pillow skriver annars å, ä och ö som '?'
+                if isinstance(value, str) and not value.isascii():
+                    value = value.encode('utf-8')
+                exifdata[tag_id] = value
+
+
+def _updated_exif(data: Optional[bytes], exif_updates: Dict[str, str]) -> bytes:
+    """Befintlig EXIF (TIFF-data, med eller utan Exif-prefix) med uppdateringarna"""
+    exifdata = Image.Exif()
+    if data:
+        exifdata.load(data)
+        # Textfält lästa som Latin-1 skrivs tillbaka med sina ursprungliga byte
+        for ifd in (exifdata, exifdata.get_ifd(IFD.Exif)):
+            for tag_id, value in list(ifd.items()):
+                if isinstance(value, str) and not value.isascii():
+                    ifd[tag_id] = value.encode('latin-1', errors='replace')
+    _apply_updates(exifdata, exif_updates)
+    return exifdata.tobytes()
+
+
+def _jpeg_segments(f):
+    """
+    Läs JPEG-segmenten fram till bilddatan (SOS).
+
+    Returns:
+        Tuple (lista med (marker, offset, längd inkl. markören), offset för SOS)
+    """
+    segments = []
+    offset = len(JPEG_SOI)
+    f.seek(offset)
+    while True:
+        header = f.read(2)
+        if len(header) < 2 or header[0] != 0xFF:
+            raise ValueError('Ogiltig JPEG-fil')
+        marker = header[1]
+        if marker == 0xFF:
+            # Utfyllnadsbyte före markören
+            offset += 1
+            f.seek(offset)
+            continue
+        if marker in (0xDA, 0xD9):
+            return segments, offset
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            segments.append((marker, offset, 2))
+            offset += 2
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        segments.append((marker, offset, 2 + length))
+        offset += 2 + length
+        f.seek(offset)
+
+
+def _write_jpeg_exif(image_path, exif_updates: Dict[str, str]) -> None:
+    with open(image_path, 'rb') as f:
+        segments, image_offset = _jpeg_segments(f)
+
+        exif_segment = None
+        for marker, offset, length in segments:
+            if marker == 0xE1:
+                f.seek(offset + 4)
+                if f.read(len(EXIF_HEADER)) == EXIF_HEADER:
+                    exif_segment = (offset, length)
+                    break
+
+        existing = None
+        if exif_segment:
+            f.seek(exif_segment[0] + 4)
+            existing = f.read(exif_segment[1] - 4)
+        data = _updated_exif(existing, exif_updates)
+        if len(data) + 2 > 0xFFFF:
+            raise ValueError('EXIF-datan är för stor för ett JPEG-segment')
+        app1 = b'\xff\xe1' + struct.pack('>H', len(data) + 2) + data
+
+        # Nytt segment efter JFIF-huvudet (APP0), annars direkt efter SOI
+        insert_at = len(JPEG_SOI)
+        for marker, offset, length in segments:
+            if marker != 0xE0:
+                break
+            insert_at = offset + length
+
+        if exif_segment:
+            start, length = exif_segment
+            parts = [(0, start), app1, (start + length, None)]
+        else:
+            parts = [(0, insert_at), app1, (insert_at, None)]
+        _write_parts(image_path, f, parts)
+
+
+def _write_png_exif(image_path, exif_updates: Dict[str, str]) -> None:
+    with open(image_path, 'rb') as f:
+        # Gå igenom chunkarnas huvuden; själva datan läses inte
+        chunks = []
+        offset = len(PNG_SIGNATURE)
+        while True:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+            chunks.append((chunk_type, offset, 12 + length))
+            offset += 12 + length
+            if chunk_type == b'IEND':
+                break
+
+        existing = None
+        idat_offset = None
+        for chunk_type, offset, length in chunks:
+            if chunk_type == b'eXIf' and existing is None:
+                f.seek(offset + 8)
+                existing = f.read(length - 12)
+            elif chunk_type == b'IDAT' and idat_offset is None:
+                idat_offset = offset
+        if idat_offset is None:
+            raise ValueError('Ogiltig PNG-fil')
+
+        # eXIf-chunken innehåller TIFF-datan utan Exif-prefixet
+        data = _updated_exif(existing, exif_updates)[len(EXIF_HEADER):]
+        body = b'eXIf' + data
+        exif_chunk = struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+
+        # Den nya chunken läggs före första IDAT; gamla eXIf-chunkar tas bort
+        parts = []
+        position = 0
+        for chunk_type, offset, length in chunks:
+            if offset == idat_offset:
+                parts += [(position, offset), exif_chunk]
+                position = offset
+            elif chunk_type == b'eXIf':
+                parts.append((position, offset))
+                position = offset + length
+        parts.append((position, None))
+        _write_parts(image_path, f, parts)
+
+
+@contextmanager
+def _replacing(image_path):
+    """
+    Ge en temporär fil bredvid image_path att skriva till; ersätt image_path
+    med den om blocket lyckas, ta annars bort den.
+    """
+    image_path = os.fspath(image_path)
+    directory, name = os.path.split(image_path)
+    fd, temp_path = tempfile.mkstemp(dir=directory or '.', prefix=f'.{name}.')
+    os.close(fd)
+    try:
+        yield temp_path
+        shutil.copystat(image_path, temp_path)
+        os.replace(temp_path, image_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _write_parts(image_path, source, parts) -> None:
+    """
+    Skriv en ny fil av delar och ersätt image_path med den.
+
+    Delar är antingen bytes eller (start, slut) i source, där slut None
+    betyder filens slut. Intervallen kopieras i kärnan när det går.
+    """
+    size = os.fstat(source.fileno()).st_size
+    with _replacing(image_path) as temp_path, \
+            open(temp_path, 'wb', buffering=0) as destination:
+        for part in parts:
+            if isinstance(part, bytes):
+                view = memoryview(part)
+                while view:
+                    view = view[destination.write(view):]
+                continue
+            start, end = part
+            end = size if end is None else end
+            if end > start:
+                _copy_range(source, destination, start, end - start)
+
+
+def _copy_range(source, destination, offset: int, length: int) -> None:
+    """Kopiera length byte från offset i source till destinationens position"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while length:
+                copied = os.copy_file_range(source.fileno(), destination.fileno(), length, offset)
+                if copied == 0:
+                    raise ValueError('Filen tog slut under kopieringen')
+                offset += copied
+                length -= copied
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    source.seek(offset)
+    while length:
+        chunk = source.read(min(COPY_SIZE, length))
+        if not chunk:
+            raise ValueError('Filen tog slut under kopieringen')
+        destination.write(chunk)
+        length -= len(chunk)
+
+
+def _to_text(value) -> str:
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='ignore')
+    elif isinstance(value, str) and not value.isascii():
+        # Pillow läser textfält som Latin-1; write_exif_data skriver UTF-8
+        try:
+            value = value.encode('latin-1').decode('utf-8')
+        except UnicodeError:
+            pass
+    return str(value).strip('\x00 ')
+
+
+def extract_exif(image_path) -> Optional[Dict]:
+    """
+    Extrahera de fält som sparas i Document.exif.
+
+    Fält i IFD0 (där write_exif_data skriver) går före samma fält i
+    Exif-IFD:n. Bara filhuvudet läses, inte bilddatan.
+
+    Returns:
+        Dict med STORED_FIELDS som finns samt Width, Height och Orientation,
+        eller None om filen inte kunde läsas som en bild
+    """
+    try:
+        with Image.open(image_path) as image:
+            exifdata = image.getexif()
+            values = {}
+            for tag_id, value in exifdata.get_ifd(IFD.Exif).items():
+                values[TAGS.get(tag_id, tag_id)] = value
+            for tag_id, value in exifdata.items():
+                values[TAGS.get(tag_id, tag_id)] = value
+
+            result = {
+                field: _to_text(values[field])
+                for field in STORED_FIELDS
+                if field in values and _to_text(values[field])
+            }
+            result['Width'], result['Height'] = image.size
+            orientation = exifdata.get(ORIENTATION_TAG)
+            if isinstance(orientation, int):
+                result['Orientation'] = orientation
+            return result
+    except Exception:
+        return None
+
+
+def extract_exif_many(paths: Iterable, workers: int = DEFAULT_WORKERS) -> Dict[str, Optional[Dict]]:
+    """
+    Extrahera EXIF för många bilder, parallellt i en processpool.
+
+    Returns:
+        Dict sökväg -> resultat från extract_exif
+    """
+    paths = [os.fspath(path) for path in paths]
+    if workers <= 1 or len(paths) <= 1:
+        return {path: extract_exif(path) for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(extract_exif, paths, chunksize=16)))
+
+
+def update_exif(documents, workers: int = DEFAULT_WORKERS) -> int:
+    """
+    Extrahera och spara Document.exif för bilderna bland dokumenten.
+
+    Args:
+        documents: Dokument (queryset eller lista) - personen bör vara hämtad
+                   med select_related för att undvika en fråga per dokument
+
+    Returns:
+        Antal dokument som uppdaterades
+    """
+    from core.utils import get_media_root
+    from .hashing import document_path
+    from .models import Document
+
+    documents = [doc for doc in documents if doc.file_type in IMAGE_TYPES]
+    media_root = get_media_root()
+    paths = {doc.pk: os.fspath(document_path(doc, media_root)) for doc in documents}
+    results = extract_exif_many(paths.values(), workers)
+
+    changed = []
+    for doc in documents:
+        exif = results.get(paths[doc.pk])
+        if exif is not None and exif != doc.exif:
+            doc.exif = exif
+            changed.append(doc)
+    Document.objects.bulk_update(changed, ['exif'], batch_size=BATCH_SIZE)
+    return len(changed)
@@ -130,3 +130,100 @@ class DocumentViewForm(forms.ModelForm):
             'filename': forms.TextInput(attrs={'class': 'form-control'}),
             'tags': forms.TextInput(attrs={'class': 'form-control'}),
         }
+
+
+class ExifBatchForm(forms.Form):
+    """Samma EXIF-fält för många bilder (se documents/exif_batch.py)"""
+    # Formulärfält -> EXIF-tagg
+    EXIF_FIELDS = {
+        'exif_artist': 'Artist',
+        'exif_copyright': 'Copyright',
+        'exif_description': 'ImageDescription',
+        'exif_datetime': 'DateTime',
+        'exif_datetime_original': 'DateTimeOriginal',
+        'exif_make': 'Make',
+        'exif_model': 'Model',
+    }
+
+    documents = forms.CharField(required=False, widget=forms.HiddenInput())
+    person = forms.ModelChoiceField(
+        queryset=Person.objects.none(),
+        required=False,
+        label='Person',
+        empty_label='Alla personer',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    tag = forms.CharField(
+        required=False,
+        label='Tagg',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+        help_text='Bara bilder med den här taggen'
+    )
+
+    exif_artist = forms.CharField(
+        required=False,
+        label='Fotograf',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+    exif_copyright = forms.CharField(
+        required=False,
+        label='Copyright',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+    exif_description = forms.CharField(
+        required=False,
+        label='Bildbeskrivning',
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+    )
+    exif_datetime = forms.CharField(
+        required=False,
+        label='Datum/Tid',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'YYYY:MM:DD HH:MM:SS'}),
+    )
+    exif_datetime_original = forms.CharField(
+        required=False,
+        label='Originaldatum',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'YYYY:MM:DD HH:MM:SS'}),
+    )
+    exif_make = forms.CharField(
+        required=False,
+        label='Kameratillverkare',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+    exif_model = forms.CharField(
+        required=False,
+        label='Kameramodell',
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['person'].queryset = Person.objects.filter(user=user)
+
+    def clean_documents(self):
+        """Kommaseparerade dokument-id:n, eller None om inga valts"""
+        value = self.cleaned_data.get('documents', '').strip()
+        if not value:
+            return None
+        try:
+            return [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise forms.ValidationError('Ogiltigt urval av bilder.')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.get_exif_updates():
+            raise forms.ValidationError('Fyll i minst ett EXIF-fält.')
+        if (cleaned_data.get('documents') is None and not cleaned_data.get('person')
+                and not cleaned_data.get('tag', '').strip()):
+            raise forms.ValidationError('Välj bilder, en person eller en tagg.')
+        return cleaned_data
+
+    def get_exif_updates(self):
+        """EXIF-tagg -> värde för de ifyllda fälten"""
+        return {
+            tag: self.cleaned_data[field].strip()
+            for field, tag in self.EXIF_FIELDS.items()
+            if self.cleaned_data.get(field, '').strip()
+        }
@@ -0,0 +1,223 @@
+"""
+SHA-256-hashning av dokumentfiler och deduplicering med hårda länkar.
+
+Filerna läses i block så att även stora skanningar hashas med konstant
+minnesanvändning. hashlib släpper GIL under hashningen, så många filer kan
+hashas parallellt i en trådpool (``hash_files``).
+
+Dubbletter (samma innehåll under flera personers kataloger) kan ersättas
+med hårda länkar till en och samma fil (``hardlink_duplicates``). Varje
+persons katalogstruktur är oförändrad, men innehållet lagras bara en gång.
+Kod som skriver om en fil på plats måste därför först anropa
+``break_hardlink`` så att ändringen inte slår igenom i de andra kopiorna.
+"""
+import filecmp
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Count
+
+from core.utils import get_media_root
+
+from .models import Document
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 4
+BATCH_SIZE = 500
+
+
+def hash_file(path) -> str:
+    """Beräkna SHA-256 för en fil, läst i block"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_chunks(chunks: Iterable[bytes], path) -> Tuple[int, str]:
+    """
+    Skriv uppladdade block till path och hasha dem i samma svep.
+
+    Returns:
+        Tuple (antal bytes, SHA-256)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+def hash_files(paths: Iterable, workers: int = DEFAULT_WORKERS) -> Dict[str, Optional[str]]:
+    """
+    Hasha många filer parallellt.
+
+    Returns:
+        Dict sökväg -> SHA-256, eller None för filer som inte kunde läsas
+    """
+    def safe_hash(path):
+        try:
+            return hash_file(path)
+        except OSError:
+            return None
+
+    paths = [os.fspath(path) for path in paths]
+    if workers <= 1 or len(paths) <= 1:
+        return {path: safe_hash(path) for path in paths}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(safe_hash, paths)))
+
+
+def document_path(document, media_root=None) -> Path:
+    """Absolut sökväg till dokumentets fil (skicka med media_root i loopar)"""
+    if media_root is None:
+        media_root = get_media_root()
+    return Path(media_root) / 'persons' / document.person.directory_name / document.relative_path
+
+
+def update_hashes(documents, workers: int = DEFAULT_WORKERS) -> int:
+    """
+    Beräkna och spara content_hash för dokumenten.
+
+    Args:
+        documents: Dokument (queryset eller lista) - personen bör vara hämtad
+                   med select_related för att undvika en fråga per dokument
+
+    Returns:
+        Antal dokument som fick en hash
+    """
+    documents = list(documents)
+    media_root = get_media_root()
+    paths = {doc.pk: os.fspath(document_path(doc, media_root)) for doc in documents}
+    hashes = hash_files(paths.values(), workers)
+
+    changed = []
+    for doc in documents:
+        content_hash = hashes.get(paths[doc.pk])
+        if content_hash and content_hash != doc.content_hash:
+            doc.content_hash = content_hash
+            changed.append(doc)
+    Document.objects.bulk_update(changed, ['content_hash'], batch_size=BATCH_SIZE)
+    return len(changed)
+
+
+def find_duplicates(documents=None) -> List[Dict]:
+    """
+    Hitta dokument med samma innehåll.
+
+    Returns:
+        Lista med grupper {'content_hash', 'file_size', 'documents',
+        'reclaimable'} sorterad på mest återvinningsbart utrymme först.
+        reclaimable räknar inte filer som redan är hårda länkar till samma fil.
+    """
+    if documents is None:
+        documents = Document.objects.all()
+    documents = documents.exclude(content_hash='')
+
+    duplicate_hashes = documents.values('content_hash').annotate(
+        count=Count('id')
+    ).filter(count__gt=1).values_list('content_hash', flat=True)
+
+    groups = {}
+    for doc in documents.filter(content_hash__in=duplicate_hashes).select_related(
+        'person'
+    ).order_by('content_hash', 'created_at', 'id'):
+        groups.setdefault(doc.content_hash, []).append(doc)
+
+    media_root = get_media_root()
+    result = []
+    for content_hash, docs in groups.items():
+        inodes = set()
+        for doc in docs:
+            try:
+                stat = os.stat(document_path(doc, media_root))
+            except OSError:
+                continue
+            inodes.add((stat.st_dev, stat.st_ino))
+        result.append({
+            'content_hash': content_hash,
+            'file_size': docs[0].file_size,
+            'documents': docs,
+            'reclaimable': docs[0].file_size * max(len(inodes) - 1, 0),
+        })
+    result.sort(key=lambda group: group['reclaimable'], reverse=True)
+    return result
+
+
+def hardlink_duplicates(group, dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Ersätt kopiorna i en dubblettgrupp med hårda länkar till den äldsta filen.
+
+    Varje kopia jämförs byte för byte med originalet innan den ersätts, och
+    ersätts atomärt (länk till temporärt namn + os.replace). Filer på andra
+    filsystem än originalet lämnas orörda.
+
+    Returns:
+        Tuple (antal länkade filer, frigjorda bytes)
+    """
+    media_root = get_media_root()
+    original = document_path(group['documents'][0], media_root)
+    original_stat = os.stat(original)
+
+    linked = 0
+    reclaimed = 0
+    for doc in group['documents'][1:]:
+        path = document_path(doc, media_root)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stat.st_dev != original_stat.st_dev or stat.st_ino == original_stat.st_ino:
+            continue
+        if not filecmp.cmp(original, path, shallow=False):
+            continue
+
+        if not dry_run:
+            temp_path = path.with_name(f'.{path.name}.link-{os.getpid()}')
+            os.link(original, temp_path)
+            try:
+                os.replace(temp_path, path)
+            except OSError:
+                os.unlink(temp_path)
+                raise
+        linked += 1
+        # Utrymmet frigörs först när sista länken till den gamla filen försvinner
+        if stat.st_nlink == 1:
+            reclaimed += stat.st_size
+    return linked, reclaimed
+
+
+def break_hardlink(path) -> None:
+    """
+    Ge filen en egen kopia om den delas med andra (hård länk), så att den kan
+    skrivas om på plats utan att de andra dokumenten ändras.
+    """
+    path = Path(path)
+    try:
+        if os.stat(path).st_nlink <= 1:
+            return
+    except FileNotFoundError:
+        return
+
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as destination, open(path, 'rb') as source:
+            shutil.copyfileobj(source, destination, CHUNK_SIZE)
+        shutil.copystat(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
@@ -0,0 +1,24 @@
+"""Management command för att städa bort avbrutna uppladdningar"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from documents.chunked import clear_stale
+
+
+class Command(BaseCommand):
+    help = 'Tar bort avbrutna uppladdningar i delar och gamla filer i uppladdningskatalogen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Ta bort uppladdningar som inte fått någon del på så många timmar (default: 24)'
+        )
+
+    def handle(self, *args, **options):
+        removed = clear_stale(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {removed} uppladdningar och filer togs bort.'
+        ))
@@ -0,0 +1,92 @@
+"""Management command för att rapportera och deduplicera dokumentfiler"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.views import format_file_size as format_size
+from documents.hashing import find_duplicates, hardlink_duplicates
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        'Visar dokument med samma innehåll (samma content_hash). Med --hardlink '
+        'ersätts kopiorna med hårda länkar så att innehållet bara lagras en gång, '
+        'medan varje persons katalogstruktur behålls.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Sök endast bland dokument för angivet användarnamn'
+        )
+        parser.add_argument(
+            '--hardlink',
+            action='store_true',
+            help='Ersätt dubbletterna med hårda länkar till den äldsta kopian'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Visa vad --hardlink skulle göra utan att ändra några filer'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Antal dubblettgrupper som listas (default: 50, 0 = alla)'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.all()
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+            documents = documents.filter(person__user=user)
+
+        missing = documents.filter(content_hash='').count()
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'{missing} dokument saknar hash och kontrolleras inte - kör manage.py hash_documents först.'
+            ))
+
+        groups = find_duplicates(documents)
+        reclaimable = sum(group['reclaimable'] for group in groups)
+        self.stdout.write(
+            f'{len(groups)} grupper med dubbletter, '
+            f'{sum(len(group["documents"]) for group in groups)} dokument, '
+            f'{format_size(reclaimable)} kan frigöras.'
+        )
+
+        shown = groups if not options['limit'] else groups[:options['limit']]
+        for group in shown:
+            self.stdout.write(
+                f'\n{group["content_hash"][:12]}  {format_size(group["file_size"])}  '
+                f'({len(group["documents"])} kopior, {format_size(group["reclaimable"])} att frigöra)'
+            )
+            for doc in group['documents']:
+                self.stdout.write(f'  {doc.person.directory_name}/{doc.relative_path}')
+
+        if not options['hardlink']:
+            return
+
+        linked = reclaimed = 0
+        for group in groups:
+            if not group['reclaimable']:
+                continue
+            try:
+                group_linked, group_reclaimed = hardlink_duplicates(
+                    group, dry_run=options['dry_run']
+                )
+            except OSError as e:
+                self.stderr.write(f'Fel för {group["content_hash"][:12]}: {e}')
+                continue
+            linked += group_linked
+            reclaimed += group_reclaimed
+
+        prefix = 'Torrkörning: ' if options['dry_run'] else 'Klart! '
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{prefix}{linked} filer ersatta med hårda länkar, {format_size(reclaimed)} frigjort.'
+        ))
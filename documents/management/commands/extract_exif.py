@@ -0,0 +1,57 @@
+"""Management command för att extrahera och spara EXIF-data för bilder"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils import IMAGE_TYPES
+from documents.exif_utils import BATCH_SIZE, DEFAULT_WORKERS, update_exif
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Extraherar EXIF-data för bilder som saknar den och sparar den på dokumentet, parallellt i en processpool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Extrahera endast för bilder som tillhör angivet användarnamn'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Extrahera om alla bilder, även de som redan har EXIF-data sparad'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'Antal processer (default: antal processorkärnor, {DEFAULT_WORKERS})'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(
+            file_type__in=IMAGE_TYPES
+        ).select_related('person').order_by('id')
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+            documents = documents.filter(person__user=user)
+        if not options['all']:
+            documents = documents.filter(exif__isnull=True)
+
+        ids = list(documents.values_list('id', flat=True))
+        self.stdout.write(f'Extraherar EXIF för {len(ids)} bilder med {options["workers"]} processer...')
+
+        updated = 0
+        for start in range(0, len(ids), BATCH_SIZE):
+            updated += update_exif(
+                documents.filter(id__in=ids[start:start + BATCH_SIZE]),
+                workers=options['workers']
+            )
+            self.stdout.write(f'  {min(start + BATCH_SIZE, len(ids))}/{len(ids)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {updated} bilder fick sin EXIF-data sparad.'
+        ))
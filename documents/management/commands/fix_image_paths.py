@@ -1,5 +1,6 @@
 """Management command för att fixa file.name för bilder"""
 from django.core.management.base import BaseCommand
+from core.utils import IMAGE_TYPES
 from documents.models import Document
 
 
@@ -9,7 +10,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         # Hitta alla bilder
         images = Document.objects.filter(
-            file_type__in=['jpg', 'jpeg', 'png', 'gif', 'bmp']
+            file_type__in=IMAGE_TYPES
         )
 
         total = images.count()
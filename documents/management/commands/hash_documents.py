@@ -0,0 +1,56 @@
+"""Management command för att beräkna innehållshash för dokument"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.hashing import DEFAULT_WORKERS, update_hashes
+from documents.models import Document
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Beräknar SHA-256 (content_hash) för dokument som saknar den, parallellt i en trådpool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Hasha endast dokument för angivet användarnamn'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Hasha om alla dokument, även de som redan har en hash'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'Antal filer som hashas parallellt (default: {DEFAULT_WORKERS})'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.select_related('person').order_by('id')
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+            documents = documents.filter(person__user=user)
+        if not options['all']:
+            documents = documents.filter(content_hash='')
+
+        ids = list(documents.values_list('id', flat=True))
+        self.stdout.write(f'Hashar {len(ids)} dokument med {options["workers"]} trådar...')
+
+        updated = 0
+        for start in range(0, len(ids), BATCH_SIZE):
+            updated += update_hashes(
+                documents.filter(id__in=ids[start:start + BATCH_SIZE]),
+                workers=options['workers']
+            )
+            self.stdout.write(f'  {min(start + BATCH_SIZE, len(ids))}/{len(ids)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {updated} dokument fick en ny hash.'
+        ))
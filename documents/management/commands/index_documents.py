@@ -0,0 +1,61 @@
+"""Management command för att bygga fulltextindexet över dokumentens text"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils import get_media_root
+from documents.models import Document, DocumentText
+from documents.search import PdfReader, fts_available, index_documents, indexable_types
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Extraherar texten ur txt/md-dokument (och PDF om pypdf är installerat) '
+        'och indexerar den för fulltextsökning. Oförändrade dokument hoppas över.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Indexera endast dokument för angivet användarnamn'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Extrahera om texten för alla dokument, även oförändrade'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(
+            file_type__in=indexable_types()
+        ).select_related('person').order_by('id')
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+            documents = documents.filter(person__user=user)
+
+        if options['all']:
+            DocumentText.objects.filter(document__in=documents).delete()
+        if PdfReader is None:
+            self.stdout.write('pypdf är inte installerat - PDF-filer indexeras inte.')
+        if not fts_available():
+            self.stdout.write('FTS5 saknas - sökningen använder icontains.')
+
+        ids = list(documents.values_list('id', flat=True))
+        self.stdout.write(f'Går igenom {len(ids)} dokument...')
+
+        media_root = get_media_root()
+        indexed = 0
+        for start in range(0, len(ids), BATCH_SIZE):
+            indexed += index_documents(
+                documents.filter(id__in=ids[start:start + BATCH_SIZE]), media_root
+            )
+            self.stdout.write(f'  {min(start + BATCH_SIZE, len(ids))}/{len(ids)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! Texten indexerades för {indexed} dokument.'
+        ))
@@ -0,0 +1,34 @@
+"""Management command för att bygga om de normaliserade dokumenttaggarna"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import Document
+from documents.tagging import rebuild_tags
+
+
+class Command(BaseCommand):
+    help = (
+        'Bygger om taggarna (Tag och DocumentTag) från den kommaseparerade texten i '
+        'Document.tags, t.ex. efter att tags ändrats direkt i databasen.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Bygg om endast taggarna för angivet användarnamn'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.all()
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+            documents = documents.filter(person__user=user)
+
+        links = rebuild_tags(documents)
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {links} taggar kopplades till dokumenten.'
+        ))
@@ -0,0 +1,121 @@
+"""Management command för att synkronisera dokument för hela arkivet"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from documents.sync import get_document_type_map, sync_person_incremental
+from persons.models import Person
+
+
+class Command(BaseCommand):
+    help = (
+        'Synkroniserar dokument från filsystemet för alla (eller valda) personer. '
+        'Kataloger som inte ändrats sedan förra körningen hoppas över.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Synka endast personer för angivet användarnamn'
+        )
+        parser.add_argument(
+            '--person',
+            type=int,
+            action='append',
+            dest='person_ids',
+            help='Synka endast personen med detta id (kan anges flera gånger)'
+        )
+        parser.add_argument(
+            '--directory',
+            type=str,
+            help='Synka endast personer vars katalognamn innehåller denna text'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Synka även kataloger som inte ändrats sedan förra körningen'
+        )
+        parser.add_argument(
+            '--fast',
+            action='store_true',
+            help='Jämför bara katalogernas ändringstid (läser inte filerna i oförändrade kataloger)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Antal personer som synkas parallellt (default: 4)'
+        )
+
+    def handle(self, *args, **options):
+        persons = Person.objects.all().order_by('id')
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+            persons = persons.filter(user=user)
+        if options['person_ids']:
+            persons = persons.filter(id__in=options['person_ids'])
+        if options['directory']:
+            persons = persons.filter(directory_name__icontains=options['directory'])
+        if options['workers'] < 1:
+            raise CommandError('--workers måste vara minst 1.')
+
+        persons = list(persons)
+        self.stdout.write(
+            f'Synkroniserar dokument för {len(persons)} personer '
+            f'med {options["workers"]} parallella arbetare...'
+        )
+
+        # Dokumenttyperna är gemensamma - hämta dem en gång
+        document_types = get_document_type_map()
+
+        # Katalogerna läses parallellt, men SQLite klarar bara en skrivare åt gången
+        write_lock = threading.Lock() if connection.vendor == 'sqlite' else None
+
+        def sync(person):
+            close_old_connections()
+            try:
+                return sync_person_incremental(
+                    person, document_types,
+                    force=options['force'], fast=options['fast'],
+                    write_lock=write_lock
+                )
+            finally:
+                close_old_connections()
+
+        totals = {'synced': 0, 'unchanged': 0, 'missing': 0, 'failed': 0}
+        added = updated = removed = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(sync, person): person for person in persons}
+            for future in as_completed(futures):
+                person = futures[future]
+                try:
+                    status, person_added, person_updated, person_removed = future.result()
+                except Exception as e:
+                    totals['failed'] += 1
+                    self.stderr.write(f'  Fel för {person.get_full_name()} ({person.directory_name}): {e}')
+                    continue
+
+                totals[status] += 1
+                added += person_added
+                updated += person_updated
+                removed += person_removed
+                if person_added or person_updated or person_removed:
+                    self.stdout.write(
+                        f'  {person.get_full_name()}: +{person_added} ~{person_updated} -{person_removed}'
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {added} dokument tillagda, {updated} uppdaterade, {removed} borttagna. '
+            f'{totals["synced"]} kataloger synkade, {totals["unchanged"]} oförändrade, '
+            f'{totals["missing"]} saknar katalog.'
+        ))
+        if totals['failed']:
+            self.stderr.write(self.style.ERROR(f'{totals["failed"]} personer misslyckades.'))
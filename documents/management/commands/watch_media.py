@@ -0,0 +1,125 @@
+"""Management command som bevakar mediakatalogen och synkar dokument löpande"""
+import os
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.utils import get_media_root
+from documents.sync import (
+    get_document_type_map, get_person_dir, sync_person_documents, sync_person_paths
+)
+from documents.watcher import (
+    Debouncer, InotifyWatcher, Overflow, PollingWatcher, inotify_available
+)
+from persons.models import Person
+
+
+class Command(BaseCommand):
+    help = (
+        'Bevakar media/persons och lägger till, uppdaterar och tar bort dokument '
+        'när filer ändras. Använder inotify på Linux, annars polling.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--polling',
+            action='store_true',
+            help='Använd polling även om inotify finns'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Sekunder mellan varven vid polling (default: 5)'
+        )
+        parser.add_argument(
+            '--debounce',
+            type=float,
+            default=2.0,
+            help='Sekunder en sökväg ska vara oförändrad innan den synkas (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        self.root = Path(get_media_root()) / 'persons'
+        if not self.root.is_dir():
+            raise CommandError(f'Katalogen {self.root} finns inte.')
+
+        if options['polling'] or not inotify_available():
+            watcher = PollingWatcher(self.root, interval=options['interval'])
+            backend = f'polling var {options["interval"]:g}:e sekund'
+        else:
+            watcher = InotifyWatcher(self.root)
+            backend = 'inotify'
+        debouncer = Debouncer(options['debounce'])
+
+        self.stdout.write(f'Bevakar {self.root} ({backend}). Avsluta med Ctrl+C.')
+        try:
+            while True:
+                try:
+                    paths = watcher.poll(debouncer.next_timeout(1.0))
+                except Overflow:
+                    self.stdout.write(self.style.WARNING(
+                        'För många händelser på en gång - synkar alla personer.'
+                    ))
+                    self.sync_all()
+                    continue
+
+                debouncer.add(paths)
+                ready = debouncer.ready()
+                if ready:
+                    self.sync_paths(ready)
+        except KeyboardInterrupt:
+            self.stdout.write('Avslutar bevakningen.')
+        finally:
+            watcher.close()
+
+    def sync_paths(self, paths):
+        """Synka ändrade sökvägar, grupperade per personkatalog"""
+        close_old_connections()
+        by_directory = defaultdict(set)
+        for path in paths:
+            parts = Path(os.path.relpath(path, self.root)).parts
+            if not parts or parts[0] in ('.', '..'):
+                continue
+            by_directory[parts[0]].add('/'.join(parts[1:]))
+
+        document_types = get_document_type_map()
+        for directory_name, rel_paths in by_directory.items():
+            for person in Person.objects.filter(directory_name=directory_name):
+                try:
+                    if '' in rel_paths:
+                        # Hela personkatalogen har skapats eller flyttats hit. En
+                        # borttagen katalog (t.ex. vid namnbyte) rensas inte.
+                        if not get_person_dir(person).is_dir():
+                            continue
+                        counts = sync_person_documents(person, document_types)
+                    else:
+                        counts = sync_person_paths(person, rel_paths, document_types)
+                except Exception as e:
+                    self.stderr.write(f'Fel för {person.get_full_name()} ({directory_name}): {e}')
+                    continue
+                self.report(person, counts)
+
+    def sync_all(self):
+        """Full synk av alla personer med katalog (efter missade händelser)"""
+        close_old_connections()
+        document_types = get_document_type_map()
+        for person in Person.objects.all():
+            try:
+                if not get_person_dir(person).is_dir():
+                    continue
+                counts = sync_person_documents(person, document_types)
+            except OSError as e:
+                # T.ex. en oläsbar katalog eller en katalog som just tagits bort
+                self.stderr.write(f'Fel för {person.get_full_name()} ({person.directory_name}): {e}')
+                continue
+            self.report(person, counts)
+
+    def report(self, person, counts):
+        added, updated, removed = counts
+        if added or updated or removed:
+            self.stdout.write(
+                f'{person.get_full_name()}: +{added} ~{updated} -{removed}'
+            )
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-19 03:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_remove_document_source_info'),
+        ('persons', '0013_checklistcompletiondaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tree_mtime_ns', models.BigIntegerField(default=0, help_text='Senaste ändringstiden bland personens katalog och underkataloger', verbose_name='Katalogernas ändringstid (ns)')),
+                ('manifest_hash', models.CharField(blank=True, help_text='SHA-256 över alla filers sökväg, storlek och ändringstid', max_length=64, verbose_name='Manifest')),
+                ('file_count', models.PositiveIntegerField(default=0, verbose_name='Antal filer')),
+                ('synced_at', models.DateTimeField(auto_now=True, verbose_name='Synkad')),
+                ('person', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='document_sync_state', to='persons.person', verbose_name='Person')),
+            ],
+            options={
+                'verbose_name': 'Synkstatus',
+                'verbose_name_plural': 'Synkstatus',
+            },
+        ),
+    ]
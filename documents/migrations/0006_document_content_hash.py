@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_documentsyncstate'),
+        ('persons', '0013_checklistcompletiondaily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 av filens innehåll, används för att hitta dubbletter', max_length=64, verbose_name='Innehållshash'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['content_hash'], name='documents_d_content_27a22c_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-19 03:17
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_document_content_hash'),
+        ('persons', '0013_checklistcompletiondaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Filnamn')),
+                ('total_size', models.BigIntegerField(verbose_name='Total storlek (bytes)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Skapad')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Uppdaterad')),
+                ('document_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='documents.documenttype', verbose_name='Dokumenttyp')),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='persons.person', verbose_name='Person')),
+            ],
+            options={
+                'verbose_name': 'Uppladdning',
+                'verbose_name_plural': 'Uppladdningar',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.BigIntegerField(verbose_name='Start')),
+                ('end', models.BigIntegerField(verbose_name='Slut')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='documents.uploadsession', verbose_name='Uppladdning')),
+            ],
+            options={
+                'verbose_name': 'Uppladdad del',
+                'verbose_name_plural': 'Uppladdade delar',
+                'ordering': ['start'],
+            },
+        ),
+    ]
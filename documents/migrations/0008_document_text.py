@@ -0,0 +1,91 @@
+# Generated by Django 6.0 on 2026-10-19 03:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE documents_documenttext_fts USING fts5(
+        content,
+        content='documents_documenttext',
+        content_rowid='document_id',
+        tokenize='unicode61 remove_diacritics 0'
+    )
+    """,
+    """
+    CREATE TRIGGER documents_documenttext_fts_insert
+    AFTER INSERT ON documents_documenttext BEGIN
+        INSERT INTO documents_documenttext_fts(rowid, content)
+        VALUES (new.document_id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER documents_documenttext_fts_delete
+    AFTER DELETE ON documents_documenttext BEGIN
+        INSERT INTO documents_documenttext_fts(documents_documenttext_fts, rowid, content)
+        VALUES ('delete', old.document_id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER documents_documenttext_fts_update
+    AFTER UPDATE ON documents_documenttext BEGIN
+        INSERT INTO documents_documenttext_fts(documents_documenttext_fts, rowid, content)
+        VALUES ('delete', old.document_id, old.content);
+        INSERT INTO documents_documenttext_fts(rowid, content)
+        VALUES (new.document_id, new.content);
+    END
+    """,
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS documents_documenttext_fts_insert',
+    'DROP TRIGGER IF EXISTS documents_documenttext_fts_delete',
+    'DROP TRIGGER IF EXISTS documents_documenttext_fts_update',
+    'DROP TABLE IF EXISTS documents_documenttext_fts',
+]
+
+
+def fts5_supported(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_fts(apps, schema_editor):
+    """FTS5-index över DocumentText (bara SQLite med FTS5, annars icontains)"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not fts5_supported(connection):
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='documents.document', verbose_name='Dokument')),
+                ('content', models.TextField(blank=True, verbose_name='Text')),
+                ('content_hash', models.CharField(blank=True, help_text='Dokumentets content_hash när texten extraherades', max_length=64, verbose_name='Innehållshash')),
+                ('indexed_at', models.DateTimeField(auto_now=True, verbose_name='Indexerad')),
+            ],
+            options={
+                'verbose_name': 'Dokumenttext',
+                'verbose_name_plural': 'Dokumenttexter',
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
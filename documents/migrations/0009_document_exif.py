@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='exif',
+            field=models.JSONField(blank=True, editable=False, help_text='EXIF-fält, bredd, höjd och orientering för bilder (se exif_utils). Tom om ännu inte extraherad', null=True, verbose_name='EXIF'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-19 03:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_exif'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExifBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updates', models.JSONField(default=dict, verbose_name='EXIF-fält')),
+                ('document_ids', models.JSONField(default=list, verbose_name='Dokument')),
+                ('status', models.CharField(choices=[('pending', 'Väntar'), ('running', 'Pågår'), ('done', 'Klar'), ('failed', 'Misslyckades')], default='pending', max_length=10, verbose_name='Status')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Antal bilder')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Behandlade')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Misslyckade')),
+                ('errors', models.JSONField(blank=True, default=list, help_text='En post per fil som inte kunde skrivas: document, filename, error', verbose_name='Fel')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Skapad')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Klar')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exif_batch_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Användare')),
+            ],
+            options={
+                'verbose_name': 'EXIF-ändring',
+                'verbose_name_plural': 'EXIF-ändringar',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
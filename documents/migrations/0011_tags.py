@@ -0,0 +1,122 @@
+# Generated by Django 6.0 on 2026-10-19 03:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+MAX_TAG_LENGTH = 100
+
+
+def tag_key(name):
+    """Skiftlägesokänslig nyckel för en tagg (som documents.tagging vid migreringen)"""
+    return name.strip().casefold()[:MAX_TAG_LENGTH]
+
+
+def parse_tags(text):
+    """Taggarna i en kommaseparerad text, utan tomma taggar och dubbletter"""
+    names = []
+    seen = set()
+    for name in (text or '').split(','):
+        name = name.strip()[:MAX_TAG_LENGTH]
+        key = tag_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            names.append(name)
+    return names
+
+
+def populate_tags(apps, schema_editor):
+    """Skapa Tag- och DocumentTag-rader från de kommaseparerade Document.tags"""
+    Document = apps.get_model('documents', 'Document')
+    Tag = apps.get_model('documents', 'Tag')
+    DocumentTag = apps.get_model('documents', 'DocumentTag')
+
+    documents = Document.objects.exclude(tags='').values_list(
+        'id', 'person_id', 'person__user_id', 'tags'
+    ).order_by('id')
+
+    # Första skrivsättet av varje tagg per användare blir taggens namn
+    names = {}
+    for _, _, user_id, text in documents.iterator(chunk_size=BATCH_SIZE):
+        for name in parse_tags(text):
+            names.setdefault((user_id, tag_key(name)), name)
+    Tag.objects.bulk_create(
+        [Tag(user_id=user_id, key=key, name=name) for (user_id, key), name in names.items()],
+        batch_size=BATCH_SIZE
+    )
+    tag_ids = {
+        (user_id, key): pk for pk, user_id, key in Tag.objects.values_list('id', 'user_id', 'key')
+    }
+
+    rows = []
+    for doc_id, person_id, user_id, text in documents.iterator(chunk_size=BATCH_SIZE):
+        rows.extend(
+            DocumentTag(document_id=doc_id, person_id=person_id, tag_id=tag_ids[(user_id, tag_key(name))])
+            for name in parse_tags(text)
+        )
+        if len(rows) >= BATCH_SIZE:
+            DocumentTag.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            rows = []
+    DocumentTag.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_exif_batch_jobs'),
+        ('persons', '0013_checklistcompletiondaily'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Namn')),
+                ('key', models.CharField(help_text='Namnet i gemener (casefold), används för uppslag', max_length=100, verbose_name='Nyckel')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to=settings.AUTH_USER_MODEL, verbose_name='Användare')),
+            ],
+            options={
+                'verbose_name': 'Tagg',
+                'verbose_name_plural': 'Taggar',
+                'ordering': ['key'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_tags', to='documents.document', verbose_name='Dokument')),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_tags', to='persons.person', verbose_name='Person')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_tags', to='documents.tag', verbose_name='Tagg')),
+            ],
+            options={
+                'verbose_name': 'Dokumenttagg',
+                'verbose_name_plural': 'Dokumenttaggar',
+            },
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='documents', through='documents.DocumentTag', to='documents.tag', verbose_name='Taggar (index)'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='unique_user_tag'),
+        ),
+        migrations.AddIndex(
+            model_name='documenttag',
+            index=models.Index(fields=['tag', 'document'], name='documents_d_tag_id_e118e1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documenttag',
+            index=models.Index(fields=['person', 'tag'], name='documents_d_person__db8c76_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='documenttag',
+            constraint=models.UniqueConstraint(fields=('document', 'tag'), name='unique_document_tag'),
+        ),
+        migrations.RunPython(populate_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 05:02
+
+from django.db import migrations
+
+GIN_INDEX = 'documents_documenttext_search'
+
+
+def create_gin_index(apps, schema_editor):
+    """GIN-index över texten (bara PostgreSQL - SQLite använder FTS5 från 0008)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Uttrycket måste vara identiskt med det i documents.search._search_postgres
+    schema_editor.execute(
+        f"CREATE INDEX {GIN_INDEX} ON documents_documenttext "
+        "USING gin (to_tsvector('simple', content))"
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
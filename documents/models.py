@@ -1,6 +1,8 @@
 import os
+import uuid
 from django.db import models
 from django.conf import settings
+from django.contrib.auth.models import User
 from persons.models import Person
 
 
@@ -60,9 +62,31 @@ class Document(models.Model):
         verbose_name="Taggar",
         help_text="Kommaseparerad lista"
     )
+    # Taggarna normaliserade för indexerade uppslag; hålls i synk med tags (se tagging.py)
+    tag_set = models.ManyToManyField(
+        'Tag',
+        through='DocumentTag',
+        related_name='documents',
+        blank=True,
+        verbose_name="Taggar (index)"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Skapad")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Uppdaterad")
     file_modified_at = models.DateTimeField(null=True, blank=True, verbose_name="Fil modifierad")
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name="Innehållshash",
+        help_text="SHA-256 av filens innehåll, används för att hitta dubbletter"
+    )
+    exif = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="EXIF",
+        help_text="EXIF-fält, bredd, höjd och orientering för bilder (se exif_utils). Tom om ännu inte extraherad"
+    )
 
     class Meta:
         verbose_name = "Dokument"
@@ -71,6 +95,7 @@ class Document(models.Model):
         indexes = [
             models.Index(fields=['person', 'document_type']),
             models.Index(fields=['file_type']),
+            models.Index(fields=['content_hash']),
         ]
 
     def __str__(self):
@@ -125,3 +150,242 @@ class Document(models.Model):
             return url
 
         return None
+
+
+class Tag(models.Model):
+    """
+    En användares tagg, delad mellan alla dokument med samma tagg oavsett
+    skiftläge. Skrivsättet i name är det som användes först.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='tags',
+        verbose_name="Användare"
+    )
+    name = models.CharField(max_length=100, verbose_name="Namn")
+    key = models.CharField(
+        max_length=100,
+        verbose_name="Nyckel",
+        help_text="Namnet i gemener (casefold), används för uppslag"
+    )
+
+    class Meta:
+        verbose_name = "Tagg"
+        verbose_name_plural = "Taggar"
+        ordering = ['key']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_tag'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class DocumentTag(models.Model):
+    """
+    Koppling dokument-tagg. Personen dupliceras från dokumentet så att en
+    persons taggar (med antal) kan hämtas med ett index utan join mot Document.
+    """
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='document_tags',
+        verbose_name="Dokument"
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='document_tags',
+        verbose_name="Tagg"
+    )
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='document_tags',
+        verbose_name="Person"
+    )
+
+    class Meta:
+        verbose_name = "Dokumenttagg"
+        verbose_name_plural = "Dokumenttaggar"
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'tag'], name='unique_document_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'document']),
+            models.Index(fields=['person', 'tag']),
+        ]
+
+    def __str__(self):
+        return f"{self.document.filename}: {self.tag.name}"
+
+
+class DocumentSyncState(models.Model):
+    """
+    Katalogens tillstånd vid senaste dokumentsynkningen för en person.
+    Används av manage.py sync_documents för att hoppa över oförändrade kataloger.
+    """
+    person = models.OneToOneField(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='document_sync_state',
+        verbose_name="Person"
+    )
+    tree_mtime_ns = models.BigIntegerField(
+        default=0,
+        verbose_name="Katalogernas ändringstid (ns)",
+        help_text="Senaste ändringstiden bland personens katalog och underkataloger"
+    )
+    manifest_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="Manifest",
+        help_text="SHA-256 över alla filers sökväg, storlek och ändringstid"
+    )
+    file_count = models.PositiveIntegerField(default=0, verbose_name="Antal filer")
+    synced_at = models.DateTimeField(auto_now=True, verbose_name="Synkad")
+
+    class Meta:
+        verbose_name = "Synkstatus"
+        verbose_name_plural = "Synkstatus"
+
+    def __str__(self):
+        return f"{self.person} ({self.file_count} filer)"
+
+
+class DocumentText(models.Model):
+    """
+    Extraherad text för fulltextsökning (se documents/search.py).
+    På SQLite speglas tabellen i en FTS5-tabell via triggers.
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='text',
+        verbose_name="Dokument"
+    )
+    content = models.TextField(blank=True, verbose_name="Text")
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="Innehållshash",
+        help_text="Dokumentets content_hash när texten extraherades"
+    )
+    indexed_at = models.DateTimeField(auto_now=True, verbose_name="Indexerad")
+
+    class Meta:
+        verbose_name = "Dokumenttext"
+        verbose_name_plural = "Dokumenttexter"
+
+    def __str__(self):
+        return str(self.document)
+
+
+class UploadSession(models.Model):
+    """
+    Pågående uppladdning i delar (se documents/chunked.py).
+    Delarna skrivs direkt till en fil i mediarotens uppladdningskatalog och
+    dokumentet skapas först när alla byte tagits emot.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+        verbose_name="Person"
+    )
+    document_type = models.ForeignKey(
+        DocumentType,
+        on_delete=models.CASCADE,
+        verbose_name="Dokumenttyp"
+    )
+    filename = models.CharField(max_length=255, verbose_name="Filnamn")
+    total_size = models.BigIntegerField(verbose_name="Total storlek (bytes)")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Skapad")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Uppdaterad")
+
+    class Meta:
+        verbose_name = "Uppladdning"
+        verbose_name_plural = "Uppladdningar"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.person})"
+
+
+class UploadChunk(models.Model):
+    """
+    En mottagen del [start, end) av en uppladdning. En rad per del gör att
+    delar kan tas emot parallellt utan att samma rad skrivs om.
+    """
+    session = models.ForeignKey(
+        UploadSession,
+        on_delete=models.CASCADE,
+        related_name='chunks',
+        verbose_name="Uppladdning"
+    )
+    start = models.BigIntegerField(verbose_name="Start")
+    end = models.BigIntegerField(verbose_name="Slut")
+
+    class Meta:
+        verbose_name = "Uppladdad del"
+        verbose_name_plural = "Uppladdade delar"
+        ordering = ['start']
+
+
+class ExifBatchJob(models.Model):
+    """
+    Samma EXIF-ändring i många bilder, körd i bakgrunden (se
+    documents/exif_batch.py). Raden visar förloppet och vilka filer som
+    inte kunde skrivas.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Väntar'
+        RUNNING = 'running', 'Pågår'
+        DONE = 'done', 'Klar'
+        FAILED = 'failed', 'Misslyckades'
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='exif_batch_jobs',
+        verbose_name="Användare"
+    )
+    updates = models.JSONField(default=dict, verbose_name="EXIF-fält")
+    document_ids = models.JSONField(default=list, verbose_name="Dokument")
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name="Status"
+    )
+    total = models.PositiveIntegerField(default=0, verbose_name="Antal bilder")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Behandlade")
+    failed = models.PositiveIntegerField(default=0, verbose_name="Misslyckade")
+    errors = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Fel",
+        help_text="En post per fil som inte kunde skrivas: document, filename, error"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Skapad")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Klar")
+
+    class Meta:
+        verbose_name = "EXIF-ändring"
+        verbose_name_plural = "EXIF-ändringar"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"EXIF-ändring {self.pk} ({self.processed}/{self.total})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+    @property
+    def percent(self):
+        return round(100 * self.processed / self.total) if self.total else 100
@@ -0,0 +1,282 @@
+"""
+Fulltextsökning i dokumentens innehåll.
+
+Texten extraheras ur txt/md-filer, och ur PDF-filer om det rena
+Python-paketet pypdf är installerat, och sparas i DocumentText (en rad per
+dokument). Extraheringen görs om bara när dokumentets content_hash ändrats.
+
+Index underhålls:
+- i bakgrunden när ett dokument skapas eller dess fil eller innehåll
+  ändras, via post_save-signalen i documents.signals
+- vid synkning (sync_documents, watch_media) från sync._apply_diff
+- i efterhand med manage.py index_documents
+
+På SQLite med FTS5 speglas DocumentText i en FTS5-tabell via triggers
+(migration 0008), och sökningen rankas med bm25 och får utdrag med
+snippet(). På PostgreSQL används ett GIN-index över
+to_tsvector('simple', content) (migration 0012), rankat med ts_rank och
+med utdrag från ts_headline. Övriga databaser (och SQLite utan FTS5)
+söker med icontains, som läser igenom all text för användarens dokument -
+det duger för små arkiv men skalar inte.
+"""
+import logging
+import re
+from contextlib import nullcontext
+from typing import Dict, List
+
+from django.db import connection, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from core.utils import get_media_root
+
+from .hashing import document_path
+from .models import Document, DocumentText
+
+# PDF-text är valfritt och kräver det rena Python-paketet pypdf
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - beror på installerade paket
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'documents_documenttext_fts'
+
+TEXT_TYPES = ['txt', 'md']
+
+# Längre texter kortas av - räcker gott för transkriptioner
+MAX_TEXT_LENGTH = 1_000_000
+
+DEFAULT_LIMIT = 50
+SNIPPET_WORDS = 16
+SNIPPET_CHARS = 80
+
+# Markörer runt träffar i utdragen; byts mot <mark> efter HTML-escaping
+_HIT_START = '\x02'
+_HIT_END = '\x03'
+
+
+def indexable_types() -> List[str]:
+    """Filtyper vars text kan extraheras med installerade paket"""
+    return TEXT_TYPES + (['pdf'] if PdfReader is not None else [])
+
+
+def extract_text(path, file_type: str) -> str:
+    """
+    Extrahera texten ur en fil.
+
+    Textfiler läses som UTF-8 med Windows-1252 som reserv (äldre avskrifter).
+    """
+    if file_type in TEXT_TYPES:
+        with open(path, 'rb') as f:
+            data = f.read(MAX_TEXT_LENGTH * 4)
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            text = data.decode('cp1252', errors='replace')
+    elif file_type == 'pdf' and PdfReader is not None:
+        reader = PdfReader(path)
+        pages = []
+        length = 0
+        for page in reader.pages:
+            page_text = page.extract_text() or ''
+            pages.append(page_text)
+            length += len(page_text)
+            if length >= MAX_TEXT_LENGTH:
+                break
+        text = '\n'.join(pages)
+    else:
+        return ''
+    return text[:MAX_TEXT_LENGTH]
+
+
+def index_documents(documents, media_root=None, write_lock=None) -> int:
+    """
+    Extrahera och spara texten för dokumenten vars innehåll ändrats.
+
+    Args:
+        documents: Dokument (queryset eller lista) - personen bör vara hämtad
+                   med select_related för att undvika en fråga per dokument
+        media_root: Skicka med i loopar (hämtas annars)
+        write_lock: Lås som hålls under databasskrivningarna (se sync_documents)
+
+    Returns:
+        Antal dokument vars text sparades
+    """
+    types = indexable_types()
+    documents = [doc for doc in documents if doc.file_type in types]
+    if not documents:
+        return 0
+    if media_root is None:
+        media_root = get_media_root()
+
+    indexed = dict(DocumentText.objects.filter(
+        document__in=[doc.pk for doc in documents]
+    ).values_list('document_id', 'content_hash'))
+
+    texts = {}
+    for doc in documents:
+        if doc.content_hash and indexed.get(doc.pk) == doc.content_hash:
+            continue
+        try:
+            texts[doc] = extract_text(document_path(doc, media_root), doc.file_type)
+        except Exception:
+            logger.warning('Kunde inte extrahera text ur %s', doc.relative_path, exc_info=True)
+
+    if not texts:
+        return 0
+    with write_lock or nullcontext(), transaction.atomic():
+        for doc, text in texts.items():
+            DocumentText.objects.update_or_create(
+                document=doc,
+                defaults={'content': text, 'content_hash': doc.content_hash},
+            )
+    return len(texts)
+
+
+def index_documents_by_id(document_ids) -> int:
+    """Indexera dokumenten med angivna id:n (för bakgrundsjobb)"""
+    return index_documents(Document.objects.filter(pk__in=document_ids).select_related('person'))
+
+
+def fts_available() -> bool:
+    """True om FTS5-tabellen finns (SQLite med FTS5)"""
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+def _fts_query(query: str) -> str:
+    """Gör om söktexten till en FTS5-fråga: alla ord, det sista som prefix"""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return ''
+    quoted = ['"{}"'.format(term.replace('"', '""')) for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _highlight(snippet: str) -> str:
+    """HTML-escapa utdraget och markera träffarna"""
+    return mark_safe(
+        escape(snippet).replace(_HIT_START, '<mark>').replace(_HIT_END, '</mark>')
+    )
+
+
+def search(user, query: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """
+    Sök i användarens dokument.
+
+    Returns:
+        Lista med {'document', 'snippet'} sorterad på relevans
+    """
+    query = query.strip()
+    if not query:
+        return []
+    if fts_available():
+        hits = _search_fts(user, query, limit)
+    elif connection.vendor == 'postgresql':
+        hits = _search_postgres(user, query, limit)
+    else:
+        hits = _search_fallback(user, query, limit)
+
+    documents = Document.objects.select_related('person', 'document_type').in_bulk(
+        [doc_id for doc_id, _ in hits]
+    )
+    return [
+        {'document': documents[doc_id], 'snippet': _highlight(snippet)}
+        for doc_id, snippet in hits
+        if doc_id in documents
+    ]
+
+
+def _search_fts(user, query: str, limit: int):
+    match = _fts_query(query)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT f.rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s)
+            FROM {FTS_TABLE} f
+            JOIN documents_document d ON d.id = f.rowid
+            JOIN persons_person p ON p.id = d.person_id
+            WHERE {FTS_TABLE} MATCH %s AND p.user_id = %s
+            ORDER BY bm25({FTS_TABLE})
+            LIMIT %s
+            """,
+            [_HIT_START, _HIT_END, SNIPPET_WORDS, match, user.pk, limit],
+        )
+        return cursor.fetchall()
+
+
+def _tsquery(query: str) -> str:
+    """Gör om söktexten till en tsquery: alla ord, det sista som prefix"""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return ''
+    return ' & '.join(terms) + ':*'
+
+
+def _search_postgres(user, query: str, limit: int):
+    match = _tsquery(query)
+    if not match:
+        return []
+    # to_tsvector-uttrycket ska vara identiskt med GIN-indexet (migration 0012).
+    # Utdragen tas fram i den yttre frågan, bara för de rader som returneras.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT hit.document_id, ts_headline('simple', t.content, hit.query, %s)
+            FROM (
+                SELECT t.document_id, q.query,
+                       ts_rank(to_tsvector('simple', t.content), q.query) AS rank
+                FROM documents_documenttext t
+                CROSS JOIN to_tsquery('simple', %s) AS q(query)
+                JOIN documents_document d ON d.id = t.document_id
+                JOIN persons_person p ON p.id = d.person_id
+                WHERE to_tsvector('simple', t.content) @@ q.query AND p.user_id = %s
+                ORDER BY rank DESC
+                LIMIT %s
+            ) hit
+            JOIN documents_documenttext t ON t.document_id = hit.document_id
+            ORDER BY hit.rank DESC
+            """,
+            [
+                f'StartSel="{_HIT_START}", StopSel="{_HIT_END}", '
+                f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}',
+                match, user.pk, limit,
+            ],
+        )
+        return cursor.fetchall()
+
+
+def _search_fallback(user, query: str, limit: int):
+    """Sökning utan FTS: alla ord måste finnas, flest förekomster först"""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+    texts = DocumentText.objects.filter(document__person__user=user)
+    for term in terms:
+        texts = texts.filter(content__icontains=term)
+
+    hits = []
+    for doc_id, content in texts.values_list('document_id', 'content'):
+        lowered = content.lower()
+        score = sum(lowered.count(term.lower()) for term in terms)
+        hits.append((score, doc_id, _make_snippet(content, terms)))
+    hits.sort(key=lambda hit: hit[0], reverse=True)
+    return [(doc_id, snippet) for _, doc_id, snippet in hits[:limit]]
+
+
+def _make_snippet(content: str, terms: List[str]) -> str:
+    """Utdrag runt första träffen, med markörer runt alla träffar"""
+    lowered = content.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    first = min((pos for pos in positions if pos >= 0), default=0)
+    start = max(first - SNIPPET_CHARS // 2, 0)
+    end = min(first + SNIPPET_CHARS, len(content))
+    snippet = content[start:end]
+
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    snippet = pattern.sub(lambda m: f'{_HIT_START}{m.group(0)}{_HIT_END}', snippet)
+    return f"{'…' if start else ''}{snippet}{'…' if end < len(content) else ''}"
@@ -0,0 +1,52 @@
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from core.background import run_in_background
+from core.utils import IMAGE_TYPES
+
+from .exif_utils import extract_exif
+from .hashing import document_path
+from .models import Document
+from .search import index_documents_by_id, indexable_types
+from .tagging import set_document_tags
+
+
+@receiver(pre_save, sender=Document)
+def extract_document_exif(sender, instance, raw=False, **kwargs):
+    """Extrahera EXIF för nya eller ändrade bilder (exif är None tills dess)"""
+    if raw or instance.exif is not None or instance.file_type not in IMAGE_TYPES:
+        return
+    instance.exif = extract_exif(document_path(instance))
+
+
+@receiver(pre_save, sender=Document)
+def remember_indexed_file(sender, instance, raw=False, **kwargs):
+    """Kom ihåg fil och innehåll före ändringen, så att metadataändringar inte indexeras om"""
+    instance._previous_file = None
+    if raw or not instance.pk or instance.file_type not in indexable_types():
+        return
+    instance._previous_file = Document.objects.filter(pk=instance.pk).values_list(
+        'relative_path', 'content_hash'
+    ).first()
+
+
+@receiver(post_save, sender=Document)
+def index_document_text(sender, instance, raw=False, created=False, **kwargs):
+    """
+    Indexera texten i bakgrunden när ett dokument skapats eller dess fil
+    eller innehåll ändrats.
+    """
+    if raw or instance.file_type not in indexable_types():
+        return
+    previous = getattr(instance, '_previous_file', None)
+    if not created and previous == (instance.relative_path, instance.content_hash):
+        return
+    run_in_background(index_documents_by_id, [instance.pk])
+
+
+@receiver(post_save, sender=Document)
+def sync_document_tags(sender, instance, raw=False, created=False, **kwargs):
+    """Håll DocumentTag i synk med texten i Document.tags"""
+    if raw or (created and not instance.tags):
+        return
+    set_document_tags(instance)
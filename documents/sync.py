@@ -0,0 +1,315 @@
+"""
+Synkronisering av en persons dokument mellan filsystemet och databasen.
+
+Synkningen är en diff mellan två mängder:
+- filerna i personens katalog, från en os.scandir-genomgång med en stat per fil
+- personens dokument i databasen, hämtade i en fråga och nycklade på relative_path
+
+Ändringarna skrivs sedan med bulk_create, bulk_update och en filtrerad
+delete, så antalet frågor är oberoende av antalet filer.
+
+``sync_person_incremental`` hoppar dessutom över kataloger som inte ändrats
+sedan förra synkningen (katalogernas mtime och ett manifest över filerna,
+sparade i DocumentSyncState) och används av manage.py sync_documents.
+
+Nya och ändrade filer får sin content_hash beräknad under synkningen,
+bilder får sina EXIF-fält extraherade och texten i textdokument indexeras
+för fulltextsökning (se search.py).
+"""
+import hashlib
+import os
+from contextlib import nullcontext
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.utils import IMAGE_TYPES, get_media_root
+from .exif_utils import extract_exif
+from .hashing import hash_files
+from .models import Document, DocumentSyncState, DocumentType
+from .search import index_documents
+
+BATCH_SIZE = 500
+
+
+def get_person_dir(person) -> Path:
+    """Returnera personens katalog i mediaroten"""
+    return Path(get_media_root()) / 'persons' / person.directory_name
+
+
+def get_document_type_map() -> Dict[Tuple[str, str], DocumentType]:
+    """Mappning (target_directory, filename) -> DocumentType"""
+    return {
+        (doc_type.target_directory, doc_type.filename): doc_type
+        for doc_type in DocumentType.objects.all()
+    }
+
+
+def scan_files(
+    root: Path,
+    prefix: str = '',
+    directory_mtimes: Optional[List[int]] = None
+) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Gå igenom alla filer under root med os.scandir.
+
+    Symlänkade kataloger följs inte. Varje fil stat:as exakt en gång.
+
+    Args:
+        directory_mtimes: Om angiven läggs underkatalogernas st_mtime_ns till här
+
+    Yields:
+        (relativ sökväg med '/', stat-resultat)
+    """
+    with os.scandir(root) as entries:
+        for entry in entries:
+            rel_path = f'{prefix}{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                if directory_mtimes is not None:
+                    directory_mtimes.append(entry.stat(follow_symlinks=False).st_mtime_ns)
+                yield from scan_files(entry.path, f'{rel_path}/', directory_mtimes)
+            elif entry.is_file():
+                yield rel_path, entry.stat()
+
+
+def tree_mtime(root: Path) -> int:
+    """
+    Senaste st_mtime_ns bland root och alla underkataloger.
+
+    Ändras när filer läggs till, tas bort eller byter namn, men inte när en
+    befintlig fil skrivs över. Filerna själva stat:as inte.
+    """
+    latest = os.stat(root).st_mtime_ns
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                latest = max(latest, tree_mtime(entry.path))
+    return latest
+
+
+def build_manifest(files: List[Tuple[str, os.stat_result]]) -> str:
+    """SHA-256 över alla filers sökväg, storlek och ändringstid"""
+    digest = hashlib.sha256()
+    for rel_path, stat in sorted(files, key=lambda item: item[0]):
+        line = f'{rel_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n'
+        digest.update(line.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def file_modified_at(stat: os.stat_result) -> datetime:
+    """Filens ändringstid som tidszonsmedveten datetime"""
+    return datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+
+
+def sync_person_documents(
+    person,
+    document_types: Optional[Dict[Tuple[str, str], DocumentType]] = None,
+    files: Optional[List[Tuple[str, os.stat_result]]] = None,
+    write_lock=None
+) -> Tuple[int, int, int]:
+    """
+    Synkronisera personens dokument mot filerna i personens katalog.
+
+    - Nya filer vars (katalog, filnamn) matchar en dokumenttyp läggs till
+    - Befintliga dokument vars filstorlek ändrats uppdateras
+    - Dokument vars fil inte längre finns tas bort
+
+    Args:
+        person: Personen att synka
+        document_types: Mappning från get_document_type_map() (hämtas om None)
+        files: Redan inlästa filer från scan_files() (katalogen läses om None)
+        write_lock: Lås som hålls under databasskrivningarna (se sync_person_incremental)
+
+    Returns:
+        Tuple (tillagda, uppdaterade, borttagna)
+
+    Raises:
+        FileNotFoundError: Om personens katalog inte finns
+    """
+    if document_types is None:
+        document_types = get_document_type_map()
+    if files is None:
+        files = scan_files(get_person_dir(person))
+
+    documents = Document.objects.filter(person=person)
+    return _apply_diff(person, documents, files, document_types, write_lock)
+
+
+def sync_person_paths(
+    person,
+    rel_paths,
+    document_types: Optional[Dict[Tuple[str, str], DocumentType]] = None
+) -> Tuple[int, int, int]:
+    """
+    Synkronisera bara angivna sökvägar under personens katalog.
+
+    Används av manage.py watch_media. En sökväg som är en katalog synkas
+    med allt innehåll; en sökväg som inte längre finns tar bort dokumentet
+    (eller alla dokument under katalogen).
+
+    Args:
+        rel_paths: Sökvägar relativt personens katalog, med '/'
+
+    Returns:
+        Tuple (tillagda, uppdaterade, borttagna)
+    """
+    if document_types is None:
+        document_types = get_document_type_map()
+    person_dir = get_person_dir(person)
+
+    # Nycklade på sökväg - en katalog och dess underkatalog kan båda vara ändrade
+    files = {}
+    paths = Q()
+    for rel_path in set(rel_paths):
+        path = person_dir / rel_path
+        if path.is_dir() and not path.is_symlink():
+            files.update(scan_files(path, f'{rel_path}/'))
+        else:
+            try:
+                stat = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                stat = None
+            if stat is not None and S_ISREG(stat.st_mode):
+                files[rel_path] = stat
+        # Katalogen kan ha tagits bort - matcha även dokument under den
+        paths |= Q(relative_path=rel_path) | Q(relative_path__startswith=f'{rel_path}/')
+
+    if not paths:
+        return 0, 0, 0
+    documents = Document.objects.filter(paths, person=person)
+    return _apply_diff(person, documents, files.items(), document_types)
+
+
+def _apply_diff(person, documents, files, document_types, write_lock=None) -> Tuple[int, int, int]:
+    """
+    Jämför dokumenten i querysetet med filerna och skriv ändringarna.
+
+    Dokument i querysetet utan motsvarande fil tas bort. Nya och ändrade
+    filer hashas parallellt (content_hash) och bilder får sin EXIF
+    extraherad innan något skrivs.
+    """
+    documents = list(documents.order_by('-created_at'))
+    existing = {}
+    for doc in documents:
+        existing.setdefault(doc.relative_path.replace('\\', '/'), doc)
+
+    to_create = []
+    to_update = []
+    seen = set()
+    now = timezone.now()
+
+    for rel_path, stat in files:
+        seen.add(rel_path)
+        doc = existing.get(rel_path)
+
+        if doc is not None:
+            if doc.file_size != stat.st_size:
+                doc.file_size = stat.st_size
+                doc.file_modified_at = file_modified_at(stat)
+                doc.updated_at = now
+                to_update.append(doc)
+            continue
+
+        target_dir, _, filename = rel_path.rpartition('/')
+        doc_type = document_types.get((target_dir, filename))
+        if doc_type is None:
+            continue
+
+        _, ext = os.path.splitext(filename)
+        doc = Document(
+            person=person,
+            document_type=doc_type,
+            filename=filename,
+            relative_path=rel_path,
+            file_size=stat.st_size,
+            file_type=ext.lstrip('.').lower(),
+            file_modified_at=file_modified_at(stat),
+        )
+        doc.file.name = f'persons/{person.directory_name}/{rel_path}'
+        to_create.append(doc)
+
+    stale_ids = [
+        doc.pk for doc in documents
+        if doc.relative_path.replace('\\', '/') not in seen
+    ]
+
+    person_dir = get_person_dir(person)
+    changed = to_create + to_update
+    hashes = hash_files([person_dir / doc.relative_path for doc in changed])
+    for doc in changed:
+        doc.content_hash = hashes.get(os.fspath(person_dir / doc.relative_path)) or ''
+        if doc.file_type in IMAGE_TYPES:
+            doc.exif = extract_exif(person_dir / doc.relative_path)
+
+    with write_lock or nullcontext(), transaction.atomic():
+        Document.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        Document.objects.bulk_update(
+            to_update, ['file_size', 'file_modified_at', 'content_hash', 'exif', 'updated_at'],
+            batch_size=BATCH_SIZE
+        )
+        if stale_ids:
+            Document.objects.filter(person=person, pk__in=stale_ids).delete()
+
+    index_documents(changed, write_lock=write_lock)
+    return len(to_create), len(to_update), len(stale_ids)
+
+
+def sync_person_incremental(
+    person,
+    document_types: Optional[Dict[Tuple[str, str], DocumentType]] = None,
+    force: bool = False,
+    fast: bool = False,
+    write_lock=None
+) -> Tuple[str, int, int, int]:
+    """
+    Synkronisera personens dokument om katalogen ändrats sedan förra gången.
+
+    Katalogen räknas som oförändrad om både katalogernas mtime och manifestet
+    över filerna är samma som vid förra synkningen.
+
+    Args:
+        force: Synka även om katalogen är oförändrad
+        fast: Jämför bara katalogernas mtime och läs inte filerna om den är
+              oförändrad (missar filer som skrivits över på plats)
+        write_lock: Lås som hålls under databasskrivningarna, så att flera
+              trådar kan läsa kataloger parallellt men skriva en i taget
+
+    Returns:
+        Tuple (status, tillagda, uppdaterade, borttagna) där status är
+        'missing' (ingen katalog), 'unchanged' eller 'synced'
+    """
+    person_dir = get_person_dir(person)
+    if not person_dir.is_dir():
+        return 'missing', 0, 0, 0
+
+    state = DocumentSyncState.objects.filter(person=person).first()
+    if fast and state and not force and tree_mtime(person_dir) == state.tree_mtime_ns:
+        return 'unchanged', 0, 0, 0
+
+    directory_mtimes = [os.stat(person_dir).st_mtime_ns]
+    files = list(scan_files(person_dir, directory_mtimes=directory_mtimes))
+    mtime = max(directory_mtimes)
+    manifest = build_manifest(files)
+
+    if (not force and state and state.tree_mtime_ns == mtime
+            and state.manifest_hash == manifest):
+        return 'unchanged', 0, 0, 0
+
+    added, updated, removed = sync_person_documents(
+        person, document_types, files=files, write_lock=write_lock
+    )
+    with write_lock or nullcontext():
+        DocumentSyncState.objects.update_or_create(
+            person=person,
+            defaults={
+                'tree_mtime_ns': mtime,
+                'manifest_hash': manifest,
+                'file_count': len(files),
+            }
+        )
+    return 'synced', added, updated, removed
@@ -0,0 +1,253 @@
+"""
+Normaliserade dokumenttaggar.
+
+Document.tags är fortfarande texten som visas och redigeras (kommaseparerad).
+Varje tagg finns dessutom som en Tag-rad per användare, och kopplingarna
+ligger i DocumentTag tillsammans med dokumentets person. Med index på
+(tag, document) och (person, tag) blir filtrering på tagg, taggmoln med
+antal och omtaggning av många dokument enstaka indexerade frågor.
+
+Kopplingarna hålls i synk med texten:
+- när ett dokument sparas, via post_save-signalen i documents.signals
+- av ``retag`` och ``rename_tag``, som skriver både kopplingar och text
+- i efterhand med manage.py rebuild_tags
+"""
+import math
+from typing import Dict, Iterable, List
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Document, DocumentTag, Tag
+
+MAX_TAG_LENGTH = 100
+BATCH_SIZE = 500
+
+# Antal storlekar i taggmolnet
+CLOUD_WEIGHTS = 5
+
+
+def tag_key(name: str) -> str:
+    """Nyckeln som taggar jämförs med (skiftlägesokänslig)"""
+    # casefold kan göra texten längre (t.ex. 'ß' -> 'ss')
+    return name.strip().casefold()[:MAX_TAG_LENGTH]
+
+
+def parse_tags(text: str) -> List[str]:
+    """Taggarna i en kommaseparerad text, utan tomma taggar och dubbletter"""
+    names = []
+    seen = set()
+    for name in (text or '').split(','):
+        name = name.strip()[:MAX_TAG_LENGTH]
+        key = tag_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            names.append(name)
+    return names
+
+
+def join_tags(names: Iterable[str]) -> str:
+    """
+    Taggarna som text för Document.tags. Taggar som inte får plats i fältet
+    utelämnas.
+    """
+    max_length = Document._meta.get_field('tags').max_length
+    text = ''
+    for name in names:
+        candidate = f'{text}, {name}' if text else name
+        if len(candidate) > max_length:
+            break
+        text = candidate
+    return text
+
+
+def get_tags(user, names: Iterable[str]) -> Dict[str, Tag]:
+    """
+    Användarens Tag-rader för namnen (skapas vid behov), nycklade på tag_key.
+    user kan vara en användare eller dess id.
+    """
+    user_id = getattr(user, 'pk', user)
+    wanted = {}
+    for name in names:
+        wanted.setdefault(tag_key(name), name.strip()[:MAX_TAG_LENGTH])
+    wanted.pop('', None)
+    if not wanted:
+        return {}
+
+    tags = {tag.key: tag for tag in Tag.objects.filter(user_id=user_id, key__in=wanted)}
+    missing = [Tag(user_id=user_id, name=name, key=key) for key, name in wanted.items() if key not in tags]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        tags = {tag.key: tag for tag in Tag.objects.filter(user_id=user_id, key__in=wanted)}
+    return tags
+
+
+def set_document_tags(document) -> None:
+    """Synka dokumentets kopplingar mot texten i document.tags"""
+    wanted = {tag_key(name): name for name in parse_tags(document.tags)}
+    existing = {
+        key: (pk, person_id)
+        for pk, key, person_id in DocumentTag.objects.filter(
+            document=document
+        ).values_list('pk', 'tag__key', 'person_id')
+    }
+
+    removed = [pk for key, (pk, _) in existing.items() if key not in wanted]
+    added = [name for key, name in wanted.items() if key not in existing]
+    moved = any(person_id != document.person_id for _, person_id in existing.values())
+    if not (removed or added or moved):
+        return
+
+    with transaction.atomic():
+        if removed:
+            DocumentTag.objects.filter(pk__in=removed).delete()
+        if moved:
+            # Dokumentet har flyttats till en annan person
+            DocumentTag.objects.filter(document=document).update(person=document.person_id)
+        if added:
+            tags = get_tags(document.person.user_id, added)
+            DocumentTag.objects.bulk_create([
+                DocumentTag(document=document, tag=tag, person_id=document.person_id)
+                for tag in tags.values()
+            ], ignore_conflicts=True)
+
+
+def filter_by_tag(documents, tag: str):
+    """Dokumenten i querysetet som har taggen (skiftlägesokänsligt)"""
+    return documents.filter(document_tags__tag__key=tag_key(tag))
+
+
+def tag_cloud(user, person=None) -> List[Dict]:
+    """
+    Användarens (eller personens) taggar med antal dokument.
+
+    Returns:
+        Lista med {'name', 'key', 'count', 'weight'} sorterad på namn, där
+        weight (1-CLOUD_WEIGHTS) används för storleken i taggmolnet
+    """
+    rows = DocumentTag.objects.filter(person=person) if person is not None \
+        else DocumentTag.objects.filter(tag__user=user)
+    cloud = list(
+        rows.values('tag__name', 'tag__key')
+        .annotate(count=Count('document', distinct=True))
+        .order_by('tag__key')
+    )
+    largest = max((row['count'] for row in cloud), default=1)
+    return [
+        {
+            'name': row['tag__name'],
+            'key': row['tag__key'],
+            'count': row['count'],
+            'weight': 1 + round((CLOUD_WEIGHTS - 1) * math.log(row['count']) / math.log(largest))
+            if largest > 1 else 1,
+        }
+        for row in cloud
+    ]
+
+
+def retag(user, documents, add: Iterable[str] = (), remove: Iterable[str] = ()) -> int:
+    """
+    Ta bort och lägg till taggar i många dokument.
+
+    Kopplingarna skrivs med DELETE och bulk_create (i omgångar om
+    BATCH_SIZE dokument) och texten i Document.tags med bulk_update.
+    Borttagningen görs först, så att rename (ta bort gammal, lägg till ny)
+    fungerar även när bara skiftläget ändras.
+
+    Args:
+        documents: Queryset med användarens dokument
+
+    Returns:
+        Antal dokument vars taggar ändrades
+    """
+    add = parse_tags(','.join(add))
+    remove_keys = {tag_key(name) for name in remove} - {''}
+    if not add and not remove_keys:
+        return 0
+
+    changed = []
+    final_keys = {}
+    now = timezone.now()
+    for doc in documents.only('pk', 'person_id', 'tags'):
+        names = [name for name in parse_tags(doc.tags) if tag_key(name) not in remove_keys]
+        keys = {tag_key(name) for name in names}
+        names += [name for name in add if tag_key(name) not in keys]
+        text = join_tags(names)
+        final_keys[doc.pk] = (doc.person_id, {tag_key(name) for name in parse_tags(text)})
+        if text != doc.tags:
+            doc.tags = text
+            doc.updated_at = now
+            changed.append(doc)
+
+    document_ids = list(final_keys)
+    add_keys = {tag_key(name) for name in add}
+    with transaction.atomic():
+        if remove_keys:
+            for start in range(0, len(document_ids), BATCH_SIZE):
+                DocumentTag.objects.filter(
+                    document__in=document_ids[start:start + BATCH_SIZE], tag__key__in=remove_keys
+                ).delete()
+        if add:
+            tags = get_tags(user, add)
+            DocumentTag.objects.bulk_create([
+                DocumentTag(document_id=doc_id, tag=tags[key], person_id=person_id)
+                for doc_id, (person_id, keys) in final_keys.items()
+                for key in keys & add_keys if key in tags
+            ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+        Document.objects.bulk_update(changed, ['tags', 'updated_at'], batch_size=BATCH_SIZE)
+        remove_unused_tags(user)
+    return len(changed)
+
+
+def rename_tag(user, old: str, new: str) -> int:
+    """
+    Byt namn på en tagg i alla användarens dokument. Finns den nya taggen
+    redan slås taggarna ihop.
+
+    Returns:
+        Antal dokument vars taggar ändrades
+    """
+    documents = filter_by_tag(Document.objects.filter(person__user=user), old)
+    with transaction.atomic():
+        changed = retag(user, documents, add=[new], remove=[old])
+        if tag_key(old) == tag_key(new):
+            Tag.objects.filter(user=user, key=tag_key(new)).update(name=new.strip()[:MAX_TAG_LENGTH])
+    return changed
+
+
+def rebuild_tags(documents) -> int:
+    """
+    Bygg om dokumentens kopplingar från texten i Document.tags.
+
+    Returns:
+        Antal kopplingar
+    """
+    rows = list(documents.values_list('pk', 'person_id', 'person__user_id', 'tags'))
+    names_by_user = {}
+    for _, _, user_id, text in rows:
+        names_by_user.setdefault(user_id, []).extend(parse_tags(text))
+
+    document_ids = [row[0] for row in rows]
+    links = []
+    with transaction.atomic():
+        for start in range(0, len(document_ids), BATCH_SIZE):
+            DocumentTag.objects.filter(document__in=document_ids[start:start + BATCH_SIZE]).delete()
+        tags = {user_id: get_tags(user_id, names) for user_id, names in names_by_user.items()}
+        for doc_id, person_id, user_id, text in rows:
+            links.extend(
+                DocumentTag(document_id=doc_id, person_id=person_id, tag=tags[user_id][tag_key(name)])
+                for name in parse_tags(text)
+            )
+        DocumentTag.objects.bulk_create(links, batch_size=BATCH_SIZE)
+        for user_id in names_by_user:
+            remove_unused_tags(user_id)
+    return len(links)
+
+
+def remove_unused_tags(user) -> int:
+    """Ta bort användarens taggar som inte längre används av något dokument"""
+    deleted, _ = Tag.objects.filter(
+        user_id=getattr(user, 'pk', user), document_tags__isnull=True
+    ).delete()
+    return deleted
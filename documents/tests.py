@@ -1,3 +1,379 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+
+from core.models import SystemConfig
+from persons.models import Person
+
+from . import chunked
+from .archive import MANIFEST_NAME, stream_archive
+from .delivery import parse_range, serve_file
+from .exif_batch import select_images
+from .exif_utils import extract_exif, rewrite_exif
+from .models import Document, DocumentType, UploadSession
+from .sync import (
+    build_manifest, get_document_type_map, get_person_dir, scan_files, sync_person_documents,
+)
+from .tagging import MAX_TAG_LENGTH, filter_by_tag, rename_tag, retag, tag_cloud, tag_key
+
+
+class MediaRootMixin:
+    """Testerna skriver filer i en tillfällig mediarot"""
+
+    def setUp(self):
+        super().setUp()
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        self.media_root = Path(media_dir.name)
+        config = SystemConfig.load()
+        config.media_directory_path = str(self.media_root)
+        config.save()
+
+        self.user = User.objects.create_user('test', password='test')
+        self.person = Person.objects.create(
+            user=self.user, firstname='Anna', surname='Berg', directory_name='berg_anna'
+        )
+        self.doc_type = DocumentType.objects.create(
+            name='bild', target_directory='bilder', filename='bild.jpg'
+        )
+
+
+class ParseRangeTests(TestCase):
+    def test_single_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 999))
+
+    def test_unsupported_ranges_send_whole_file(self):
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-6', 'items=0-1'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable_ranges(self):
+        self.assertIs(parse_range('bytes=1000-', 1000), False)
+        self.assertIs(parse_range('bytes=20-10', 1000), False)
+        self.assertIs(parse_range('bytes=-0', 1000), False)
+
+    def test_empty_file_has_no_satisfiable_range(self):
+        for header in ('bytes=0-', 'bytes=0-0', 'bytes=-1', 'bytes=-500'):
+            self.assertIs(parse_range(header, 0), False, header)
+
+
+class ServeFileTests(TestCase):
+    def setUp(self):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, bytes(range(256)) * 4)
+        os.close(handle)
+        self.addCleanup(os.unlink, path)
+        self.path = path
+        self.factory = RequestFactory()
+
+    def serve(self, **headers):
+        return serve_file(self.factory.get('/', headers=headers), self.path, 'fil.bin')
+
+    def test_range_and_conditional_get(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.serve(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        self.assertEqual(self.serve(if_none_match=etag).status_code, 304)
+        self.assertEqual(self.serve(range='bytes=5000-').status_code, 416)
+        # If-Range med en gammal ETag ger hela filen
+        self.assertEqual(self.serve(range='bytes=0-9', if_range='"gammal"').status_code, 200)
+
+
+class ChunkRangeTests(TestCase):
+    def test_merge_ranges(self):
+        self.assertEqual(
+            chunked.merge_ranges([(10, 20), (0, 5), (5, 8), (15, 30), (40, 50)]),
+            [[0, 8], [10, 30], [40, 50]]
+        )
+        self.assertEqual(chunked.merge_ranges([]), [])
+
+    def test_missing_ranges(self):
+        self.assertEqual(
+            chunked.missing_ranges([[0, 8], [10, 30]], 50), [[8, 10], [30, 50]]
+        )
+        self.assertEqual(chunked.missing_ranges([[0, 50]], 50), [])
+        self.assertEqual(chunked.missing_ranges([], 50), [[0, 50]])
+
+
+class ChunkedUploadTests(MediaRootMixin, TestCase):
+    def upload(self, content, chunk_size=4):
+        session = chunked.create_session(self.person, 'skanning.tif', len(content))
+        # Delarna skickas i omvänd ordning
+        for offset in reversed(range(0, len(content), chunk_size)):
+            part = content[offset:offset + chunk_size]
+            chunked.write_chunk(session, offset, io.BytesIO(part), len(part))
+        return session
+
+    def test_finalize_moves_file_into_place(self):
+        content = b'0123456789abcdef!'
+        session = self.upload(content)
+        document = chunked.finalize_session(session, hashlib.sha256(content).hexdigest())
+
+        path = self.media_root / 'persons' / 'berg_anna' / 'bilder' / 'skanning.tif'
+        self.assertEqual(path.read_bytes(), content)
+        self.assertEqual(document.content_hash, hashlib.sha256(content).hexdigest())
+        self.assertFalse(UploadSession.objects.exists())
+
+        with self.assertRaises(chunked.UploadError) as raised:
+            chunked.finalize_session(session)
+        self.assertEqual(raised.exception.status, 404)
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_incomplete_upload_is_rejected(self):
+        session = chunked.create_session(self.person, 'skanning.jpg', 10)
+        chunked.write_chunk(session, 0, io.BytesIO(b'abcd'), 4)
+        self.assertEqual(
+            chunked.missing_ranges(chunked.received_ranges(session), 10), [[4, 10]]
+        )
+        with self.assertRaises(chunked.UploadError) as raised:
+            chunked.finalize_session(session)
+        self.assertEqual(raised.exception.status, 409)
+
+    def test_wrong_hash_keeps_upload(self):
+        session = self.upload(b'abcdefgh')
+        with self.assertRaises(chunked.UploadError) as raised:
+            chunked.finalize_session(session, '0' * 64)
+        self.assertEqual(raised.exception.status, 422)
+        self.assertTrue(UploadSession.objects.filter(pk=session.pk).exists())
+        self.assertFalse((self.media_root / 'persons' / 'berg_anna' / 'bilder' / 'skanning.tif').exists())
+
+    def test_failed_save_leaves_no_orphan_file(self):
+        session = self.upload(b'abcdefgh')
+        with mock.patch.object(Document, 'save', side_effect=RuntimeError('databasfel')):
+            with self.assertRaises(RuntimeError):
+                chunked.finalize_session(session)
+        self.assertFalse((self.media_root / 'persons' / 'berg_anna' / 'bilder' / 'skanning.tif').exists())
+
+        # Filen ligger kvar i uppladdningskatalogen och kan avslutas igen
+        document = chunked.finalize_session(session)
+        self.assertEqual(document.filename, 'skanning.tif')
+
+    @override_settings(DOCUMENT_UPLOAD_MAX_SIZE=16)
+    def test_rejects_before_allocating(self):
+        with self.assertRaises(chunked.UploadError) as raised:
+            chunked.create_session(self.person, 'skanning.tif', 17)
+        self.assertEqual(raised.exception.status, 413)
+
+        # Filändelsen ska få plats i Document.file_type även med angiven dokumenttyp
+        with self.assertRaises(chunked.UploadError) as raised:
+            chunked.create_session(self.person, 'arkiv.documentation', 4, document_type=self.doc_type)
+        self.assertEqual(raised.exception.status, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class RewriteExifTests(TestCase):
+    """EXIF skrivs om utan att bilddatan kodas om"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def make_image(self, name, image_format):
+        image = Image.new('RGB', (32, 24))
+        for x in range(32):
+            for y in range(24):
+                image.putpixel((x, y), (x * 8, y * 10, (x + y) * 4))
+        exif = Image.Exif()
+        exif[0x010F] = 'Kamera AB'  # Make
+        path = self.directory / name
+        image.save(path, format=image_format, exif=exif)
+        return path
+
+    def pixels(self, path):
+        with Image.open(path) as image:
+            return image.tobytes()
+
+    def test_jpeg_image_data_is_unchanged(self):
+        path = self.make_image('bild.jpg', 'JPEG')
+        original = path.read_bytes()
+        pixels = self.pixels(path)
+
+        rewrite_exif(path, {'Artist': 'Åsa Öberg', 'Model': 'X1'})
+
+        rewritten = path.read_bytes()
+        # Allt från första SOS-markören (den kodade bilden) är identiskt
+        self.assertEqual(
+            rewritten[rewritten.index(b'\xff\xda'):], original[original.index(b'\xff\xda'):]
+        )
+        self.assertEqual(self.pixels(path), pixels)
+        exif = extract_exif(path)
+        self.assertEqual(exif['Artist'], 'Åsa Öberg')
+        self.assertEqual(exif['Make'], 'Kamera AB')
+
+    def test_png_image_data_is_unchanged(self):
+        path = self.make_image('bild.png', 'PNG')
+        pixels = self.pixels(path)
+
+        rewrite_exif(path, {'Artist': 'Anna Berg'})
+        rewrite_exif(path, {'Model': 'X1'})
+
+        self.assertEqual(self.pixels(path), pixels)
+        exif = extract_exif(path)
+        self.assertEqual(exif['Artist'], 'Anna Berg')
+        self.assertEqual(exif['Model'], 'X1')
+        self.assertEqual(path.read_bytes().count(b'eXIf'), 1)
+
+    def test_other_formats_are_left_untouched(self):
+        pages = [Image.new('RGB', (16, 16), color) for color in ('red', 'blue')]
+        for name, options in [
+            ('skanning.tif', {'format': 'TIFF', 'compression': 'tiff_lzw'}),
+            ('animation.gif', {'format': 'GIF'}),
+        ]:
+            path = self.directory / name
+            pages[0].save(path, save_all=True, append_images=pages[1:], **options)
+            original = path.read_bytes()
+            with self.assertRaises(ValueError):
+                rewrite_exif(path, {'Artist': 'Anna Berg'})
+            self.assertEqual(path.read_bytes(), original)
+
+
+class ExifBatchSelectionTests(MediaRootMixin, TestCase):
+    def test_only_losslessly_writable_images_are_selected(self):
+        for filename in ('a.jpg', 'b.PNG', 'c.gif', 'd.tif', 'e.txt'):
+            Document.objects.create(
+                person=self.person, document_type=self.doc_type, filename=filename,
+                relative_path=f'bilder/{filename}', exif={},
+            )
+        self.assertEqual(
+            sorted(select_images(self.user).values_list('filename', flat=True)), ['a.jpg', 'b.PNG']
+        )
+
+
+class TaggingTests(MediaRootMixin, TestCase):
+    def create_document(self, filename, tags):
+        return Document.objects.create(
+            person=self.person, document_type=self.doc_type, filename=filename,
+            relative_path=f'bilder/{filename}', file_type='txt', tags=tags,
+        )
+
+    def keys(self, document):
+        return sorted(document.document_tags.values_list('tag__key', flat=True))
+
+    def test_tag_key_fits_column(self):
+        self.assertEqual(tag_key('  Kyrkbok '), 'kyrkbok')
+        self.assertEqual(len(tag_key('ß' * MAX_TAG_LENGTH)), MAX_TAG_LENGTH)
+
+    def test_save_keeps_tag_rows_in_sync(self):
+        document = self.create_document('a.txt', 'Kyrkbok, dop, kyrkbok')
+        self.assertEqual(self.keys(document), ['dop', 'kyrkbok'])
+        document.tags = 'Dop'
+        document.save()
+        self.assertEqual(self.keys(document), ['dop'])
+
+    def test_retag(self):
+        first = self.create_document('a.txt', 'Kyrkbok, Dop')
+        second = self.create_document('b.txt', 'Bouppteckning')
+
+        changed = retag(self.user, Document.objects.filter(person=self.person),
+                        add=['Flytt'], remove=['dop'])
+        self.assertEqual(changed, 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.tags, 'Kyrkbok, Flytt')
+        self.assertEqual(second.tags, 'Bouppteckning, Flytt')
+        self.assertEqual(self.keys(first), ['flytt', 'kyrkbok'])
+        self.assertEqual(
+            sorted(filter_by_tag(Document.objects.all(), 'FLYTT').values_list('filename', flat=True)),
+            ['a.txt', 'b.txt']
+        )
+        # Oanvända taggar tas bort
+        self.assertNotIn('dop', [row['key'] for row in tag_cloud(self.user)])
+
+    def test_rename_tag_merges_and_changes_case(self):
+        self.create_document('a.txt', 'Kyrkbok, Dop')
+        self.create_document('b.txt', 'Kyrkböcker')
+
+        self.assertEqual(rename_tag(self.user, 'kyrkbok', 'Kyrkböcker'), 1)
+        cloud = {row['key']: (row['name'], row['count']) for row in tag_cloud(self.user)}
+        self.assertEqual(cloud, {'dop': ('Dop', 1), 'kyrkböcker': ('Kyrkböcker', 2)})
+
+        rename_tag(self.user, 'kyrkböcker', 'KYRKBÖCKER')
+        self.assertEqual(tag_cloud(self.user)[1]['name'], 'KYRKBÖCKER')
+
+
+class SyncTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        DocumentType.objects.create(name='anteckning', target_directory='texter', filename='anteckning.txt')
+        self.person_dir = get_person_dir(self.person)
+        (self.person_dir / 'texter').mkdir(parents=True)
+        self.path = self.person_dir / 'texter' / 'anteckning.txt'
+
+    def sync(self):
+        return sync_person_documents(self.person, get_document_type_map())
+
+    def test_sync_diff(self):
+        self.path.write_text('Född 1850')
+        (self.person_dir / 'texter' / 'okand.txt').write_text('Ingen dokumenttyp')
+        self.assertEqual(self.sync(), (1, 0, 0))
+        self.assertEqual(self.sync(), (0, 0, 0))
+        document = Document.objects.get(person=self.person)
+        self.assertEqual(document.content_hash, hashlib.sha256('Född 1850'.encode()).hexdigest())
+
+        self.path.write_text('Född 1850 i Uppsala')
+        self.assertEqual(self.sync(), (0, 1, 0))
+        self.path.unlink()
+        self.assertEqual(self.sync(), (0, 0, 1))
+        self.assertFalse(Document.objects.exists())
+
+    def test_manifest_changes_with_files(self):
+        self.path.write_text('Född 1850')
+        files = list(scan_files(self.person_dir))
+        manifest = build_manifest(files)
+        self.assertEqual(build_manifest(list(reversed(files))), manifest)
+
+        self.path.write_text('Född 1850 i Uppsala')
+        self.assertNotEqual(build_manifest(list(scan_files(self.person_dir))), manifest)
+
+
+class ArchiveTests(MediaRootMixin, TestCase):
+    def test_stream_archive_is_valid_zip(self):
+        person_dir = get_person_dir(self.person)
+        (person_dir / 'bilder').mkdir(parents=True)
+        (person_dir / 'texter').mkdir()
+        image_data = os.urandom(200_000)
+        (person_dir / 'bilder' / 'bild.jpg').write_bytes(image_data)
+        (person_dir / 'texter' / 'anteckning.txt').write_text('Född 1850\n' * 1000)
+        Document.objects.create(
+            person=self.person, document_type=self.doc_type, filename='bild.jpg',
+            relative_path='bilder/bild.jpg', file_type='jpg', tags='Porträtt', exif={},
+        )
+
+        chunks = list(stream_archive([self.person]))
+        self.assertGreater(len(chunks), 1)
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), [
+                MANIFEST_NAME, 'berg_anna/bilder/bild.jpg', 'berg_anna/texter/anteckning.txt'
+            ])
+            self.assertEqual(archive.read('berg_anna/bilder/bild.jpg'), image_data)
+            self.assertEqual(archive.getinfo('berg_anna/bilder/bild.jpg').compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(
+                archive.getinfo('berg_anna/texter/anteckning.txt').compress_type, zipfile.ZIP_DEFLATED
+            )
+            manifest = json.loads(archive.read(MANIFEST_NAME))
+
+        person = manifest['persons'][0]
+        self.assertEqual(person['directory_name'], 'berg_anna')
+        self.assertEqual([doc['tags'] for doc in person['documents']], ['Porträtt'])
+        self.assertEqual(len(person['files']), 2)
@@ -0,0 +1,224 @@
+"""
+Uppladdade filer som flyttas på plats i stället för att kopieras.
+
+Större uppladdningar sparas av Django i en temporär fil. StagingFileUploadHandler
+lägger den filen i en katalog under mediaroten (STAGING_DIRNAME) och hashar
+innehållet medan det tas emot. ``finalize_upload`` kan då flytta filen till
+sin slutliga plats med ett atomärt os.replace, utan att läsa den en gång till.
+
+Ligger den temporära filen på ett annat filsystem (t.ex. om mediaroten bytts
+under uppladdningen) kopieras den i kärnan med copy_file_range eller sendfile
+till en temporär fil bredvid målet, som sedan byter namn. Små filer som
+Django håller i minnet skrivs som tidigare med write_chunks.
+"""
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, TemporaryFileUploadHandler
+
+from core.utils import IMAGE_TYPES, get_media_root
+
+from .hashing import CHUNK_SIZE, hash_file, write_chunks
+
+STAGING_DIRNAME = '.uploads'
+
+# Filändelser som godtas vid bilduppladdning: bildtyperna samt TIFF för
+# skanningar (som sparas som dokument men inte visas i gallerierna)
+UPLOAD_IMAGE_TYPES = IMAGE_TYPES + ['tif', 'tiff']
+
+# Fel som betyder att kärnan inte kan kopiera mellan just dessa filer
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def get_staging_dir() -> str:
+    """Katalog för pågående uppladdningar (skapas vid behov)"""
+    path = os.path.join(get_media_root(), STAGING_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_image_document_type():
+    """
+    Dokumenttyp för uppladdade bilder: "bild", annars en dokumenttyp med
+    "bilder" i target_directory. Returnerar None om ingen finns.
+    """
+    from .models import DocumentType
+
+    doc_type = DocumentType.objects.filter(name='bild').first()
+    if not doc_type:
+        doc_type = DocumentType.objects.filter(
+            target_directory__icontains='bilder'
+        ).first()
+    return doc_type
+
+
+def unique_path(directory, filename: str) -> Path:
+    """Sökväg i directory som inte finns, med _1, _2 ... före filändelsen vid behov"""
+    directory = Path(directory)
+    path = directory / filename
+    counter = 1
+    while path.exists():
+        name_parts = filename.rsplit('.', 1)
+        if len(name_parts) == 2:
+            candidate = f"{name_parts[0]}_{counter}.{name_parts[1]}"
+        else:
+            candidate = f"{filename}_{counter}"
+        path = directory / candidate
+        counter += 1
+    return path
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """TemporaryUploadedFile som ligger i mediarotens uppladdningskatalog"""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=get_staging_dir())
+        # Hoppa över TemporaryUploadedFile.__init__, som skapar filen i FILE_UPLOAD_TEMP_DIR
+        super(TemporaryUploadedFile, self).__init__(
+            file, name, content_type, size, charset, content_type_extra
+        )
+        self.content_hash = ''
+
+
+class StagingFileUploadHandler(TemporaryFileUploadHandler):
+    """Strömma uppladdningen till mediarotens uppladdningskatalog och hasha den"""
+
+    def new_file(self, *args, **kwargs):
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.content_hash = self.digest.hexdigest()
+        return super().file_complete(file_size)
+
+
+def finalize_upload(uploaded_file, path) -> Tuple[int, str]:
+    """
+    Spara en uppladdad fil på path.
+
+    Temporära filer flyttas (eller kopieras i kärnan) och ersätter path
+    atomärt; filer i minnet skrivs block för block. Den uppladdade filen ska
+    inte användas efteråt.
+
+    Returns:
+        Tuple (antal bytes, SHA-256)
+    """
+    if not hasattr(uploaded_file, 'temporary_file_path'):
+        return write_chunks(uploaded_file.chunks(), path)
+
+    path = os.fspath(path)
+    uploaded_file.file.flush()
+    temp_path = uploaded_file.temporary_file_path()
+    size = os.fstat(uploaded_file.file.fileno()).st_size
+    content_hash = getattr(uploaded_file, 'content_hash', '') or hash_file(temp_path)
+
+    move_into_place(temp_path, path, uploaded_file.file.fileno(), size)
+    uploaded_file.close()
+    return size, content_hash
+
+
+def move_into_place(temp_path, path, source_fd: int = None, size: int = None) -> None:
+    """
+    Flytta temp_path till path med os.replace, eller kopiera den i kärnan om
+    filerna ligger på olika filsystem. path ersätts atomärt i båda fallen.
+
+    Args:
+        source_fd: Öppen fildeskriptor för temp_path (öppnas annars här)
+        size: Filens storlek (läses annars med fstat)
+    """
+    temp_path = os.fspath(temp_path)
+    path = os.fspath(path)
+    try:
+        os.replace(temp_path, path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    else:
+        # mkstemp skapar filen med 0600 - ge den samma rättigheter som andra mediafiler
+        os.chmod(path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+        return
+
+    if source_fd is None:
+        with open(temp_path, 'rb') as source:
+            _copy_into_place(source.fileno(), path, os.fstat(source.fileno()).st_size)
+        os.unlink(temp_path)
+    else:
+        _copy_into_place(source_fd, path, os.fstat(source_fd).st_size if size is None else size)
+
+
+def _copy_into_place(source_fd: int, path: str, size: int) -> None:
+    """Kopiera till en temporär fil i målkatalogen och byt sedan namn"""
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f'.{os.path.basename(path)}.'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            copy_fd(source_fd, destination.fileno(), size)
+        os.chmod(temp_path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def copy_fd(source_fd: int, destination_fd: int, size: int) -> None:
+    """
+    Kopiera size bytes från början av source_fd till destination_fd.
+
+    Provar copy_file_range, sedan sendfile och sist en vanlig läs/skriv-loop.
+    """
+    for copy in (_copy_file_range, _sendfile):
+        try:
+            if copy(source_fd, destination_fd, size):
+                return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+        # Börja om från början med nästa metod
+        os.lseek(destination_fd, 0, os.SEEK_SET)
+        os.ftruncate(destination_fd, 0)
+
+    os.lseek(source_fd, 0, os.SEEK_SET)
+    with open(source_fd, 'rb', closefd=False) as source, \
+            open(destination_fd, 'wb', closefd=False) as destination:
+        shutil.copyfileobj(source, destination, CHUNK_SIZE)
+
+
+def _copy_file_range(source_fd: int, destination_fd: int, size: int) -> bool:
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(source_fd, destination_fd, size - offset, offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+    return offset == size
+
+
+def _sendfile(source_fd: int, destination_fd: int, size: int) -> bool:
+    if not hasattr(os, 'sendfile'):
+        return False
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(destination_fd, source_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+    return offset == size
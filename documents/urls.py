@@ -2,7 +2,9 @@ from django.urls import path
 from .views import (
     DocumentTypeListView, DocumentTypeCreateView, DocumentTypeUpdateView, DocumentTypeDeleteView,
     DocumentCreateView, DocumentUpdateView, DocumentDeleteView, DocumentViewUpdateView,
-    document_download
+    document_download, DocumentSearchView, UploadSessionCreateView, UploadSessionView, UploadChunkView,
+    UploadFinalizeView, ExifBatchView, ExifBatchJobView, ExifBatchJobStatusView, TagListView,
+    TagRetagView
 )
 
 app_name = 'documents'
@@ -16,8 +18,24 @@ urlpatterns = [
 
     # Document URLs
     path('create/', DocumentCreateView.as_view(), name='create'),
+    path('search/', DocumentSearchView.as_view(), name='search'),
     path('<int:pk>/', DocumentViewUpdateView.as_view(), name='view'),
     path('<int:pk>/edit/', DocumentUpdateView.as_view(), name='update'),
     path('<int:pk>/delete/', DocumentDeleteView.as_view(), name='delete'),
     path('<int:pk>/download/', document_download, name='download'),
+
+    # Taggar
+    path('tags/', TagListView.as_view(), name='tags'),
+    path('tags/retag/', TagRetagView.as_view(), name='retag'),
+
+    # EXIF för många bilder
+    path('exif-batch/', ExifBatchView.as_view(), name='exif_batch'),
+    path('exif-batch/<int:pk>/', ExifBatchJobView.as_view(), name='exif_batch_job'),
+    path('exif-batch/<int:pk>/status/', ExifBatchJobStatusView.as_view(), name='exif_batch_status'),
+
+    # Uppladdning i delar
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload_create'),
+    path('uploads/<uuid:pk>/', UploadSessionView.as_view(), name='upload_session'),
+    path('uploads/<uuid:pk>/finalize/', UploadFinalizeView.as_view(), name='upload_finalize'),
+    path('uploads/<uuid:pk>/<int:offset>/', UploadChunkView.as_view(), name='upload_chunk'),
 ]
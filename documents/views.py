@@ -2,15 +2,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
-from django.urls import reverse_lazy
-from django.http import HttpResponse, FileResponse, Http404
-from .models import DocumentType, Document
-from .forms import DocumentTypeForm, DocumentForm, DocumentViewForm
+from django.views import View
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, TemplateView, FormView
+from django.urls import reverse, reverse_lazy
+from django.http import HttpResponse, Http404, JsonResponse
+from django.conf import settings
+from .models import DocumentType, Document, ExifBatchJob, UploadSession
+from . import chunked, exif_batch, search, tagging
+from .forms import DocumentTypeForm, DocumentForm, DocumentViewForm, ExifBatchForm
+from .delivery import serve_file
+from .exif_utils import extract_exif
+from .hashing import break_hardlink, document_path, hash_file
+from .uploads import finalize_upload
 from persons.models import Person
-from core.utils import get_media_root
+from core.utils import IMAGE_TYPES, get_media_root
 import os
-import mimetypes
 
 
 # DocumentType views
@@ -128,13 +134,12 @@ class DocumentCreateView(LoginRequiredMixin, CreateView):
                 relative_path
             )
 
-            # Skriv uppladdad fil till disk
-            with open(file_path, 'wb') as f:
-                for chunk in uploaded_file.chunks():
-                    f.write(chunk)
+            # Flytta uppladdad fil på plats (eller skriv den från minnet) och hasha den
+            document.file_size, document.content_hash = finalize_upload(
+                uploaded_file, file_path
+            )
 
-            # Sätt filstorlek och filtyp
-            document.file_size = os.path.getsize(file_path)
+            # Sätt filtyp
             _, ext = os.path.splitext(document.filename)
             document.file_type = ext.lstrip('.').lower()
 
@@ -161,8 +166,9 @@ class DocumentCreateView(LoginRequiredMixin, CreateView):
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(text_content)
 
-                # Sätt filstorlek och filtyp manuellt
+                # Sätt filstorlek, hash och filtyp manuellt
                 document.file_size = os.path.getsize(file_path)
+                document.content_hash = hash_file(file_path)
                 _, ext = os.path.splitext(document.filename)
                 document.file_type = ext.lstrip('.').lower()
 
@@ -240,11 +246,14 @@ class DocumentUpdateView(LoginRequiredMixin, UpdateView):
                 self.object.filename
             )
             try:
+                # Filen kan vara en hård länk delad med andra dokument
+                break_hardlink(file_path)
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(text_content)
 
-                # Uppdatera filstorlek
+                # Uppdatera filstorlek och hash
                 self.object.file_size = os.path.getsize(file_path)
+                self.object.content_hash = hash_file(file_path)
             except Exception as e:
                 messages.error(self.request, f'Kunde inte spara filen: {e}')
                 return self.form_invalid(form)
@@ -322,30 +331,23 @@ class DocumentViewUpdateView(LoginRequiredMixin, UpdateView):
             except Exception as e:
                 initial['file_content'] = f'Kunde inte läsa filen: {e}\nSökväg: {file_path if "file_path" in locals() else "okänd"}'
 
-        # Läs EXIF-data för bilder
-        if self.object.file_type in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-            try:
-                from pathlib import Path
-                from .exif_utils import read_exif_data, get_common_exif_fields
-
-                # Konstruera filsökväg
-                file_path = Path(self.object.person.get_full_directory_path()) / self.object.relative_path
-
-                if file_path.exists():
-                    exif_data = read_exif_data(file_path)
-                    common_exif = get_common_exif_fields(exif_data)
-
-                    # Fyll i EXIF-fält i formuläret
-                    initial['exif_datetime'] = common_exif.get('DateTime', '')
-                    initial['exif_datetime_original'] = common_exif.get('DateTimeOriginal', '')
-                    initial['exif_make'] = common_exif.get('Make', '')
-                    initial['exif_model'] = common_exif.get('Model', '')
-                    initial['exif_artist'] = common_exif.get('Artist', '')
-                    initial['exif_copyright'] = common_exif.get('Copyright', '')
-                    initial['exif_description'] = common_exif.get('ImageDescription', '')
-
-            except Exception as e:
-                print(f'Kunde inte läsa EXIF-data: {e}')
+        # Fyll i EXIF-fält för bilder från de sparade värdena
+        if self.object.file_type in IMAGE_TYPES:
+            exif = self.object.exif
+            if exif is None:
+                # Ännu inte extraherad (äldre dokument) - gör det en gång och spara
+                exif = extract_exif(document_path(self.object))
+                if exif is not None:
+                    Document.objects.filter(pk=self.object.pk).update(exif=exif)
+            exif = exif or {}
+
+            initial['exif_datetime'] = exif.get('DateTime', '')
+            initial['exif_datetime_original'] = exif.get('DateTimeOriginal', '')
+            initial['exif_make'] = exif.get('Make', '')
+            initial['exif_model'] = exif.get('Model', '')
+            initial['exif_artist'] = exif.get('Artist', '')
+            initial['exif_copyright'] = exif.get('Copyright', '')
+            initial['exif_description'] = exif.get('ImageDescription', '')
 
         return initial
 
@@ -353,7 +355,7 @@ class DocumentViewUpdateView(LoginRequiredMixin, UpdateView):
         context = super().get_context_data(**kwargs)
         context['is_text_file'] = self.object.file and self.object.file_type in ['txt', 'md']
         context['is_pdf'] = self.object.file and self.object.file_type == 'pdf'
-        context['is_image'] = self.object.file and self.object.file_type in ['jpg', 'jpeg', 'png', 'gif', 'bmp']
+        context['is_image'] = self.object.file and self.object.file_type in IMAGE_TYPES
 
         # För bilder, lägg till personens information för auto-ifyllning av metadata
         if context['is_image']:
@@ -442,18 +444,21 @@ class DocumentViewUpdateView(LoginRequiredMixin, UpdateView):
                     # Skapa katalogstruktur om den inte finns
                     file_path.parent.mkdir(parents=True, exist_ok=True)
 
-                    # Skriv till filen
+                    # Skriv till filen (som kan vara en hård länk delad med andra dokument)
+                    break_hardlink(file_path)
                     with open(file_path, 'w', encoding='utf-8') as f:
                         f.write(file_content)
+                    self.object.file_size = os.path.getsize(file_path)
+                    self.object.content_hash = hash_file(file_path)
                     messages.success(self.request, f'Textfilen har sparats')
                 except Exception as e:
                     messages.error(self.request, f'Kunde inte spara filen: {e}')
                     return self.form_invalid(form)
 
         # Hantera EXIF-data för bilder
-        if self.object.file_type in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+        if self.object.file_type in IMAGE_TYPES:
             try:
-                from .exif_utils import write_exif_data
+                from .exif_utils import EXIF_WRITABLE_TYPES, write_exif_data
 
                 # Samla EXIF-data från formuläret
                 exif_updates = {
@@ -469,11 +474,21 @@ class DocumentViewUpdateView(LoginRequiredMixin, UpdateView):
                 # Ta bort tomma värden
                 exif_updates = {k: v for k, v in exif_updates.items() if v}
 
-                if exif_updates:
+                if exif_updates and self.object.file_type not in EXIF_WRITABLE_TYPES:
+                    messages.warning(
+                        self.request,
+                        'EXIF-data kan bara ändras i JPEG- och PNG-bilder; filen har inte ändrats'
+                    )
+                elif exif_updates:
                     # Skriv EXIF-data till filen
                     file_path = Path(self.object.person.get_full_directory_path()) / self.object.relative_path
                     if file_path.exists():
+                        # Filen ersätts med en ny, så hårda länkar påverkas inte
                         if write_exif_data(file_path, exif_updates):
+                            self.object.file_size = file_path.stat().st_size
+                            self.object.content_hash = hash_file(file_path)
+                            # Extraheras på nytt när dokumentet sparas
+                            self.object.exif = None
                             messages.success(self.request, 'EXIF-data har uppdaterats')
                         else:
                             messages.warning(self.request, 'Kunde inte uppdatera EXIF-data')
@@ -500,6 +515,165 @@ class DocumentViewUpdateView(LoginRequiredMixin, UpdateView):
         return reverse_lazy('documents:view', kwargs={'pk': self.object.pk})
 
 
+class DocumentSearchView(LoginRequiredMixin, TemplateView):
+    """Fulltextsökning i dokumentens text, rankad med utdrag"""
+    template_name = 'documents/document_search.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        context['query'] = query
+        context['results'] = search.search(self.request.user, query) if query else []
+        context['searchable_types'] = search.indexable_types()
+        return context
+
+
+class TagListView(LoginRequiredMixin, ListView):
+    """Taggmoln med antal dokument och, för en vald tagg, dokumenten med taggen"""
+    template_name = 'documents/tag_list.html'
+    context_object_name = 'documents'
+    paginate_by = 50
+
+    def get_queryset(self):
+        self.tag = self.request.GET.get('tag', '').strip()
+        self.person = None
+        person_id = self.request.GET.get('person', '')
+        if person_id.isdigit():
+            self.person = get_object_or_404(Person, pk=person_id, user=self.request.user)
+
+        if not self.tag:
+            return Document.objects.none()
+        documents = Document.objects.filter(person__user=self.request.user)
+        if self.person:
+            documents = documents.filter(person=self.person)
+        return tagging.filter_by_tag(documents, self.tag).select_related(
+            'person', 'document_type'
+        ).order_by('person__surname', 'person__firstname', 'filename')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['tag_cloud'] = tagging.tag_cloud(self.request.user, self.person)
+        context['tag'] = self.tag
+        context['tag_key'] = tagging.tag_key(self.tag)
+        context['person'] = self.person
+        return context
+
+
+class TagRetagView(LoginRequiredMixin, View):
+    """Byt namn på, slå ihop eller ta bort en tagg i alla användarens dokument"""
+
+    def post(self, request):
+        from urllib.parse import urlencode
+
+        action = request.POST.get('action')
+        tag = request.POST.get('tag', '').strip()
+        new_name = request.POST.get('new_name', '').strip()
+        tags_url = reverse('documents:tags')
+        if not tag:
+            messages.error(request, 'Ingen tagg angiven.')
+            return redirect(tags_url)
+
+        if action == 'rename':
+            if not tagging.parse_tags(new_name):
+                messages.error(request, 'Ange det nya namnet på taggen.')
+                return redirect(f'{tags_url}?{urlencode({"tag": tag})}')
+            new_name = tagging.parse_tags(new_name)[0]
+            changed = tagging.rename_tag(request.user, tag, new_name)
+            messages.success(request, f'Taggen "{tag}" heter nu "{new_name}" ({changed} dokument ändrade).')
+            return redirect(f'{tags_url}?{urlencode({"tag": new_name})}')
+
+        if action == 'remove':
+            documents = tagging.filter_by_tag(Document.objects.filter(person__user=request.user), tag)
+            changed = tagging.retag(request.user, documents, remove=[tag])
+            messages.success(request, f'Taggen "{tag}" togs bort från {changed} dokument.')
+            return redirect(tags_url)
+
+        messages.error(request, 'Okänd åtgärd.')
+        return redirect(tags_url)
+
+
+class ExifBatchView(LoginRequiredMixin, FormView):
+    """
+    Sätt samma EXIF-fält i många bilder: markerade bilder (?documents=1,2),
+    en persons bilder (?person=) och/eller bilder med en tagg (?tag=).
+    """
+    template_name = 'documents/exif_batch_form.html'
+    form_class = ExifBatchForm
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+    def get_initial(self):
+        initial = super().get_initial()
+        for key in ('documents', 'person', 'tag'):
+            if self.request.GET.get(key):
+                initial[key] = self.request.GET[key]
+        return initial
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = context['form']
+        context['image_count'] = self._selected_images(
+            form.data if form.is_bound else self.request.GET
+        ).count()
+        context['recent_jobs'] = ExifBatchJob.objects.filter(user=self.request.user)[:5]
+        return context
+
+    def _selected_images(self, data):
+        """Bilderna som urvalet i data (GET eller formulärdata) pekar ut"""
+        try:
+            document_ids = [int(pk) for pk in data.get('documents', '').split(',') if pk.strip()] or None
+            person_id = int(data['person']) if data.get('person') else None
+        except ValueError:
+            return Document.objects.none()
+        return exif_batch.select_images(self.request.user, document_ids, person_id, data.get('tag', ''))
+
+    def form_valid(self, form):
+        images = exif_batch.select_images(
+            self.request.user,
+            form.cleaned_data['documents'],
+            form.cleaned_data['person'],
+            form.cleaned_data['tag'],
+        )
+        if not images.exists():
+            messages.error(self.request, 'Inga bilder matchar urvalet.')
+            return self.form_invalid(form)
+
+        job = exif_batch.start_batch(self.request.user, images, form.get_exif_updates())
+        messages.success(self.request, f'EXIF-data uppdateras i {job.total} bilder.')
+        return redirect('documents:exif_batch_job', pk=job.pk)
+
+
+class ExifBatchJobView(LoginRequiredMixin, DetailView):
+    """Förloppet för en EXIF-ändring; sidan hämtar status tills jobbet är klart"""
+    model = ExifBatchJob
+    template_name = 'documents/exif_batch_job.html'
+    context_object_name = 'job'
+
+    def get_queryset(self):
+        return ExifBatchJob.objects.filter(user=self.request.user)
+
+
+class ExifBatchJobStatusView(LoginRequiredMixin, View):
+    """Förloppet för en EXIF-ändring som JSON"""
+
+    def get(self, request, pk):
+        job = get_object_or_404(ExifBatchJob, pk=pk, user=request.user)
+        return JsonResponse({
+            'success': True,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'finished': job.is_finished,
+            'total': job.total,
+            'processed': job.processed,
+            'failed': job.failed,
+            'percent': job.percent,
+            'errors': job.errors,
+        })
+
+
 @login_required
 def document_download(request, pk):
     """Ladda ner ett dokument"""
@@ -519,21 +693,112 @@ def document_download(request, pk):
         document.filename
     )
 
-    # Kontrollera att filen finns
-    if not os.path.exists(file_path):
+    # Skicka filen (villkorlig GET, Range och ev. X-Sendfile, se delivery.py)
+    try:
+        return serve_file(request, file_path, document.filename)
+    except FileNotFoundError:
         messages.error(request, f'Filen kunde inte hittas: {document.filename}')
         return redirect('persons:detail', pk=document.person.pk)
-
-    # Bestäm MIME-typ
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if mime_type is None:
-        mime_type = 'application/octet-stream'
-
-    # Öppna och returnera filen
-    try:
-        response = FileResponse(open(file_path, 'rb'), content_type=mime_type)
-        response['Content-Disposition'] = f'attachment; filename="{document.filename}"'
-        return response
     except Exception as e:
         messages.error(request, f'Kunde inte ladda ner filen: {str(e)}')
         return redirect('persons:detail', pk=document.person.pk)
+
+
+# Uppladdning i delar (se chunked.py)
+def _upload_status(session):
+    """JSON-beskrivning av en uppladdning, för att kunna återuppta den"""
+    received = chunked.received_ranges(session)
+    missing = chunked.missing_ranges(received, session.total_size)
+    return {
+        'success': True,
+        'id': str(session.pk),
+        'filename': session.filename,
+        'size': session.total_size,
+        'chunk_size': settings.DOCUMENT_UPLOAD_CHUNK_SIZE,
+        'url': reverse('documents:upload_session', kwargs={'pk': session.pk}),
+        'finalize_url': reverse('documents:upload_finalize', kwargs={'pk': session.pk}),
+        'received': received,
+        'missing': missing,
+        'complete': not missing,
+    }
+
+
+def _upload_error(error):
+    return JsonResponse({'success': False, 'error': str(error)}, status=error.status)
+
+
+class UploadSessionCreateView(LoginRequiredMixin, View):
+    """Starta en uppladdning i delar"""
+
+    def post(self, request):
+        try:
+            person_id = int(request.POST.get('person', ''))
+            size = int(request.POST.get('size', ''))
+            document_type_id = int(request.POST.get('document_type') or 0)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'person och size måste anges.'}, status=400)
+        person = get_object_or_404(Person, pk=person_id, user=request.user)
+
+        document_type = None
+        if document_type_id:
+            document_type = get_object_or_404(DocumentType, pk=document_type_id)
+
+        try:
+            session = chunked.create_session(
+                person, request.POST.get('filename', ''), size, document_type
+            )
+        except chunked.UploadError as e:
+            return _upload_error(e)
+        return JsonResponse(_upload_status(session), status=201)
+
+
+class UploadSessionView(LoginRequiredMixin, View):
+    """Status för en uppladdning (GET) eller avbryt den (DELETE)"""
+
+    def get(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, person__user=request.user)
+        return JsonResponse(_upload_status(session))
+
+    def delete(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, person__user=request.user)
+        chunked.abort_session(session)
+        return JsonResponse({'success': True})
+
+
+class UploadChunkView(LoginRequiredMixin, View):
+    """Ta emot en del av en uppladdning; body är delens byte"""
+
+    def put(self, request, pk, offset):
+        session = get_object_or_404(UploadSession, pk=pk, person__user=request.user)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or '')
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Content-Length saknas.'}, status=411)
+
+        try:
+            chunked.write_chunk(session, offset, request, length)
+        except chunked.UploadError as e:
+            return _upload_error(e)
+        return JsonResponse({'success': True, 'start': offset, 'end': offset + length})
+
+
+class UploadFinalizeView(LoginRequiredMixin, View):
+    """Avsluta en uppladdning och skapa dokumentet"""
+
+    def post(self, request, pk):
+        session = get_object_or_404(
+            UploadSession.objects.select_related('person', 'document_type'),
+            pk=pk, person__user=request.user
+        )
+        try:
+            document = chunked.finalize_session(session, request.POST.get('sha256', ''))
+        except chunked.UploadError as e:
+            return _upload_error(e)
+        return JsonResponse({
+            'success': True,
+            'document': {
+                'id': document.pk,
+                'filename': document.filename,
+                'url': reverse('documents:view', kwargs={'pk': document.pk}),
+            },
+        })
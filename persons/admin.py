@@ -1,9 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.db.models import Count, Q
 from .models import (
     Person, PersonRelationship,
-    ChecklistTemplate, ChecklistTemplateItem, PersonChecklistItem
+    ChecklistTemplate, ChecklistTemplateItem, PersonChecklistItem,
+    ChecklistCompletionDaily
 )
+from . import checklist_bulk, checklist_store, checklist_sync
 
 
 @admin.register(Person)
@@ -27,10 +29,9 @@ class PersonAdmin(admin.ModelAdmin):
 
     def checklist_progress(self, obj):
         """Visa checklistframsteg i procent"""
-        total = obj.checklist_items.count()
+        total, completed = checklist_store.get_checklist_totals(obj)
         if total == 0:
             return '-'
-        completed = obj.checklist_items.filter(is_completed=True).count()
         percentage = int((completed / total) * 100)
         return f'{completed}/{total} ({percentage}%)'
     checklist_progress.short_description = 'Checklista'
@@ -84,6 +85,32 @@ class ChecklistTemplateAdmin(admin.ModelAdmin):
         return obj.items.count()
     item_count.short_description = 'Antal objekt'
 
+    actions = ['sync_to_persons', 'preview_sync']
+
+    def _sync_summary(self, diff):
+        removed = sum(entry['to_remove'] for entry in diff)
+        preserved = sum(entry['preserved'] for entry in diff)
+        return f'{removed} orörda rader att ta bort ({preserved} påbörjade bevaras)'
+
+    def sync_to_persons(self, request, queryset):
+        diff = checklist_sync.reconcile(templates=queryset)
+        self.message_user(request, f'Synkning klar: {self._sync_summary(diff)}.')
+    sync_to_persons.short_description = 'Synka personernas checklistor mot valda mallar'
+
+    def preview_sync(self, request, queryset):
+        diff = checklist_sync.reconcile(templates=queryset, dry_run=True)
+        if not diff:
+            self.message_user(request, 'Alla personers checklistor är redan synkade med valda mallar.')
+            return
+        self.message_user(request, f'Förhandsgranskning: {self._sync_summary(diff)}.')
+        for entry in diff:
+            self.message_user(
+                request,
+                f'{entry["item"]}: -{entry["to_remove"]}',
+                level=messages.INFO
+            )
+    preview_sync.short_description = 'Förhandsgranska synkning (ändrar ingenting)'
+
 
 @admin.register(ChecklistTemplateItem)
 class ChecklistTemplateItemAdmin(admin.ModelAdmin):
@@ -153,11 +180,25 @@ class PersonChecklistItemAdmin(admin.ModelAdmin):
     is_custom_display.boolean = True
 
     def mark_completed(self, request, queryset):
-        updated = queryset.update(is_completed=True)
+        updated = checklist_bulk.mark_items(queryset, True)
         self.message_user(request, f'{updated} objekt markerade som avklarade.')
     mark_completed.short_description = 'Markera valda som avklarade'
 
     def mark_incomplete(self, request, queryset):
-        updated = queryset.update(is_completed=False)
+        updated = checklist_bulk.mark_items(queryset, False)
         self.message_user(request, f'{updated} objekt markerade som ej avklarade.')
     mark_incomplete.short_description = 'Markera valda som ej avklarade'
+
+
+@admin.register(ChecklistCompletionDaily)
+class ChecklistCompletionDailyAdmin(admin.ModelAdmin):
+    """Skrivskyddad vy - tabellen underhålls av persons.checklist_rollups"""
+    list_display = ['date', 'user', 'category', 'template', 'completed']
+    list_filter = ['user', 'category', 'template']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,353 @@
+"""
+Closure-tabell för anor och ättlingar.
+
+PersonAncestry innehåller en rad per (ana, ättling) med kortaste
+generationsavstånd. Tabellen underhålls inkrementellt när förälder/barn-
+relationer skapas eller tas bort och kan byggas om helt med
+``manage.py rebuild_ancestry``. Om ANCESTRY_CLOSURE_ENABLED är avstängd
+faller frågefunktionerna tillbaka på en generationsvis genomgång av
+PersonRelationship.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Person, PersonAncestry, PersonRelationship, RelationshipType
+
+BATCH_SIZE = 1000
+
+
+def is_enabled():
+    """Returnera True om closure-tabellen används"""
+    return getattr(settings, 'ANCESTRY_CLOSURE_ENABLED', True)
+
+
+def _parent_child_filter():
+    """Q-objekt som matchar alla förälder/barn-relationer"""
+    return Q(relationship_a_to_b__in=[RelationshipType.PARENT, RelationshipType.CHILD])
+
+
+def _edge(person_a_id, person_b_id, relationship_a_to_b):
+    """Översätt en relationsrad till (förälder_id, barn_id) eller None"""
+    if relationship_a_to_b == RelationshipType.PARENT:
+        return person_a_id, person_b_id
+    if relationship_a_to_b == RelationshipType.CHILD:
+        return person_b_id, person_a_id
+    return None
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _parents_of(child_ids):
+    """Hämta {barn_id: set(förälder_id)} för angivna barn"""
+    parents = {}
+    for chunk in _chunks(child_ids):
+        rows = PersonRelationship.objects.filter(
+            Q(person_b_id__in=chunk, relationship_a_to_b=RelationshipType.PARENT) |
+            Q(person_a_id__in=chunk, relationship_a_to_b=RelationshipType.CHILD)
+        ).values_list('person_a_id', 'person_b_id', 'relationship_a_to_b')
+        for row in rows:
+            parent_id, child_id = _edge(*row)
+            parents.setdefault(child_id, set()).add(parent_id)
+    return parents
+
+
+def _children_of(parent_ids):
+    """Hämta {förälder_id: set(barn_id)} för angivna föräldrar"""
+    children = {}
+    for chunk in _chunks(parent_ids):
+        rows = PersonRelationship.objects.filter(
+            Q(person_a_id__in=chunk, relationship_a_to_b=RelationshipType.PARENT) |
+            Q(person_b_id__in=chunk, relationship_a_to_b=RelationshipType.CHILD)
+        ).values_list('person_a_id', 'person_b_id', 'relationship_a_to_b')
+        for row in rows:
+            parent_id, child_id = _edge(*row)
+            children.setdefault(parent_id, set()).add(child_id)
+    return children
+
+
+def _walk(start_id, neighbours_of):
+    """Generationsvis genomgång (en fråga per generation) -> {person_id: djup}"""
+    depths = {}
+    frontier = {start_id}
+    depth = 0
+    while frontier:
+        depth += 1
+        neighbours = neighbours_of(frontier)
+        next_frontier = set()
+        for person_id in frontier:
+            for other_id in neighbours.get(person_id, ()):
+                if other_id != start_id and other_id not in depths:
+                    depths[other_id] = depth
+                    next_frontier.add(other_id)
+        frontier = next_frontier
+    return depths
+
+
+def _compute_ancestors(node_ids, parents, known):
+    """
+    Beräkna {ana_id: djup} för varje nod i node_ids.
+
+    parents innehåller föräldrar för noderna; known innehåller redan
+    kända anor för föräldrar utanför node_ids. Cykler i datan bryts.
+    """
+    result = {}
+    in_progress = set()
+
+    def visit(node_id):
+        if node_id in result:
+            return result[node_id]
+        if node_id not in node_ids:
+            return known.get(node_id, {})
+        if node_id in in_progress:
+            return {}
+        in_progress.add(node_id)
+
+        ancestors = {}
+        for parent_id in parents.get(node_id, ()):
+            if parent_id == node_id:
+                continue
+            candidates = {parent_id: 0}
+            candidates.update(visit(parent_id))
+            for ancestor_id, depth in candidates.items():
+                if ancestor_id == node_id:
+                    continue
+                if depth + 1 < ancestors.get(ancestor_id, depth + 2):
+                    ancestors[ancestor_id] = depth + 1
+
+        in_progress.discard(node_id)
+        result[node_id] = ancestors
+        return ancestors
+
+    for node_id in node_ids:
+        visit(node_id)
+    return result
+
+
+def _recompute(node_ids):
+    """Räkna om alla anrader för angivna noder från aktuella relationer"""
+    node_ids = set(Person.objects.filter(id__in=node_ids).values_list('id', flat=True))
+    if not node_ids:
+        return
+
+    for chunk in _chunks(node_ids):
+        PersonAncestry.objects.filter(descendant_id__in=chunk).delete()
+
+    parents = _parents_of(node_ids)
+    external = {
+        parent_id
+        for parent_ids in parents.values()
+        for parent_id in parent_ids
+        if parent_id not in node_ids
+    }
+    known = {}
+    for chunk in _chunks(external):
+        rows = PersonAncestry.objects.filter(descendant_id__in=chunk).values_list(
+            'descendant_id', 'ancestor_id', 'depth'
+        )
+        for descendant_id, ancestor_id, depth in rows:
+            known.setdefault(descendant_id, {})[ancestor_id] = depth
+
+    computed = _compute_ancestors(node_ids, parents, known)
+    PersonAncestry.objects.bulk_create(
+        [
+            PersonAncestry(ancestor_id=ancestor_id, descendant_id=node_id, depth=depth)
+            for node_id, ancestors in computed.items()
+            for ancestor_id, depth in ancestors.items()
+        ],
+        batch_size=BATCH_SIZE
+    )
+
+
+def add_parent_edge(parent_id, child_id):
+    """
+    Lägg till anrader för en ny förälder -> barn-kant.
+
+    Alla anor till föräldern (inklusive föräldern) blir anor till alla
+    ättlingar till barnet (inklusive barnet).
+    """
+    if not is_enabled() or parent_id == child_id:
+        return
+
+    with transaction.atomic():
+        ups = {parent_id: 0}
+        ups.update(dict(
+            PersonAncestry.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+        ))
+        downs = {child_id: 0}
+        downs.update(dict(
+            PersonAncestry.objects.filter(ancestor_id=child_id).values_list('descendant_id', 'depth')
+        ))
+
+        wanted = {}
+        for ancestor_id, up_depth in ups.items():
+            for descendant_id, down_depth in downs.items():
+                if ancestor_id != descendant_id:
+                    wanted[(ancestor_id, descendant_id)] = up_depth + down_depth + 1
+
+        existing = {}
+        for chunk in _chunks(ups):
+            rows = PersonAncestry.objects.filter(
+                ancestor_id__in=chunk, descendant_id__in=list(downs)
+            )
+            for row in rows:
+                existing[(row.ancestor_id, row.descendant_id)] = row
+
+        to_update = []
+        to_create = []
+        for (ancestor_id, descendant_id), depth in wanted.items():
+            row = existing.get((ancestor_id, descendant_id))
+            if row is None:
+                to_create.append(PersonAncestry(
+                    ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth
+                ))
+            elif depth < row.depth:
+                row.depth = depth
+                to_update.append(row)
+
+        PersonAncestry.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        PersonAncestry.objects.bulk_update(to_update, ['depth'], batch_size=BATCH_SIZE)
+
+
+def remove_parent_edge(parent_id, child_id):
+    """
+    Ta bort en förälder -> barn-kant ur closure-tabellen.
+
+    Endast barnet och dess ättlingar kan påverkas, så deras anrader räknas
+    om från aktuella relationer (kanten ska redan vara borttagen).
+    """
+    if not is_enabled():
+        return
+
+    with transaction.atomic():
+        affected = {child_id}
+        affected.update(
+            PersonAncestry.objects.filter(ancestor_id=child_id).values_list('descendant_id', flat=True)
+        )
+        _recompute(affected)
+
+
+def forget_person(person_id):
+    """
+    Förbered borttagning av en person: returnera ättlingarna vars anrader
+    måste räknas om när personen och dess relationer är borta.
+    """
+    if not is_enabled():
+        return set()
+    return set(
+        PersonAncestry.objects.filter(ancestor_id=person_id).values_list('descendant_id', flat=True)
+    )
+
+
+def collect_subtrees(child_ids):
+    """Returnera angivna personer och alla deras ättlingar"""
+    if not is_enabled() or not child_ids:
+        return set()
+    affected = set(child_ids)
+    for chunk in _chunks(child_ids):
+        affected.update(
+            PersonAncestry.objects.filter(ancestor_id__in=chunk).values_list('descendant_id', flat=True)
+        )
+    return affected
+
+
+def recompute_descendants(descendant_ids):
+    """Räkna om anrader för personer vars ana har tagits bort"""
+    if not is_enabled() or not descendant_ids:
+        return
+    with transaction.atomic():
+        _recompute(descendant_ids)
+
+
+def rebuild(user=None):
+    """
+    Bygg om closure-tabellen helt, för en användare eller alla.
+
+    Returns:
+        Antal skapade rader
+    """
+    persons = Person.objects.all()
+    relationships = PersonRelationship.objects.filter(_parent_child_filter())
+    if user is not None:
+        persons = persons.filter(user=user)
+        relationships = relationships.filter(user=user)
+
+    node_ids = set(persons.values_list('id', flat=True))
+    parents = {}
+    for row in relationships.values_list('person_a_id', 'person_b_id', 'relationship_a_to_b').iterator():
+        parent_id, child_id = _edge(*row)
+        parents.setdefault(child_id, set()).add(parent_id)
+
+    computed = _compute_ancestors(node_ids, parents, {})
+
+    with transaction.atomic():
+        if user is None:
+            PersonAncestry.objects.all().delete()
+        else:
+            PersonAncestry.objects.filter(descendant__user=user).delete()
+
+        rows = [
+            PersonAncestry(ancestor_id=ancestor_id, descendant_id=node_id, depth=depth)
+            for node_id, ancestors in computed.items()
+            for ancestor_id, depth in ancestors.items()
+        ]
+        PersonAncestry.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+    return len(rows)
+
+
+def get_descendant_depths(person):
+    """Returnera {person_id: generationer} för alla ättlingar"""
+    if is_enabled():
+        return dict(
+            PersonAncestry.objects.filter(ancestor=person).values_list('descendant_id', 'depth')
+        )
+    return _walk(person.id, _children_of)
+
+
+def get_ancestor_depths(person):
+    """Returnera {person_id: generationer} för alla anor"""
+    if is_enabled():
+        return dict(
+            PersonAncestry.objects.filter(descendant=person).values_list('ancestor_id', 'depth')
+        )
+    return _walk(person.id, _parents_of)
+
+
+def filter_descendants(queryset, person):
+    """Begränsa ett Person-queryset till ättlingar till person"""
+    if is_enabled():
+        return queryset.filter(ancestry_as_descendant__ancestor=person)
+    return queryset.filter(id__in=list(get_descendant_depths(person)))
+
+
+def filter_ancestors(queryset, person):
+    """Begränsa ett Person-queryset till anor till person"""
+    if is_enabled():
+        return queryset.filter(ancestry_as_ancestor__descendant=person)
+    return queryset.filter(id__in=list(get_ancestor_depths(person)))
+
+
+def count_descendants(person):
+    """Antal ättlingar till person"""
+    if is_enabled():
+        return PersonAncestry.objects.filter(ancestor=person).count()
+    return len(get_descendant_depths(person))
+
+
+def count_ancestors(person):
+    """Antal kända anor till person"""
+    if is_enabled():
+        return PersonAncestry.objects.filter(descendant=person).count()
+    return len(get_ancestor_depths(person))
+
+
+def is_ancestor(ancestor, person):
+    """Returnera True om ancestor är ana till person"""
+    if is_enabled():
+        return PersonAncestry.objects.filter(ancestor=ancestor, descendant=person).exists()
+    return ancestor.id in get_ancestor_depths(person)
@@ -0,0 +1,273 @@
+"""Rendering av antavlor (släktdiagram) till SVG och PDF med diskcache"""
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Person, PersonRelationship, RelationshipGraphVersion, RelationshipType
+
+# PDF är valfritt och kräver det rena Python-paketet fpdf2
+try:
+    from fpdf import FPDF
+except ImportError:  # pragma: no cover - beror på installerade paket
+    FPDF = None
+
+
+MIN_DEPTH = 1
+MAX_DEPTH = 12
+DEFAULT_DEPTH = 5
+
+# Öka när layouten ändras så att gamla cachefiler inte återanvänds
+RENDERER_VERSION = 1
+
+BOX_WIDTH = 220
+BOX_HEIGHT = 52
+COLUMN_GAP = 40
+ROW_GAP = 8
+MARGIN = 20
+
+# Största sidstorlek som PDF-läsare klarar (200 tum)
+PDF_MAX_SIDE = 14400
+
+CONTENT_TYPES = {
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+
+
+def pdf_available():
+    """Returnera True om en PDF-backend finns installerad"""
+    return FPDF is not None
+
+
+def get_chart_cache_root():
+    """Returnera katalogen där renderade diagram cachas"""
+    return Path(getattr(settings, 'CHART_CACHE_DIR', settings.BASE_DIR / 'cache' / 'charts'))
+
+
+def collect_ancestors(root, depth):
+    """
+    Hämta anor för root upp till depth generationer (root inräknad).
+
+    Gör en fråga per generation i stället för en per person.
+
+    Returns:
+        Dict som mappar antavlenummer (1 = root, 2n/2n+1 = föräldrar) till Person
+    """
+    numbers = {1: root.id}
+    generation = {root.id: [1]}
+
+    for _ in range(depth - 1):
+        if not generation:
+            break
+
+        child_ids = list(generation)
+        rows = PersonRelationship.objects.filter(
+            Q(person_b_id__in=child_ids, relationship_a_to_b=RelationshipType.PARENT) |
+            Q(person_a_id__in=child_ids, relationship_b_to_a=RelationshipType.PARENT)
+        ).order_by('id').values_list(
+            'person_a_id', 'person_b_id', 'relationship_a_to_b'
+        )
+
+        parents_by_child = {}
+        for person_a_id, person_b_id, a_to_b in rows:
+            if a_to_b == RelationshipType.PARENT:
+                parent_id, child_id = person_a_id, person_b_id
+            else:
+                parent_id, child_id = person_b_id, person_a_id
+            parents = parents_by_child.setdefault(child_id, [])
+            if parent_id not in parents and len(parents) < 2:
+                parents.append(parent_id)
+
+        next_generation = {}
+        for child_id, child_numbers in generation.items():
+            for index, parent_id in enumerate(parents_by_child.get(child_id, [])):
+                for number in child_numbers:
+                    parent_number = number * 2 + index
+                    numbers[parent_number] = parent_id
+                    next_generation.setdefault(parent_id, []).append(parent_number)
+        generation = next_generation
+
+    persons = Person.objects.in_bulk(set(numbers.values()))
+    return {
+        number: persons[person_id]
+        for number, person_id in numbers.items()
+        if person_id in persons
+    }
+
+
+def _layout(ancestors, depth):
+    """Beräkna rutor (x, y, person) och linjer för antavlan"""
+    slots = 2 ** (depth - 1)
+    height = slots * (BOX_HEIGHT + ROW_GAP) + 2 * MARGIN
+    width = depth * (BOX_WIDTH + COLUMN_GAP) - COLUMN_GAP + 2 * MARGIN
+
+    boxes = {}
+    for number, person in ancestors.items():
+        generation = number.bit_length() - 1
+        position = number - 2 ** generation
+        slot_height = (height - 2 * MARGIN) / 2 ** generation
+        x = MARGIN + generation * (BOX_WIDTH + COLUMN_GAP)
+        y = MARGIN + (position + 0.5) * slot_height - BOX_HEIGHT / 2
+        boxes[number] = (x, y, person)
+
+    lines = []
+    for number, (x, y, _person) in boxes.items():
+        for parent_number in (number * 2, number * 2 + 1):
+            if parent_number in boxes:
+                px, py, _ = boxes[parent_number]
+                lines.append((
+                    x + BOX_WIDTH, y + BOX_HEIGHT / 2,
+                    px, py + BOX_HEIGHT / 2,
+                ))
+
+    return width, height, boxes, lines
+
+
+def render_svg(ancestors, depth):
+    """Rendera antavlan som SVG och returnera bytes"""
+    width, height, boxes, lines = _layout(ancestors, depth)
+
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height:.0f}" '
+        f'viewBox="0 0 {width} {height:.0f}" font-family="Helvetica, Arial, sans-serif">',
+        '<g stroke="#555" stroke-width="1.5" fill="none">',
+    ]
+    for x1, y1, x2, y2 in lines:
+        mid_x = (x1 + x2) / 2
+        parts.append(
+            f'<path d="M{x1:.1f},{y1:.1f} H{mid_x:.1f} V{y2:.1f} H{x2:.1f}"/>'
+        )
+    parts.append('</g>')
+
+    for number, (x, y, person) in sorted(boxes.items()):
+        fill = '#e7e9fb' if number == 1 else '#ffffff'
+        years = person.get_years_display() or ''
+        parts.append(
+            f'<g><rect x="{x:.1f}" y="{y:.1f}" width="{BOX_WIDTH}" height="{BOX_HEIGHT}" '
+            f'rx="6" fill="{fill}" stroke="#333" stroke-width="1.5"/>'
+            f'<text x="{x + 10:.1f}" y="{y + 21:.1f}" font-size="13" font-weight="bold">'
+            f'{escape(person.get_full_name())}</text>'
+            f'<text x="{x + 10:.1f}" y="{y + 39:.1f}" font-size="11" fill="#555">'
+            f'{escape(years)}</text></g>'
+        )
+
+    parts.append('</svg>')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def render_pdf(ancestors, depth):
+    """Rendera antavlan som PDF (kräver fpdf2) och returnera bytes"""
+    if FPDF is None:
+        raise RuntimeError('PDF-rendering kräver paketet fpdf2.')
+
+    width, height, boxes, lines = _layout(ancestors, depth)
+    scale = min(1.0, PDF_MAX_SIDE / max(width, height))
+
+    def latin1(text):
+        # Standardtypsnitten i PDF stöder endast latin-1 (räcker för å, ä, ö)
+        return text.encode('latin-1', errors='replace').decode('latin-1')
+
+    pdf = FPDF(unit='pt', format=(width * scale, height * scale))
+    pdf.set_auto_page_break(False)
+    pdf.set_margin(0)
+    pdf.add_page()
+    pdf.set_line_width(1.5 * scale)
+
+    pdf.set_draw_color(85, 85, 85)
+    for x1, y1, x2, y2 in lines:
+        mid_x = (x1 + x2) / 2
+        pdf.line(x1 * scale, y1 * scale, mid_x * scale, y1 * scale)
+        pdf.line(mid_x * scale, y1 * scale, mid_x * scale, y2 * scale)
+        pdf.line(mid_x * scale, y2 * scale, x2 * scale, y2 * scale)
+
+    pdf.set_draw_color(51, 51, 51)
+    for number, (x, y, person) in sorted(boxes.items()):
+        if number == 1:
+            pdf.set_fill_color(231, 233, 251)
+        else:
+            pdf.set_fill_color(255, 255, 255)
+        pdf.rect(x * scale, y * scale, BOX_WIDTH * scale, BOX_HEIGHT * scale, style='DF')
+
+        pdf.set_font('Helvetica', 'B', 13 * scale)
+        pdf.set_text_color(0, 0, 0)
+        pdf.text((x + 10) * scale, (y + 21) * scale, latin1(person.get_full_name()))
+
+        pdf.set_font('Helvetica', '', 11 * scale)
+        pdf.set_text_color(85, 85, 85)
+        pdf.text((x + 10) * scale, (y + 39) * scale, latin1(person.get_years_display() or ''))
+
+    return bytes(pdf.output())
+
+
+def get_chart_cache_key(root, depth, chart_format, graph_version):
+    """Bygg en innehållsadress för diagrammet"""
+    key = f'{root.pk}:{depth}:{chart_format}:{graph_version}:{RENDERER_VERSION}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def get_pedigree_chart(root, depth, chart_format='svg'):
+    """
+    Hämta en antavla från diskcachen, eller rendera och cacha den.
+
+    Cachenyckeln bygger på root, antal generationer, format och användarens
+    släktgrafversion, så diagrammet genereras bara om när grafen ändrats.
+    Filerna ligger i en katalog per användare och grafversion; när en ny
+    version skrivs tas användarens äldre versioner bort.
+
+    Returns:
+        Tuple (sökväg till cachefil, cachenyckel)
+    """
+    if chart_format not in CONTENT_TYPES:
+        raise ValueError(f'Okänt diagramformat: {chart_format}')
+    if chart_format == 'pdf' and not pdf_available():
+        raise RuntimeError('PDF-rendering kräver paketet fpdf2.')
+
+    depth = max(MIN_DEPTH, min(MAX_DEPTH, depth))
+    graph_version = RelationshipGraphVersion.get_version(root.user_id)
+    cache_key = get_chart_cache_key(root, depth, chart_format, graph_version)
+
+    user_dir = get_chart_cache_root() / str(root.user_id)
+    cache_dir = user_dir / str(graph_version)
+    cache_path = cache_dir / f'{cache_key}.{chart_format}'
+    if cache_path.exists():
+        return cache_path, cache_key
+
+    ancestors = collect_ancestors(root, depth)
+    if chart_format == 'pdf':
+        content = render_pdf(ancestors, depth)
+    else:
+        content = render_svg(ancestors, depth)
+
+    # Skriv atomärt så att samtidiga förfrågningar aldrig ser en halv fil
+    new_version = not cache_dir.exists()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+    if new_version:
+        remove_old_charts(user_dir, graph_version)
+    return cache_path, cache_key
+
+
+def remove_old_charts(user_dir, graph_version):
+    """Ta bort en användares cachade diagram för äldre släktgrafversioner"""
+    for entry in user_dir.iterdir():
+        if entry.is_dir():
+            if entry.name.isdigit() and int(entry.name) < graph_version:
+                shutil.rmtree(entry, ignore_errors=True)
+        else:
+            # Filer från före versionskatalogerna
+            entry.unlink(missing_ok=True)
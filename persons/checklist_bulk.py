@@ -0,0 +1,113 @@
+"""
+Massuppdatering av avklaradstatus för checklistobjekt.
+
+Statusen sätts med en enda UPDATE som även sätter completed_at, i stället
+för save() per rad. Endast rader vars status faktiskt ändras uppdateras,
+så att completed_at för redan avklarade objekt bevaras (samma semantik som
+PersonChecklistItem.save()). Mallrader som blir orörda igen tas bort (se
+checklist_store). Ändringarna räknas per grupp i förväg och förs in i den
+dagliga statistiken (se checklist_rollups), eftersom update() inte skickar
+några signaler.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Person, PersonChecklistItem
+from .checklist_store import prune_untouched
+from . import checklist_rollups
+
+BATCH_SIZE = 1000
+
+
+def mark_items(queryset, completed):
+    """
+    Sätt avklaradstatus för alla rader i ett queryset.
+
+    Returns:
+        Antal ändrade rader
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        changing = queryset.filter(is_completed=not completed)
+        if completed:
+            deltas = checklist_rollups.count_completions(changing, day=timezone.localdate(now))
+        else:
+            deltas = checklist_rollups.subtract(checklist_rollups.count_completions(changing))
+
+        changed = changing.update(
+            is_completed=completed,
+            completed_at=now if completed else None,
+            updated_at=now,
+        )
+        checklist_rollups.apply(deltas)
+        if not completed:
+            prune_untouched(queryset)
+    return changed
+
+
+def mark_items_by_id(user, item_ids, completed):
+    """Sätt avklaradstatus för användarens checklistobjekt med angivna id:n"""
+    return mark_items(
+        PersonChecklistItem.objects.filter(id__in=item_ids, person__user=user),
+        completed
+    )
+
+
+def mark_template_item_for_persons(user, template_item, person_ids, completed):
+    """
+    Sätt avklaradstatus för ett mallsobjekt hos flera personer.
+
+    Personer som saknar raden (orört mallsobjekt) får den skapad direkt
+    som avklarad.
+
+    Returns:
+        Antal ändrade eller skapade rader
+    """
+    persons = Person.objects.filter(user=user, id__in=person_ids)
+
+    with transaction.atomic():
+        changed = mark_items(
+            PersonChecklistItem.objects.filter(template_item=template_item, person__in=persons),
+            completed
+        )
+
+        if not completed:
+            return changed
+
+        now = timezone.now()
+        missing = list(persons.filter(
+            ~Exists(PersonChecklistItem.objects.filter(
+                person=OuterRef('pk'), template_item=template_item
+            ))
+        ).values_list('id', flat=True))
+        PersonChecklistItem.objects.bulk_create(
+            [
+                PersonChecklistItem(
+                    person_id=person_id,
+                    template_item=template_item,
+                    title=template_item.title,
+                    description=template_item.description,
+                    category=template_item.category,
+                    priority=template_item.priority,
+                    order=template_item.order,
+                    is_completed=True,
+                    completed_at=now,
+                )
+                for person_id in missing
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        # bulk_create returnerar även rader som krockade och inte skapades;
+        # raderna som faktiskt skapades har just denna completed_at
+        created = PersonChecklistItem.objects.filter(
+            template_item=template_item, person_id__in=missing, completed_at=now
+        ).count()
+        checklist_rollups.apply(Counter({
+            (user.pk, timezone.localdate(now), template_item.category, template_item.template_id):
+                created
+        }))
+    return changed + created
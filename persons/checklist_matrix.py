@@ -0,0 +1,120 @@
+"""
+Matris över checklistframsteg: personer × mallsobjekt.
+
+Hela matrisen byggs från en enda fråga mot PersonChecklistItem (person,
+mallsobjekt, avklarad) som grupperas per person i Python till en kompakt
+bytearray per person. Filtrering, sortering och paginering görs sedan på
+matrisen, utan några frågor per cell.
+"""
+import csv
+
+from .models import Person, PersonChecklistItem, ChecklistTemplateItem
+
+# Cellvärden
+OPEN = 1
+DONE = 2
+
+FILTER_DONE = 'done'
+FILTER_OPEN = 'open'
+
+
+class ChecklistMatrix:
+    """Avklaradstatus för alla personer och valda mallsobjekt"""
+
+    def __init__(self, user, item_ids=None):
+        items = ChecklistTemplateItem.objects.filter(
+            template__is_active=True
+        ).select_related('template').order_by('template__name', 'order', 'title')
+        if item_ids:
+            items = items.filter(id__in=item_ids)
+        self.items = list(items)
+        self.column = {item.id: index for index, item in enumerate(self.items)}
+
+        self.persons = list(
+            Person.objects.filter(user=user).only(
+                'id', 'firstname', 'surname', 'directory_name', 'birth_date', 'death_date'
+            ).order_by('surname', 'firstname')
+        )
+
+        # Orörda mallsobjekt har ingen rad (copy-on-write) och är ej avklarade
+        width = len(self.items)
+        self.rows = {person.id: bytearray([OPEN]) * width for person in self.persons}
+
+        cells = PersonChecklistItem.objects.filter(
+            person__user=user,
+            template_item_id__in=list(self.column)
+        ).order_by().values_list('person_id', 'template_item_id', 'is_completed')
+        for person_id, template_item_id, is_completed in cells.iterator(chunk_size=5000):
+            self.rows[person_id][self.column[template_item_id]] = DONE if is_completed else OPEN
+
+    def completed_count(self, person_id):
+        return self.rows[person_id].count(DONE)
+
+    def filter(self, conditions):
+        """
+        Behåll personer som uppfyller alla villkor.
+
+        Args:
+            conditions: Lista med (mallsobjekt_id, FILTER_DONE/FILTER_OPEN)
+        """
+        checks = [
+            (self.column[item_id], wanted)
+            for item_id, wanted in conditions
+            if item_id in self.column
+        ]
+        if not checks:
+            return
+
+        def matches(row):
+            for column, wanted in checks:
+                if (row[column] == DONE) != (wanted == FILTER_DONE):
+                    return False
+            return True
+
+        self.persons = [p for p in self.persons if matches(self.rows[p.id])]
+
+    def sort(self, keys):
+        """
+        Sortera personerna efter en eller flera nycklar.
+
+        Args:
+            keys: Lista med mallsobjekt-id eller 'completed', med '-' för fallande
+        """
+        # Stabil sortering: tillämpa nycklarna baklänges
+        for key in reversed(keys):
+            descending = key.startswith('-')
+            key = key.lstrip('-')
+            if key == 'completed':
+                self.persons.sort(key=lambda p: self.completed_count(p.id), reverse=descending)
+            elif key.isdigit() and int(key) in self.column:
+                column = self.column[int(key)]
+                self.persons.sort(key=lambda p: self.rows[p.id][column], reverse=descending)
+
+    def row(self, person):
+        """Returnera (person, celler, antal avklarade) för visning eller export"""
+        cells = self.rows[person.id]
+        return person, list(cells), cells.count(DONE)
+
+
+class _Echo:
+    """Filliknande objekt som returnerar det som skrivs (för csv.writer)"""
+
+    def write(self, value):
+        return value
+
+
+CELL_LABELS = {OPEN: 'nej', DONE: 'ja'}
+
+
+def iter_csv(matrix):
+    """Generera matrisen som CSV-rader, en rad i taget"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(
+        ['Person', 'Katalognamn', 'Avklarade'] + [item.title for item in matrix.items]
+    )
+    for person in matrix.persons:
+        _, cells, completed = matrix.row(person)
+        yield writer.writerow(
+            [person.get_full_name(), person.directory_name, completed] +
+            [CELL_LABELS[cell] for cell in cells]
+        )
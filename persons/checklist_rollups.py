@@ -0,0 +1,265 @@
+"""
+Dagliga sammanställningar (rollups) av avklarade checklistobjekt.
+
+ChecklistCompletionDaily innehåller antalet avklarade objekt per
+(användare, dag, kategori, mall), där dagen är completed_at i lokal tid
+och mallen är None för anpassade objekt. Tabellen motsvarar alltid en
+gruppering av PersonChecklistItem-raderna men underhålls inkrementellt:
+
+- enskilda rader via signalerna i persons.signals (spara/radera)
+- massuppdateringar via checklist_bulk, som räknar ändringarna i förväg
+
+``rebuild`` bygger om tabellen från grunden (manage.py rebuild_checklist_rollups).
+Statistiken kan därmed läsas utan att hela checklisttabellen skannas.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    ChecklistCategory, ChecklistCompletionDaily, ChecklistTemplate, PersonChecklistItem
+)
+
+BATCH_SIZE = 1000
+
+# Perioder (dagar) som kan väljas på dashboarden
+PERIODS = [30, 90, 365]
+DEFAULT_PERIOD = 30
+
+# Längre perioder visas per vecka i stället för per dag
+WEEKLY_FROM_DAYS = 90
+
+CHART_WIDTH = 720
+CHART_HEIGHT = 160
+
+CATEGORY_COLORS = {
+    ChecklistCategory.RESEARCH: '#0d6efd',
+    ChecklistCategory.DOCUMENTS: '#198754',
+    ChecklistCategory.SOURCES: '#fd7e14',
+    ChecklistCategory.VERIFICATION: '#6f42c1',
+    ChecklistCategory.OTHER: '#6c757d',
+}
+
+
+def count_completions(queryset, day=None):
+    """
+    Räkna avklarade rader i querysetet per (användare, dag, kategori, mall).
+
+    Args:
+        queryset: PersonChecklistItem-queryset
+        day: Räkna i stället alla rader som avklarade denna dag (för rader
+             som strax ska markeras som avklarade)
+
+    Returns:
+        Counter med nycklar (user_id, date, category, template_id)
+    """
+    queryset = queryset.order_by()
+    if day is None:
+        queryset = queryset.filter(
+            is_completed=True, completed_at__isnull=False
+        ).annotate(day=TruncDate('completed_at'))
+    rows = queryset.values(
+        'person__user', 'category', 'template_item__template',
+        *(['day'] if day is None else [])
+    ).annotate(count=Count('id'))
+
+    return Counter({
+        (
+            row['person__user'],
+            row['day'] if day is None else day,
+            row['category'],
+            row['template_item__template'],
+        ): row['count']
+        for row in rows
+    })
+
+
+def apply(deltas):
+    """Lägg till (eller dra ifrån) antal i rollup-tabellen"""
+    with transaction.atomic():
+        for key, delta in deltas.items():
+            if delta:
+                _apply_delta(key, delta)
+
+
+def _apply_delta(key, delta):
+    """
+    Uppdatera en rollup-rad. Raden låses innan den ändras; skapas den
+    samtidigt av en annan transaktion görs uppdateringen om.
+    """
+    user_id, day, category, template_id = key
+    rows = ChecklistCompletionDaily.objects.filter(
+        user_id=user_id, date=day, category=category, template_id=template_id
+    )
+    while True:
+        row = rows.select_for_update().first()
+        if row is not None:
+            ChecklistCompletionDaily.objects.filter(pk=row.pk).update(
+                completed=F('completed') + delta
+            )
+            if delta < 0:
+                ChecklistCompletionDaily.objects.filter(pk=row.pk, completed__lte=0).delete()
+            return
+        if delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                ChecklistCompletionDaily.objects.create(
+                    user_id=user_id, date=day, category=category,
+                    template_id=template_id, completed=delta
+                )
+            return
+        except IntegrityError:
+            continue
+
+
+def subtract(counts):
+    """Returnera counts med omvänt tecken, för apply()"""
+    return Counter({key: -count for key, count in counts.items()})
+
+
+def difference(before, after):
+    """Ändringen mellan två räkningar, för apply()"""
+    deltas = Counter(after)
+    deltas.subtract(before)
+    return deltas
+
+
+def rebuild(user=None):
+    """
+    Bygg om rollup-tabellen från checklistraderna.
+
+    Args:
+        user: Bygg bara om för denna användare (default: alla)
+
+    Returns:
+        Antal skapade rollup-rader
+    """
+    queryset = PersonChecklistItem.objects.all()
+    rollups = ChecklistCompletionDaily.objects.all()
+    if user is not None:
+        queryset = queryset.filter(person__user=user)
+        rollups = rollups.filter(user=user)
+
+    with transaction.atomic():
+        rollups.delete()
+        created = ChecklistCompletionDaily.objects.bulk_create(
+            [
+                ChecklistCompletionDaily(
+                    user_id=user_id, date=day, category=category,
+                    template_id=template_id, completed=count
+                )
+                for (user_id, day, category, template_id), count in
+                count_completions(queryset).items()
+            ],
+            batch_size=BATCH_SIZE
+        )
+    return len(created)
+
+
+def get_trend(user, days=DEFAULT_PERIOD):
+    """
+    Hämta statistik över avklarade objekt för de senaste ``days`` dagarna.
+
+    Läser enbart från rollup-tabellen. Perioder från WEEKLY_FROM_DAYS dagar
+    grupperas per vecka (måndag).
+
+    Returns:
+        Dict med total, buckets (staplar för diagrammet), by_category och
+        by_template
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    weekly = days >= WEEKLY_FROM_DAYS
+    if weekly:
+        start -= timedelta(days=start.weekday())
+
+    rows = ChecklistCompletionDaily.objects.filter(user=user, date__gte=start)
+
+    def bucket_of(day):
+        return day - timedelta(days=day.weekday()) if weekly else day
+
+    step = 7 if weekly else 1
+    buckets = {}
+    day = start
+    while day <= today:
+        buckets[day] = Counter()
+        day += timedelta(days=step)
+
+    for day, category, count in rows.values_list('date', 'category', 'completed'):
+        buckets[bucket_of(day)][category] += count
+
+    by_category = rows.values('category').annotate(total=Sum('completed')).order_by('-total')
+    by_template = rows.values('template').annotate(total=Sum('completed')).order_by('-total')
+    template_names = dict(ChecklistTemplate.objects.filter(
+        pk__in=[row['template'] for row in by_template if row['template']]
+    ).values_list('pk', 'name'))
+    category_labels = dict(ChecklistCategory.choices)
+
+    total = sum(row['total'] for row in by_category)
+    return {
+        'days': days,
+        'weekly': weekly,
+        'total': total,
+        'bars': _chart_bars(buckets, step),
+        'by_category': [
+            {
+                'label': category_labels.get(row['category'], row['category']),
+                'color': CATEGORY_COLORS.get(row['category'], '#6c757d'),
+                'total': row['total'],
+                'percentage': int(row['total'] / total * 100) if total else 0,
+            }
+            for row in by_category
+        ],
+        'by_template': [
+            {
+                'label': template_names.get(row['template'], 'Anpassade objekt'),
+                'total': row['total'],
+                'percentage': int(row['total'] / total * 100) if total else 0,
+            }
+            for row in by_template
+        ],
+        'chart_width': CHART_WIDTH,
+        'chart_height': CHART_HEIGHT,
+    }
+
+
+def _chart_bars(buckets, step):
+    """Beräkna staplade staplar (en per dag/vecka, en del per kategori)"""
+    if not buckets:
+        return []
+    peak = max(sum(counts.values()) for counts in buckets.values()) or 1
+    slot = CHART_WIDTH / len(buckets)
+    width = max(slot - 2, 1)
+    category_labels = dict(ChecklistCategory.choices)
+
+    bars = []
+    for index, (day, counts) in enumerate(sorted(buckets.items())):
+        y = CHART_HEIGHT
+        segments = []
+        for category in ChecklistCategory.values:
+            count = counts.get(category, 0)
+            if not count:
+                continue
+            height = count / peak * CHART_HEIGHT
+            y -= height
+            segments.append({
+                'y': round(y, 1),
+                'height': round(height, 1),
+                'color': CATEGORY_COLORS[category],
+                'label': category_labels[category],
+                'count': count,
+            })
+        bars.append({
+            'x': round(index * slot, 1),
+            'width': round(width, 1),
+            'date': day,
+            'end_date': day + timedelta(days=step - 1),
+            'total': sum(counts.values()),
+            'segments': segments,
+        })
+    return bars
@@ -0,0 +1,144 @@
+"""
+Copy-on-write-lagring av personernas checklistor.
+
+En person har bara en PersonChecklistItem-rad för ett mallsobjekt när
+personen avviker från mallen (avklarat, med anteckningar eller med egna
+värden för titel, beskrivning, kategori, prioritet eller ordning), samt rader
+för anpassade objekt. Orörda mallsobjekt läses direkt från
+ChecklistTemplateItem och slås ihop med personens rader vid visning.
+
+Den effektiva checklistan för en person är:
+- alla objekt i aktiva mallar, ersatta av personens rad om en sådan finns
+- personens övriga rader (anpassade objekt och avvikelser från inaktiva mallar)
+"""
+from django.db.models import Count, F, Q, Value
+
+from .models import PersonChecklistItem, ChecklistTemplateItem
+
+
+class TemplateChecklistItem:
+    """
+    Orört mallsobjekt för en person, utan egen databasrad.
+
+    Har samma attribut som PersonChecklistItem så att mallar och vyer kan
+    behandla båda likadant.
+    """
+    id = None
+    pk = None
+    is_completed = False
+    completed_at = None
+    notes = ''
+
+    def __init__(self, person, template_item):
+        self.person = person
+        self.person_id = person.pk
+        self.template_item = template_item
+        self.template_item_id = template_item.pk
+        self.title = template_item.title
+        self.description = template_item.description
+        self.category = template_item.category
+        self.priority = template_item.priority
+        self.order = template_item.order
+
+    def is_custom(self):
+        return False
+
+    def get_category_display(self):
+        return self.template_item.get_category_display()
+
+    def get_priority_display(self):
+        return self.template_item.get_priority_display()
+
+
+def active_template_items():
+    """Objekt i aktiva mallar"""
+    return ChecklistTemplateItem.objects.filter(template__is_active=True)
+
+
+# Fält som kopieras från mallsobjektet och kan redigeras per person
+TEMPLATE_FIELDS = ('title', 'description', 'category', 'priority', 'order')
+
+
+def unedited_filter():
+    """Mallrader utan anteckningar och med mallens värden (oavsett avklarad)"""
+    return Q(
+        template_item__isnull=False,
+        notes='',
+        **{field: F(f'template_item__{field}') for field in TEMPLATE_FIELDS}
+    )
+
+
+def untouched_filter():
+    """Mallrader som inte längre avviker från mallen och kan tas bort"""
+    return unedited_filter() & Q(is_completed=False)
+
+
+def prune_untouched(queryset):
+    """Ta bort rader i querysetet som åter är identiska med mallen"""
+    return queryset.filter(untouched_filter()).delete()[0]
+
+
+def extra_rows_filter(prefix=''):
+    """Personrader som inte ersätter ett aktivt mallsobjekt (räknas utöver mallarna)"""
+    return (
+        Q(**{f'{prefix}template_item__isnull': True}) |
+        Q(**{f'{prefix}template_item__template__is_active': False})
+    )
+
+
+def get_person_checklist(person, category=None, status=None):
+    """
+    Returnera personens effektiva checklista, sorterad på ordning och titel.
+
+    Två frågor: personens rader och de aktiva mallsobjekten.
+    """
+    rows = list(person.checklist_items.all())
+    overridden = {row.template_item_id for row in rows if row.template_item_id}
+
+    items = rows + [
+        TemplateChecklistItem(person, template_item)
+        for template_item in active_template_items()
+        if template_item.pk not in overridden
+    ]
+
+    if category:
+        items = [item for item in items if item.category == category]
+    if status == 'completed':
+        items = [item for item in items if item.is_completed]
+    elif status == 'incomplete':
+        items = [item for item in items if not item.is_completed]
+
+    items.sort(key=lambda item: (item.order, item.title))
+    return items
+
+
+def get_checklist_totals(person):
+    """Returnera (totalt, avklarade) för personens effektiva checklista"""
+    totals = person.checklist_items.aggregate(
+        extra=Count('id', filter=extra_rows_filter()),
+        completed=Count('id', filter=Q(is_completed=True)),
+    )
+    return active_template_items().count() + totals['extra'], totals['completed']
+
+
+def annotate_checklist_totals(queryset):
+    """Annotera ett Person-queryset med total_items och completed_items"""
+    active_count = active_template_items().count()
+    return queryset.annotate(
+        total_items=Value(active_count) + Count(
+            'checklist_items', filter=extra_rows_filter('checklist_items__')
+        ),
+        completed_items=Count(
+            'checklist_items', filter=Q(checklist_items__is_completed=True)
+        ),
+    )
+
+
+def get_or_create_row(person, template_item):
+    """Hämta personens rad för ett mallsobjekt, skapa den (kopiera) vid behov"""
+    row, _ = PersonChecklistItem.objects.get_or_create(
+        person=person,
+        template_item=template_item,
+        defaults={field: getattr(template_item, field) for field in TEMPLATE_FIELDS}
+    )
+    return row
@@ -0,0 +1,80 @@
+"""
+Avstämning av personernas checklistrader mot mallarna.
+
+Med copy-on-write-lagringen (se checklist_store) ska en person bara ha
+rader för mallsobjekt där personen avviker från mallen. ``reconcile``
+hittar rader som åter är orörda (ej avklarade, utan anteckningar och med
+samma titel, beskrivning, kategori, prioritet och ordning som mallen) -
+t.ex. från tiden då alla mallsobjekt kopierades till alla personer - och
+tar bort dem i block. Avklarade, kommenterade och redigerade rader bevaras
+alltid, även för inaktiva mallar.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import PersonChecklistItem, ChecklistTemplate, ChecklistTemplateItem
+from .checklist_store import untouched_filter
+
+BATCH_SIZE = 1000
+
+
+def reconcile(templates=None, dry_run=False):
+    """
+    Ta bort orörda rader för mallsobjekt.
+
+    Args:
+        templates: Queryset/lista med mallar (default: alla)
+        dry_run: Beräkna bara skillnaderna, ändra ingenting
+
+    Returns:
+        Lista med dicts per mallsobjekt med ändringar:
+        {'template', 'item', 'to_remove', 'preserved'}
+    """
+    if templates is None:
+        templates = ChecklistTemplate.objects.all()
+    template_ids = [t.pk for t in templates]
+
+    items = ChecklistTemplateItem.objects.filter(
+        template_id__in=template_ids
+    ).select_related('template').order_by('template__name', 'order', 'title')
+
+    # Antal orörda och bevarade rader per mallsobjekt - en grupperad fråga
+    rows = (
+        PersonChecklistItem.objects.filter(template_item__in=items)
+        .values('template_item')
+        .annotate(
+            removable=Count('id', filter=untouched_filter()),
+            preserved=Count('id', filter=~untouched_filter()),
+        )
+        .values_list('template_item', 'removable', 'preserved')
+    )
+    counts = {item_id: (removable, preserved) for item_id, removable, preserved in rows}
+
+    diff = []
+    for item in items:
+        to_remove, preserved = counts.get(item.pk, (0, 0))
+        if to_remove:
+            diff.append({
+                'template': item.template,
+                'item': item,
+                'to_remove': to_remove,
+                'preserved': preserved,
+            })
+
+    if not dry_run:
+        for entry in diff:
+            _remove_untouched(entry['item'])
+    return diff
+
+
+def _remove_untouched(template_item):
+    """Ta bort orörda rader för ett mallsobjekt, i block"""
+    queryset = PersonChecklistItem.objects.filter(
+        untouched_filter(), template_item=template_item
+    )
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        with transaction.atomic():
+            PersonChecklistItem.objects.filter(id__in=ids).delete()
@@ -0,0 +1,201 @@
+"""
+Sammanhängande komponenter ("öar") i släktgrafen.
+
+Varje person har ett component_id som är det lägsta person-id:t i den
+komponent personen tillhör, räknat över alla relationstyper. En person utan
+relationer utgör en egen komponent. Komponenterna beräknas med union-find
+och underhålls inkrementellt: en ny relation slår ihop två komponenter med
+en UPDATE, en borttagen relation eller person räknar om den berörda
+komponenten. ``manage.py rebuild_components`` bygger om allt.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Person, PersonRelationship
+
+BATCH_SIZE = 1000
+
+
+class UnionFind:
+    """Union-find där roten alltid är det minsta id:t i mängden"""
+
+    def __init__(self, ids=()):
+        self.parent = {node_id: node_id for node_id in ids}
+
+    def find(self, node_id):
+        parent = self.parent
+        parent.setdefault(node_id, node_id)
+        root = node_id
+        while parent[root] != root:
+            root = parent[root]
+        # Vägkomprimering
+        while parent[node_id] != root:
+            parent[node_id], node_id = root, parent[node_id]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+    def roots(self):
+        """Returnera {id: komponent-id} för alla noder"""
+        return {node_id: self.find(node_id) for node_id in self.parent}
+
+
+def compute_components(person_ids, edges):
+    """Beräkna {person_id: komponent-id} från person-id:n och (a, b)-kanter"""
+    person_ids = set(person_ids)
+    union_find = UnionFind(person_ids)
+    for a, b in edges:
+        if a in person_ids and b in person_ids:
+            union_find.union(a, b)
+    return union_find.roots()
+
+
+def _apply(components):
+    """Skriv ändrade komponent-id:n, grupperade per nytt värde"""
+    current = {}
+    ids = list(components)
+    for start in range(0, len(ids), BATCH_SIZE):
+        current.update(
+            Person.objects.filter(id__in=ids[start:start + BATCH_SIZE])
+            .values_list('id', 'component_id')
+        )
+
+    by_component = {}
+    for person_id, component_id in components.items():
+        if person_id in current and current[person_id] != component_id:
+            by_component.setdefault(component_id, []).append(person_id)
+
+    updated = 0
+    for component_id, person_ids in by_component.items():
+        for start in range(0, len(person_ids), BATCH_SIZE):
+            updated += Person.objects.filter(
+                id__in=person_ids[start:start + BATCH_SIZE]
+            ).update(component_id=component_id)
+    return updated
+
+
+def _recompute(component_ids):
+    """Räkna om angivna komponenter från aktuella relationer"""
+    component_ids = {c for c in component_ids if c is not None}
+    if not component_ids:
+        return
+    person_ids = set(
+        Person.objects.filter(component_id__in=component_ids).values_list('id', flat=True)
+    )
+    if not person_ids:
+        return
+    edges = PersonRelationship.objects.filter(
+        person_a__component_id__in=component_ids
+    ).values_list('person_a_id', 'person_b_id')
+    _apply(compute_components(person_ids, edges))
+
+
+def assign_new_person(person):
+    """Ge en nyskapad person en egen komponent"""
+    Person.objects.filter(pk=person.pk).update(component_id=person.pk)
+    person.component_id = person.pk
+
+
+def merge(person_a_id, person_b_id):
+    """Slå ihop komponenterna för två personer som fått en relation"""
+    rows = dict(
+        Person.objects.filter(id__in=[person_a_id, person_b_id])
+        .values_list('id', 'component_id')
+    )
+    if len(rows) != 2:
+        return
+    component_a = rows[person_a_id] or person_a_id
+    component_b = rows[person_b_id] or person_b_id
+    if component_a == component_b:
+        return
+    target = min(component_a, component_b)
+    Person.objects.filter(
+        Q(component_id__in=[component_a, component_b]) |
+        Q(id__in=[person_a_id, person_b_id])
+    ).update(component_id=target)
+
+
+def merge_edges(edges):
+    """Slå ihop komponenter för flera nya relationer (t.ex. efter bulk_create)"""
+    edges = list(edges)
+    if not edges:
+        return
+    person_ids = {person_id for edge in edges for person_id in edge}
+    with transaction.atomic():
+        # Personer utan komponent får först en egen, så att de följer med
+        # när komponenten slås ihop nedan
+        Person.objects.filter(id__in=person_ids, component_id__isnull=True).update(
+            component_id=F('id')
+        )
+        current = dict(
+            Person.objects.filter(id__in=person_ids).values_list('id', 'component_id')
+        )
+        union_find = UnionFind()
+        for a, b in edges:
+            if a in current and b in current:
+                union_find.union(current[a], current[b])
+        for old_component, new_component in union_find.roots().items():
+            if old_component != new_component:
+                Person.objects.filter(component_id=old_component).update(
+                    component_id=new_component
+                )
+
+
+def split(component_ids):
+    """Räkna om komponenter som kan ha delats av en borttagen relation eller person"""
+    with transaction.atomic():
+        _recompute(component_ids)
+
+
+def rebuild(user=None):
+    """
+    Räkna om alla komponenter, för en användare eller alla.
+
+    Returns:
+        Tuple (antal komponenter, antal uppdaterade personer)
+    """
+    persons = Person.objects.all()
+    relationships = PersonRelationship.objects.all()
+    if user is not None:
+        persons = persons.filter(user=user)
+        relationships = relationships.filter(user=user)
+
+    components = compute_components(
+        persons.values_list('id', flat=True).iterator(),
+        relationships.values_list('person_a_id', 'person_b_id').iterator()
+    )
+    with transaction.atomic():
+        updated = _apply(components)
+    return len(set(components.values())), updated
+
+
+def get_islands(user):
+    """
+    Returnera komponenterna för en användare, största först.
+
+    Returns:
+        Lista med dicts {'component_id', 'size', 'representative'}
+    """
+    rows = (
+        Person.objects.filter(user=user)
+        .values('component_id')
+        .annotate(size=Count('id'))
+        .order_by('-size', 'component_id')
+    )
+    islands = list(rows)
+    representatives = Person.objects.filter(user=user).in_bulk(
+        [row['component_id'] for row in islands]
+    )
+    # Huvudpersonen representerar sin ö
+    main_person = Person.objects.filter(user=user, is_main_person=True).first()
+    if main_person:
+        representatives[main_person.component_id] = main_person
+
+    for island in islands:
+        island['representative'] = representatives.get(island['component_id'])
+    return islands
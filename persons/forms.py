@@ -225,3 +225,13 @@ class PersonExportForm(forms.Form):
         initial=True,
         label="Inkludera dokumentlista"
     )
+    include_descendants = forms.BooleanField(
+        required=False,
+        initial=False,
+        label="Inkludera ättlingar"
+    )
+    include_component = forms.BooleanField(
+        required=False,
+        initial=False,
+        label="Inkludera alla personer på samma ö i trädet"
+    )
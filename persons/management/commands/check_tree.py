@@ -0,0 +1,51 @@
+"""Management command för konsistenskontroll av släktträdet"""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from persons.models import Person
+from persons.tree_checks import check_tree
+
+
+class Command(BaseCommand):
+    help = 'Kontrollerar släktträdet: fler än två föräldrar, barn födda före föräldrar, cykler och makar utan överlappande livstid'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Kontrollera endast angivet användarnamn (default: alla användare)'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+
+        start = time.monotonic()
+        violations, person_count = check_tree(user=user)
+        elapsed = time.monotonic() - start
+
+        names = Person.objects.in_bulk(
+            {person_id for v in violations for person_id in v['person_ids']}
+        )
+
+        for violation in violations:
+            persons = ', '.join(
+                f'{names[pid].get_full_name()} (#{pid})' if pid in names else f'#{pid}'
+                for pid in violation['person_ids']
+            )
+            self.stdout.write(
+                self.style.WARNING(f'[{violation["label"]}] ') +
+                f'{violation["message"]}: {persons}'
+            )
+
+        summary = f'{person_count} personer kontrollerade på {elapsed:.2f} s'
+        if violations:
+            self.stdout.write(self.style.ERROR(f'{len(violations)} avvikelser hittades. {summary}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Inga avvikelser hittades. {summary}.'))
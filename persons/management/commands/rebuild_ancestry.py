@@ -0,0 +1,36 @@
+"""Management command för att bygga om closure-tabellen för anor"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from persons import ancestry
+
+
+class Command(BaseCommand):
+    help = 'Bygger om closure-tabellen (ana, ättling, generationer) från alla förälder/barn-relationer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Bygg endast om för angivet användarnamn (default: alla användare)'
+        )
+
+    def handle(self, *args, **options):
+        if not ancestry.is_enabled():
+            raise CommandError(
+                'Closure-tabellen är avstängd (ANCESTRY_CLOSURE_ENABLED=0).'
+            )
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+
+        target = f'användaren {user.username}' if user else 'alla användare'
+        self.stdout.write(f'Bygger om closure-tabellen för {target}...')
+
+        created = ancestry.rebuild(user=user)
+
+        self.stdout.write(self.style.SUCCESS(f'Klart! {created} anrelationer skapade.'))
@@ -0,0 +1,33 @@
+"""Management command för att bygga om den dagliga checkliststatistiken"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from persons import checklist_rollups
+
+
+class Command(BaseCommand):
+    help = 'Bygger om de dagliga sammanställningarna av avklarade checklistobjekt från checklistraderna'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Bygg endast om för angivet användarnamn (default: alla användare)'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+
+        target = f'användaren {user.username}' if user else 'alla användare'
+        self.stdout.write(f'Bygger om checkliststatistik för {target}...')
+
+        created = checklist_rollups.rebuild(user=user)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {created} dagliga sammanställningar skapade.'
+        ))
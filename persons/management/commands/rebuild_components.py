@@ -0,0 +1,33 @@
+"""Management command för att räkna om släktträdets sammanhängande delar"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from persons import components
+
+
+class Command(BaseCommand):
+    help = 'Räknar om komponent-id (ö i släktträdet) för alla personer med union-find över relationerna'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Räkna endast om för angivet användarnamn (default: alla användare)'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Användaren "{options["user"]}" finns inte.')
+
+        target = f'användaren {user.username}' if user else 'alla användare'
+        self.stdout.write(f'Räknar om öar i släktträdet för {target}...')
+
+        component_count, updated = components.rebuild(user=user)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {component_count} öar, {updated} personer uppdaterade.'
+        ))
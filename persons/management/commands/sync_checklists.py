@@ -0,0 +1,49 @@
+"""Management command för att stämma av personernas checklistrader mot mallarna"""
+from django.core.management.base import BaseCommand, CommandError
+
+from persons import checklist_sync
+from persons.models import ChecklistTemplate
+
+
+class Command(BaseCommand):
+    help = 'Tar bort checklistrader som inte avviker från mallen (avklarade objekt och objekt med anteckningar bevaras)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--template',
+            type=str,
+            help='Synka endast angiven mall (namn)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Visa vad som skulle ändras utan att ändra något'
+        )
+
+    def handle(self, *args, **options):
+        templates = ChecklistTemplate.objects.all()
+        if options['template']:
+            templates = templates.filter(name=options['template'])
+            if not templates.exists():
+                raise CommandError(f'Mallen "{options["template"]}" finns inte.')
+
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write('Torrkörning - inga ändringar görs.')
+
+        diff = checklist_sync.reconcile(templates=templates, dry_run=dry_run)
+
+        for entry in diff:
+            line = f'  {entry["item"]}: -{entry["to_remove"]}'
+            if entry['preserved']:
+                line += f' ({entry["preserved"]} påbörjade bevaras)'
+            self.stdout.write(line)
+
+        removed = sum(entry['to_remove'] for entry in diff)
+        if dry_run:
+            summary = f'{removed} orörda rader att ta bort'
+        else:
+            summary = f'{removed} orörda rader borttagna'
+        self.stdout.write(self.style.SUCCESS(
+            f'Klart! {summary} ({len(diff)} mallsobjekt berörda).'
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 02:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0008_person_profile_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelationshipGraphVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Version')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Uppdaterad')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='graph_version', to=settings.AUTH_USER_MODEL, verbose_name='Användare')),
+            ],
+            options={
+                'verbose_name': 'Släktgrafversion',
+                'verbose_name_plural': 'Släktgrafversioner',
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-19 02:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_ancestry(apps, schema_editor):
+    """Fyll closure-tabellen från befintliga förälder/barn-relationer"""
+    from persons.ancestry import _compute_ancestors
+
+    Person = apps.get_model('persons', 'Person')
+    PersonRelationship = apps.get_model('persons', 'PersonRelationship')
+    PersonAncestry = apps.get_model('persons', 'PersonAncestry')
+
+    parents = {}
+    rows = PersonRelationship.objects.filter(
+        relationship_a_to_b__in=['PARENT', 'CHILD']
+    ).values_list('person_a_id', 'person_b_id', 'relationship_a_to_b')
+    for person_a_id, person_b_id, relationship_a_to_b in rows.iterator():
+        if relationship_a_to_b == 'PARENT':
+            parents.setdefault(person_b_id, set()).add(person_a_id)
+        else:
+            parents.setdefault(person_a_id, set()).add(person_b_id)
+
+    node_ids = set(Person.objects.values_list('id', flat=True))
+    computed = _compute_ancestors(node_ids, parents, {})
+    PersonAncestry.objects.bulk_create(
+        [
+            PersonAncestry(ancestor_id=ancestor_id, descendant_id=node_id, depth=depth)
+            for node_id, ancestors in computed.items()
+            for ancestor_id, depth in ancestors.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0009_relationshipgraphversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonAncestry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(help_text='1 = förälder, 2 = far-/morförälder osv.', verbose_name='Generationer')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestry_as_ancestor', to='persons.person', verbose_name='Ana')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestry_as_descendant', to='persons.person', verbose_name='Ättling')),
+            ],
+            options={
+                'verbose_name': 'Anrelation',
+                'verbose_name_plural': 'Anrelationer',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='persons_per_descend_34623d_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(populate_ancestry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-19 02:46
+
+from django.db import migrations, models
+
+
+def populate_components(apps, schema_editor):
+    """Beräkna komponent-id för alla befintliga personer"""
+    from persons.components import compute_components
+
+    Person = apps.get_model('persons', 'Person')
+    PersonRelationship = apps.get_model('persons', 'PersonRelationship')
+
+    components = compute_components(
+        Person.objects.values_list('id', flat=True).iterator(),
+        PersonRelationship.objects.values_list('person_a_id', 'person_b_id').iterator()
+    )
+    by_component = {}
+    for person_id, component_id in components.items():
+        by_component.setdefault(component_id, []).append(person_id)
+    for component_id, person_ids in by_component.items():
+        for start in range(0, len(person_ids), 1000):
+            Person.objects.filter(id__in=person_ids[start:start + 1000]).update(
+                component_id=component_id
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0010_personancestry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='component_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Lägsta person-id i den sammanhängande del av släktträdet personen tillhör', null=True, verbose_name='Komponent'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['user', 'component_id'], name='persons_per_user_id_9b5886_idx'),
+        ),
+        migrations.RunPython(populate_components, migrations.RunPython.noop),
+    ]
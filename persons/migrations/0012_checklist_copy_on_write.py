@@ -0,0 +1,73 @@
+# Generated by Django 6.0 on 2026-10-19 02:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_untouched_rows(apps, schema_editor):
+    """
+    Ta bort mallrader som inte avviker från mallen - de läses nu från mallen.
+
+    Endast aktiva mallar läses upp, så rader från inaktiva mallar lämnas
+    kvar åt sync_checklists.
+    """
+    PersonChecklistItem = apps.get_model('persons', 'PersonChecklistItem')
+    PersonChecklistItem.objects.filter(
+        template_item__isnull=False,
+        template_item__template__is_active=True,
+        is_completed=False,
+        notes='',
+        title=models.F('template_item__title'),
+        description=models.F('template_item__description'),
+        category=models.F('template_item__category'),
+        priority=models.F('template_item__priority'),
+        order=models.F('template_item__order'),
+    ).delete()
+
+
+def restore_untouched_rows(apps, schema_editor):
+    """Återskapa en rad per person och aktivt mallsobjekt"""
+    Person = apps.get_model('persons', 'Person')
+    PersonChecklistItem = apps.get_model('persons', 'PersonChecklistItem')
+    ChecklistTemplateItem = apps.get_model('persons', 'ChecklistTemplateItem')
+
+    for template_item in ChecklistTemplateItem.objects.filter(template__is_active=True):
+        existing = PersonChecklistItem.objects.filter(
+            template_item=template_item
+        ).values_list('person_id', flat=True)
+        PersonChecklistItem.objects.bulk_create(
+            [
+                PersonChecklistItem(
+                    person_id=person_id,
+                    template_item=template_item,
+                    title=template_item.title,
+                    description=template_item.description,
+                    category=template_item.category,
+                    priority=template_item.priority,
+                    order=template_item.order,
+                )
+                for person_id in Person.objects.exclude(id__in=existing).values_list('id', flat=True)
+            ],
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0011_person_component_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='checklisttemplate',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Om aktiv visas mallens objekt i alla personers checklistor', verbose_name='Aktiv'),
+        ),
+        migrations.AlterField(
+            model_name='personchecklistitem',
+            name='template_item',
+            field=models.ForeignKey(blank=True, help_text='Om satt avviker personen från detta mallsobjekt, annars är det anpassat', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='person_items', to='persons.checklisttemplateitem', verbose_name='Mallsobjekt'),
+        ),
+        migrations.RunPython(remove_untouched_rows, restore_untouched_rows),
+    ]
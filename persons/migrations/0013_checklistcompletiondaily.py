@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-19 03:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_rollups(apps, schema_editor):
+    """Bygg dagliga sammanställningar från befintliga avklarade objekt"""
+    from persons.checklist_rollups import count_completions
+
+    PersonChecklistItem = apps.get_model('persons', 'PersonChecklistItem')
+    ChecklistCompletionDaily = apps.get_model('persons', 'ChecklistCompletionDaily')
+
+    ChecklistCompletionDaily.objects.bulk_create(
+        [
+            ChecklistCompletionDaily(
+                user_id=user_id, date=day, category=category,
+                template_id=template_id, completed=count
+            )
+            for (user_id, day, category, template_id), count in
+            count_completions(PersonChecklistItem.objects.all()).items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0012_checklist_copy_on_write'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChecklistCompletionDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Datum')),
+                ('category', models.CharField(choices=[('RESEARCH', 'Forskning'), ('DOCUMENTS', 'Dokument'), ('SOURCES', 'Källor'), ('VERIFICATION', 'Verifiering'), ('OTHER', 'Övrigt')], max_length=20, verbose_name='Kategori')),
+                ('completed', models.IntegerField(default=0, verbose_name='Avklarade')),
+                ('template', models.ForeignKey(blank=True, help_text='Tom för anpassade objekt', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='completion_rollups', to='persons.checklisttemplate', verbose_name='Mall')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checklist_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Användare')),
+            ],
+            options={
+                'verbose_name': 'Daglig checkliststatistik',
+                'verbose_name_plural': 'Daglig checkliststatistik',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['user', 'date'], name='persons_che_user_id_4b84c9_idx')],
+                'unique_together': {('user', 'date', 'category', 'template')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.1.2 on 2026-10-19 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_custom_rows(apps, schema_editor):
+    """Slå ihop rader utan mall som den tidigare unique_together släppte igenom"""
+    ChecklistCompletionDaily = apps.get_model('persons', 'ChecklistCompletionDaily')
+    duplicates = (
+        ChecklistCompletionDaily.objects.filter(template__isnull=True)
+        .values('user_id', 'date', 'category')
+        .annotate(rows=models.Count('id'), total=models.Sum('completed'), keep=models.Min('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        ChecklistCompletionDaily.objects.filter(
+            template__isnull=True, user_id=group['user_id'], date=group['date'],
+            category=group['category']
+        ).exclude(pk=group['keep']).delete()
+        ChecklistCompletionDaily.objects.filter(pk=group['keep']).update(completed=group['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('persons', '0013_checklistcompletiondaily'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='checklistcompletiondaily',
+            unique_together=set(),
+        ),
+        migrations.RunPython(merge_duplicate_custom_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='checklistcompletiondaily',
+            constraint=models.UniqueConstraint(condition=models.Q(('template__isnull', False)), fields=('user', 'date', 'category', 'template'), name='unique_daily_completion_template'),
+        ),
+        migrations.AddConstraint(
+            model_name='checklistcompletiondaily',
+            constraint=models.UniqueConstraint(condition=models.Q(('template__isnull', True)), fields=('user', 'date', 'category'), name='unique_daily_completion_custom'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from core.models import Template
+from core.utils import IMAGE_TYPES
 
 
 class Person(models.Model):
@@ -26,6 +27,13 @@ class Person(models.Model):
         verbose_name="Huvudperson",
         help_text="Huvudperson används som standard i trädvyn"
     )
+    component_id = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Komponent",
+        help_text="Lägsta person-id i den sammanhängande del av släktträdet personen tillhör"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Skapad")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Uppdaterad")
     profile_image = models.ForeignKey(
@@ -46,6 +54,7 @@ class Person(models.Model):
         indexes = [
             models.Index(fields=['surname', 'firstname']),
             models.Index(fields=['directory_name']),
+            models.Index(fields=['user', 'component_id']),
         ]
 
     def __str__(self):
@@ -67,8 +76,8 @@ class Person(models.Model):
                 raise ValidationError("Dödsdatum kan inte vara före födelsedatum.")
 
         # Validera att profile_image är en bildfil
-        if self.profile_image and self.profile_image.file_type not in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-            raise ValidationError("Profilbilden måste vara en bildfil (jpg, jpeg, png, gif, bmp).")
+        if self.profile_image and self.profile_image.file_type not in IMAGE_TYPES:
+            raise ValidationError(f"Profilbilden måste vara en bildfil ({', '.join(IMAGE_TYPES)}).")
 
         # Validera att profile_image tillhör denna person
         if self.profile_image and self.profile_image.person != self:
@@ -149,7 +158,7 @@ class Person(models.Model):
         from documents.models import Document
         return Document.objects.filter(
             person=self,
-            file_type__in=['jpg', 'jpeg', 'png', 'gif', 'bmp']
+            file_type__in=IMAGE_TYPES
         ).order_by('-created_at')
 
     def get_all_relationships(self):
@@ -265,6 +274,51 @@ class PersonRelationship(models.Model):
         self.full_clean()
         super().save(*args, **kwargs)
 
+    def get_parent_child_ids(self):
+        """
+        Returnera (förälder_id, barn_id) om relationen är förälder/barn,
+        annars None.
+        """
+        if self.relationship_a_to_b == RelationshipType.PARENT:
+            return self.person_a_id, self.person_b_id
+        if self.relationship_a_to_b == RelationshipType.CHILD:
+            return self.person_b_id, self.person_a_id
+        return None
+
+
+class PersonAncestry(models.Model):
+    """
+    Closure-tabell över anor: en rad per (ana, ättling) med kortaste
+    generationsavstånd. Underhålls inkrementellt av persons.ancestry.
+    """
+    ancestor = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='ancestry_as_ancestor',
+        verbose_name="Ana"
+    )
+    descendant = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name='ancestry_as_descendant',
+        verbose_name="Ättling"
+    )
+    depth = models.PositiveIntegerField(
+        verbose_name="Generationer",
+        help_text="1 = förälder, 2 = far-/morförälder osv."
+    )
+
+    class Meta:
+        verbose_name = "Anrelation"
+        verbose_name_plural = "Anrelationer"
+        unique_together = [['ancestor', 'descendant']]
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
 
 class ChecklistCategory(models.TextChoices):
     """Kategorier för att organisera checklistobjekt"""
@@ -290,7 +344,7 @@ class ChecklistTemplate(models.Model):
     is_active = models.BooleanField(
         default=True,
         verbose_name="Aktiv",
-        help_text="Om aktiv synkas ändringar automatiskt till alla personer"
+        help_text="Om aktiv visas mallens objekt i alla personers checklistor"
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Skapad")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Uppdaterad")
@@ -349,7 +403,12 @@ class ChecklistTemplateItem(models.Model):
 
 
 class PersonChecklistItem(models.Model):
-    """Checklistobjekt för en specifik person - synkat från mall eller anpassat"""
+    """
+    Checklistobjekt för en specifik person - anpassat, eller ett mallsobjekt
+    där personen avviker från mallen (avklarat, med anteckningar eller
+    redigerat).
+    Orörda mallsobjekt har ingen rad, se persons.checklist_store.
+    """
     person = models.ForeignKey(
         Person,
         on_delete=models.CASCADE,
@@ -363,7 +422,7 @@ class PersonChecklistItem(models.Model):
         blank=True,
         related_name='person_items',
         verbose_name="Mallsobjekt",
-        help_text="Om satt är detta synkat från mallen, annars är det anpassat"
+        help_text="Om satt avviker personen från detta mallsobjekt, annars är det anpassat"
     )
     # Cachade fält från mall (för anpassade objekt eller prestanda)
     title = models.CharField(max_length=200, verbose_name="Titel")
@@ -416,7 +475,7 @@ class PersonChecklistItem(models.Model):
 
     def is_custom(self):
         """Returnerar True om detta är ett anpassat objekt (inte från mall)"""
-        return self.template_item is None
+        return self.template_item_id is None
 
     def save(self, *args, **kwargs):
         """Sätt completed_at timestamp när avklarad"""
@@ -430,6 +489,60 @@ class PersonChecklistItem(models.Model):
         super().save(*args, **kwargs)
 
 
+class ChecklistCompletionDaily(models.Model):
+    """
+    Antal avklarade checklistobjekt per användare, dag, kategori och mall.
+    Underhålls inkrementellt av persons.checklist_rollups.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='checklist_rollups',
+        verbose_name="Användare"
+    )
+    date = models.DateField(verbose_name="Datum")
+    category = models.CharField(
+        max_length=20,
+        choices=ChecklistCategory.choices,
+        verbose_name="Kategori"
+    )
+    template = models.ForeignKey(
+        ChecklistTemplate,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='completion_rollups',
+        verbose_name="Mall",
+        help_text="Tom för anpassade objekt"
+    )
+    completed = models.IntegerField(default=0, verbose_name="Avklarade")
+
+    class Meta:
+        verbose_name = "Daglig checkliststatistik"
+        verbose_name_plural = "Daglig checkliststatistik"
+        ordering = ['-date']
+        # NULL räknas som distinkt i unika index, så rader utan mall
+        # (anpassade objekt) får en egen villkorad constraint
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'date', 'category', 'template'],
+                condition=models.Q(template__isnull=False),
+                name='unique_daily_completion_template',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'date', 'category'],
+                condition=models.Q(template__isnull=True),
+                name='unique_daily_completion_custom',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.date} {self.category}: {self.completed}"
+
+
 class BookmarkedPerson(models.Model):
     """Bokmärken för personer"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Användare")
@@ -452,3 +565,42 @@ class BookmarkedPerson(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.person.get_full_name()}"
+
+
+class RelationshipGraphVersion(models.Model):
+    """Versionsräknare för en användares släktgraf - används som cachenyckel"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='graph_version',
+        verbose_name="Användare"
+    )
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Version")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Uppdaterad")
+
+    class Meta:
+        verbose_name = "Släktgrafversion"
+        verbose_name_plural = "Släktgrafversioner"
+
+    def __str__(self):
+        return f"{self.user.username} - v{self.version}"
+
+    @classmethod
+    def get_version(cls, user_id):
+        """Hämta aktuell version för en användare (0 om ingen finns)"""
+        return cls.objects.filter(user_id=user_id).values_list(
+            'version', flat=True
+        ).first() or 0
+
+    @classmethod
+    def bump(cls, user_id):
+        """Räkna upp versionen för en användare med en enda UPDATE"""
+        from django.utils import timezone
+
+        updated = cls.objects.filter(user_id=user_id).update(
+            version=models.F('version') + 1,
+            updated_at=timezone.now()
+        )
+        # Användaren kan redan vara borttagen (kaskadradering)
+        if not updated and User.objects.filter(pk=user_id).exists():
+            cls.objects.get_or_create(user_id=user_id, defaults={'version': 1})
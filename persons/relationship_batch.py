@@ -0,0 +1,241 @@
+"""
+Batchredigering av relationer.
+
+Tar emot en lista med operationer (create/delete/change_type), validerar
+alla i minnet mot en enda förhämtning av inblandade personer och relationer
+och tillämpar dem i en transaktion med bulk_create/bulk_update och en
+filtrerad delete.
+
+Operationsformat::
+
+    {"op": "create", "person": 1, "related_person": 2,
+     "relationship_type": "PARENT", "notes": ""}
+    {"op": "delete", "id": 7}
+    {"op": "delete", "person": 1, "related_person": 2}
+    {"op": "change_type", "person": 1, "related_person": 2,
+     "relationship_type": "SPOUSE"}
+
+relationship_type anger vad ``person`` är till ``related_person``, precis
+som i PersonRelationshipForm. När en relation anges med ``id`` avser
+relationship_type person A:s relation till person B.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Person, PersonRelationship, RelationshipGraphVersion, RelationshipType
+from . import ancestry, components
+
+MAX_OPERATIONS = 1000
+
+OPERATIONS = ('create', 'delete', 'change_type')
+
+
+class BatchError(Exception):
+    """Fel i en enskild batchoperation"""
+
+
+def _as_int(value, field):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BatchError(f'Fältet "{field}" måste vara ett heltal.')
+
+
+def _canonical(person_id, related_id, relationship_type):
+    """Returnera (a_id, b_id, a_to_b, b_to_a) med person_a.id < person_b.id"""
+    reciprocal = RelationshipType.get_reciprocal(relationship_type)
+    if person_id < related_id:
+        return person_id, related_id, relationship_type, reciprocal
+    return related_id, person_id, reciprocal, relationship_type
+
+
+def apply_relationship_batch(user, operations, atomic=True):
+    """
+    Validera och tillämpa en lista med relationsoperationer.
+
+    Args:
+        user: Användaren som äger personerna
+        operations: Lista med operationer (se modulens docstring)
+        atomic: Om True tillämpas ingenting om någon operation är ogiltig
+
+    Returns:
+        Tuple (resultat per operation, True om ändringarna tillämpades)
+    """
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'Högst {MAX_OPERATIONS} operationer per anrop.')
+
+    # Samla alla refererade personer och relationer för en enda förhämtning
+    person_ids = set()
+    relationship_ids = set()
+    for op in operations:
+        if not isinstance(op, dict):
+            continue
+        for field in ('person', 'related_person'):
+            try:
+                person_ids.add(int(op.get(field)))
+            except (TypeError, ValueError):
+                pass
+        try:
+            relationship_ids.add(int(op.get('id')))
+        except (TypeError, ValueError):
+            pass
+
+    persons = Person.objects.filter(user=user, id__in=person_ids).in_bulk()
+    existing = {}
+    by_id = {}
+    rows = PersonRelationship.objects.filter(user=user).filter(
+        Q(id__in=relationship_ids) |
+        Q(person_a_id__in=persons, person_b_id__in=persons)
+    )
+    previous_edges = {}
+    for relationship in rows:
+        pair = (relationship.person_a_id, relationship.person_b_id)
+        existing[pair] = relationship
+        by_id[relationship.pk] = relationship
+        previous_edges[pair] = relationship.get_parent_child_ids()
+
+    # Simulerat tillstånd per personpar: befintlig/ny relation eller None (borttagen)
+    state = dict(existing)
+    to_delete = {}
+    to_update = {}
+    results = []
+
+    for index, op in enumerate(operations):
+        result = {'index': index}
+        try:
+            if not isinstance(op, dict):
+                raise BatchError('Operationen måste vara ett objekt.')
+            action = op.get('op')
+            if action not in OPERATIONS:
+                raise BatchError(f'Okänd operation "{action}".')
+
+            # Identifiera personparet
+            if action != 'create' and op.get('id') is not None:
+                relationship = by_id.get(_as_int(op.get('id'), 'id'))
+                if relationship is None:
+                    raise BatchError('Relationen finns inte.')
+                pair = (relationship.person_a_id, relationship.person_b_id)
+                person_id, related_id = pair
+            else:
+                person_id = _as_int(op.get('person'), 'person')
+                related_id = _as_int(op.get('related_person'), 'related_person')
+                if person_id not in persons or related_id not in persons:
+                    raise BatchError('Personen finns inte.')
+                if person_id == related_id:
+                    raise BatchError('En person kan inte ha en relation med sig själv.')
+                pair = (min(person_id, related_id), max(person_id, related_id))
+
+            current = state.get(pair)
+
+            if action in ('create', 'change_type'):
+                relationship_type = op.get('relationship_type')
+                if relationship_type not in RelationshipType.values:
+                    raise BatchError(f'Ogiltig relationstyp "{relationship_type}".')
+                _, _, a_to_b, b_to_a = _canonical(person_id, related_id, relationship_type)
+
+            if action == 'create':
+                if current is not None:
+                    raise BatchError('En relation mellan dessa personer finns redan.')
+                relationship = PersonRelationship(
+                    user=user,
+                    person_a_id=pair[0],
+                    person_b_id=pair[1],
+                    relationship_a_to_b=a_to_b,
+                    relationship_b_to_a=b_to_a,
+                    notes=str(op.get('notes', '')),
+                )
+                # En tidigare borttagning av samma par i batchen ersätts av en typändring
+                if pair in to_delete:
+                    relationship = to_delete.pop(pair)
+                    relationship.relationship_a_to_b = a_to_b
+                    relationship.relationship_b_to_a = b_to_a
+                    relationship.notes = str(op.get('notes', relationship.notes))
+                    to_update[pair] = relationship
+                state[pair] = relationship
+
+            elif action == 'delete':
+                if current is None:
+                    raise BatchError('Relationen finns inte.')
+                if current.pk:
+                    to_delete[pair] = current
+                    to_update.pop(pair, None)
+                state[pair] = None
+
+            elif action == 'change_type':
+                if current is None:
+                    raise BatchError('Relationen finns inte.')
+                current.relationship_a_to_b = a_to_b
+                current.relationship_b_to_a = b_to_a
+                if current.pk:
+                    to_update[pair] = current
+
+            result['status'] = 'ok'
+            result['pair'] = list(pair)
+        except BatchError as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        results.append(result)
+
+    has_errors = any(r['status'] == 'error' for r in results)
+    if has_errors and atomic:
+        return results, False
+
+    to_create = [
+        relationship for relationship in state.values()
+        if relationship is not None and relationship.pk is None
+    ]
+
+    with transaction.atomic():
+        # Barn vars föräldrar ändras - de och deras ättlingar får nya anrader
+        changed_children = {
+            edge[1] for edge in (r.get_parent_child_ids() for r in to_create) if edge
+        }
+        changed_children.update(
+            edge[1] for edge in (previous_edges[pair] for pair in to_delete) if edge
+        )
+        for pair, relationship in to_update.items():
+            previous_edge = previous_edges[pair]
+            current_edge = relationship.get_parent_child_ids()
+            if previous_edge != current_edge:
+                changed_children.update(edge[1] for edge in (previous_edge, current_edge) if edge)
+        affected = ancestry.collect_subtrees(changed_children)
+
+        split_components = set()
+        if to_delete:
+            deleted_persons = {person_id for pair in to_delete for person_id in pair}
+            split_components.update(
+                Person.objects.filter(pk__in=deleted_persons).values_list('component_id', flat=True)
+            )
+            # Utan per-rad-signaler - closure-tabell och komponenter räknas om en gång nedan.
+            # Inga modeller refererar till relationer, så det finns inget att kaskadradera.
+            deleted = PersonRelationship.objects.filter(pk__in=[r.pk for r in to_delete.values()])
+            deleted._raw_delete(deleted.db)
+
+        created = PersonRelationship.objects.bulk_create(to_create)
+
+        now = timezone.now()
+        for relationship in to_update.values():
+            relationship.updated_at = now
+        PersonRelationship.objects.bulk_update(
+            list(to_update.values()),
+            ['relationship_a_to_b', 'relationship_b_to_a', 'notes', 'updated_at']
+        )
+
+        # Raderingen, bulk_create och bulk_update skickar inga signaler
+        ancestry.recompute_descendants(affected)
+        components.split(split_components)
+        components.merge_edges((r.person_a_id, r.person_b_id) for r in created)
+        if created or to_update or to_delete:
+            RelationshipGraphVersion.bump(user.id)
+
+    created_by_pair = {(r.person_a_id, r.person_b_id): r.pk for r in created}
+    for result in results:
+        if result['status'] == 'ok':
+            pair = tuple(result['pair'])
+            relationship = state.get(pair)
+            result['id'] = relationship.pk if relationship is not None else None
+            if pair in created_by_pair:
+                result['id'] = created_by_pair[pair]
+
+    return results, True
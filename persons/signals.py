@@ -1,49 +1,69 @@
-from django.db.models.signals import post_save, post_delete
+import threading
+
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.db import transaction
 from django.dispatch import receiver
-from .models import ChecklistTemplateItem, PersonChecklistItem, Person
+from django.utils import timezone
+from .models import (
+    ChecklistTemplateItem, PersonChecklistItem, Person,
+    PersonRelationship, RelationshipGraphVersion
+)
+from . import ancestry, checklist_rollups, components
+
+# Personer som håller på att raderas i aktuell tråd (se ancestry-signalerna)
+_deleting = threading.local()
+
+
+@receiver(pre_save, sender=ChecklistTemplateItem)
+def remember_template_item_completions(sender, instance, raw=False, **kwargs):
+    """Räkna avklarade rader före ändringen (kategori och mall ingår i statistiken)"""
+    if raw or not instance.pk:
+        return
+    instance._completions_before = checklist_rollups.count_completions(
+        PersonChecklistItem.objects.filter(template_item=instance)
+    )
 
 
 @receiver(post_save, sender=ChecklistTemplateItem)
 def sync_template_item_to_persons(sender, instance, created, **kwargs):
     """
-    När ett mallsobjekt skapas eller uppdateras, synka till alla personer.
-    Bevarar användarens avklaradstatus.
+    Orörda mallsobjekt läses direkt från mallen (se checklist_store), så
+    ett nytt mallsobjekt syns hos alla personer utan att rader skapas.
+    När ett mallsobjekt uppdateras synkas metadata till personernas
+    avvikande rader. Bevarar användarens avklaradstatus.
     """
-    if not instance.template.is_active:
+    if created:
         return
 
-    if created:
-        # Nytt mallsobjekt - lägg till i alla befintliga personer
-        persons = Person.objects.all()
-        person_items = []
-
-        for person in persons:
-            # Kontrollera om det redan finns (borde inte, men var säker)
-            if not PersonChecklistItem.objects.filter(
-                person=person,
-                template_item=instance
-            ).exists():
-                person_items.append(PersonChecklistItem(
-                    person=person,
-                    template_item=instance,
-                    title=instance.title,
-                    description=instance.description,
-                    category=instance.category,
-                    priority=instance.priority,
-                    order=instance.order,
-                ))
-
-        PersonChecklistItem.objects.bulk_create(person_items, ignore_conflicts=True)
-    else:
-        # Befintligt mallsobjekt uppdaterat - synka metadata men bevara avklaradstatus
-        PersonChecklistItem.objects.filter(template_item=instance).update(
-            title=instance.title,
-            description=instance.description,
-            category=instance.category,
-            priority=instance.priority,
-            order=instance.order,
-            # Observera: is_completed, completed_at, notes uppdateras INTE
-        )
+    PersonChecklistItem.objects.filter(template_item=instance).update(
+        title=instance.title,
+        description=instance.description,
+        category=instance.category,
+        priority=instance.priority,
+        order=instance.order,
+        # Observera: is_completed, completed_at, notes uppdateras INTE
+    )
+    if hasattr(instance, '_completions_before'):
+        checklist_rollups.apply(checklist_rollups.difference(
+            instance._completions_before,
+            checklist_rollups.count_completions(
+                PersonChecklistItem.objects.filter(template_item=instance)
+            )
+        ))
+
+
+@receiver(pre_delete, sender=ChecklistTemplateItem)
+def remember_completions_on_template_item_delete(sender, instance, **kwargs):
+    """
+    Räkna mallsobjektets avklarade rader i en fråga innan kaskadraderingen,
+    i stället för att dra ifrån dem en och en.
+    """
+    if not hasattr(_deleting, 'template_item_ids'):
+        _deleting.template_item_ids = set()
+    _deleting.template_item_ids.add(instance.pk)
+    instance._completions_before = checklist_rollups.count_completions(
+        PersonChecklistItem.objects.filter(template_item=instance)
+    )
 
 
 @receiver(post_delete, sender=ChecklistTemplateItem)
@@ -52,31 +72,193 @@ def remove_template_item_from_persons(sender, instance, **kwargs):
     När ett mallsobjekt raderas, ta bort från alla personer.
     """
     PersonChecklistItem.objects.filter(template_item=instance).delete()
+    getattr(_deleting, 'template_item_ids', set()).discard(instance.pk)
+    checklist_rollups.apply(checklist_rollups.subtract(
+        getattr(instance, '_completions_before', {})
+    ))
+
+
+@receiver(pre_save, sender=PersonChecklistItem)
+def remember_checklist_item_completion(sender, instance, raw=False, **kwargs):
+    """Räkna radens avklaradstatus före sparningen"""
+    if raw or not instance.pk:
+        return
+    instance._completions_before = checklist_rollups.count_completions(
+        PersonChecklistItem.objects.filter(pk=instance.pk)
+    )
+
+
+@receiver(post_save, sender=PersonChecklistItem)
+def update_rollups_on_checklist_item_save(sender, instance, created, raw=False, **kwargs):
+    """Uppdatera den dagliga statistiken med radens ändring"""
+    if raw or (created and not instance.is_completed):
+        return
+    checklist_rollups.apply(checklist_rollups.difference(
+        getattr(instance, '_completions_before', {}),
+        checklist_rollups.count_completions(
+            PersonChecklistItem.objects.filter(pk=instance.pk)
+        )
+    ))
+
+
+@receiver(post_delete, sender=PersonChecklistItem)
+def update_rollups_on_checklist_item_delete(sender, instance, **kwargs):
+    """
+    Dra ifrån en raderad avklarad rad. Rader som raderas tillsammans med sin
+    person eller sitt mallsobjekt räknas av i en fråga av de signalerna.
+    """
+    if not instance.is_completed or not instance.completed_at:
+        return
+    if instance.person_id in getattr(_deleting, 'person_ids', set()):
+        return
+    if instance.template_item_id in getattr(_deleting, 'template_item_ids', set()):
+        return
+
+    template_id = None
+    if instance.template_item_id:
+        template_id = ChecklistTemplateItem.objects.filter(
+            pk=instance.template_item_id
+        ).values_list('template_id', flat=True).first()
+    user_id = Person.objects.filter(pk=instance.person_id).values_list(
+        'user_id', flat=True
+    ).first()
+    checklist_rollups.apply({
+        (user_id, timezone.localdate(instance.completed_at), instance.category, template_id): -1
+    })
+
+
+@receiver(post_save, sender=PersonRelationship)
+@receiver(post_delete, sender=PersonRelationship)
+@receiver(post_delete, sender=Person)
+def bump_relationship_graph_version(sender, instance, **kwargs):
+    """
+    Räkna upp användarens släktgrafversion när relationer eller personer
+    ändras, så att cachade släktdiagram genereras om.
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: RelationshipGraphVersion.bump(user_id))
 
 
 @receiver(post_save, sender=Person)
-def initialize_person_checklist(sender, instance, created, **kwargs):
+def bump_graph_version_on_person_change(sender, instance, created, **kwargs):
     """
-    När en ny person skapas, initiera deras checklista från aktiva mallar.
+    Namn och datum visas i släktdiagrammen - en ny person påverkar inte
+    grafen förrän den får en relation.
     """
     if not created:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: RelationshipGraphVersion.bump(user_id))
+
+
+@receiver(pre_save, sender=PersonRelationship)
+def remember_previous_parent_edge(sender, instance, raw=False, **kwargs):
+    """Kom ihåg tidigare förälder/barn-kant så att typändringar kan hanteras"""
+    instance._previous_parent_edge = None
+    if raw or not instance.pk:
+        return
+    previous = PersonRelationship.objects.filter(pk=instance.pk).first()
+    if previous:
+        instance._previous_parent_edge = previous.get_parent_child_ids()
+
+
+@receiver(post_save, sender=PersonRelationship)
+def update_ancestry_on_relationship_save(sender, instance, raw=False, **kwargs):
+    """Underhåll closure-tabellen när en relation skapas eller ändras"""
+    if raw:
         return
+    previous_edge = getattr(instance, '_previous_parent_edge', None)
+    current_edge = instance.get_parent_child_ids()
+    if previous_edge == current_edge:
+        return
+    if previous_edge:
+        ancestry.remove_parent_edge(*previous_edge)
+    if current_edge:
+        ancestry.add_parent_edge(*current_edge)
+
+
+@receiver(post_delete, sender=PersonRelationship)
+def update_ancestry_on_relationship_delete(sender, instance, **kwargs):
+    """Underhåll closure-tabellen när en relation tas bort"""
+    deleting = getattr(_deleting, 'person_ids', set())
+    if instance.person_a_id in deleting or instance.person_b_id in deleting:
+        # Hanteras av update_ancestry_on_person_delete
+        return
+    edge = instance.get_parent_child_ids()
+    if edge:
+        ancestry.remove_parent_edge(*edge)
+
+
+@receiver(pre_delete, sender=Person)
+def prepare_ancestry_on_person_delete(sender, instance, **kwargs):
+    """
+    Spara personens ättlingar innan kaskadraderingen tar bort anraderna,
+    så att de kan räknas om när personen är borta.
+    """
+    if not hasattr(_deleting, 'person_ids'):
+        _deleting.person_ids = set()
+    _deleting.person_ids.add(instance.pk)
+    instance._ancestry_descendants = ancestry.forget_person(instance.pk)
 
-    # Hämta alla objekt från aktiva mallar
-    active_template_items = ChecklistTemplateItem.objects.filter(
-        template__is_active=True
+
+@receiver(pre_delete, sender=Person)
+def remember_completions_on_person_delete(sender, instance, **kwargs):
+    """Räkna personens avklarade objekt innan kaskadraderingen"""
+    instance._completions_before = checklist_rollups.count_completions(
+        PersonChecklistItem.objects.filter(person=instance)
     )
 
-    person_items = []
-    for template_item in active_template_items:
-        person_items.append(PersonChecklistItem(
-            person=instance,
-            template_item=template_item,
-            title=template_item.title,
-            description=template_item.description,
-            category=template_item.category,
-            priority=template_item.priority,
-            order=template_item.order,
-        ))
 
-    PersonChecklistItem.objects.bulk_create(person_items, ignore_conflicts=True)
+@receiver(post_delete, sender=Person)
+def update_rollups_on_person_delete(sender, instance, **kwargs):
+    """Dra ifrån den raderade personens avklarade objekt från statistiken"""
+    checklist_rollups.apply(checklist_rollups.subtract(
+        getattr(instance, '_completions_before', {})
+    ))
+
+
+@receiver(post_delete, sender=Person)
+def update_ancestry_on_person_delete(sender, instance, **kwargs):
+    """Räkna om anraderna för den borttagna personens ättlingar"""
+    getattr(_deleting, 'person_ids', set()).discard(instance.pk)
+    ancestry.recompute_descendants(getattr(instance, '_ancestry_descendants', set()))
+
+
+@receiver(post_save, sender=Person)
+def assign_component_on_person_create(sender, instance, created, raw=False, **kwargs):
+    """En ny person utgör en egen komponent tills den får en relation"""
+    if created and not raw:
+        components.assign_new_person(instance)
+
+
+@receiver(post_save, sender=PersonRelationship)
+def merge_components_on_relationship_save(sender, instance, created, raw=False, **kwargs):
+    """Slå ihop de två personernas komponenter"""
+    if created and not raw:
+        components.merge(instance.person_a_id, instance.person_b_id)
+
+
+@receiver(post_delete, sender=PersonRelationship)
+def split_component_on_relationship_delete(sender, instance, **kwargs):
+    """Räkna om komponenten, som kan ha delats i två"""
+    deleting = getattr(_deleting, 'person_ids', set())
+    if instance.person_a_id in deleting or instance.person_b_id in deleting:
+        # Hanteras av split_component_on_person_delete
+        return
+    component_id = Person.objects.filter(pk=instance.person_a_id).values_list(
+        'component_id', flat=True
+    ).first()
+    components.split({component_id})
+
+
+@receiver(pre_delete, sender=Person)
+def remember_component_on_person_delete(sender, instance, **kwargs):
+    """Spara personens aktuella komponent innan personen raderas"""
+    instance._component_id = Person.objects.filter(pk=instance.pk).values_list(
+        'component_id', flat=True
+    ).first()
+
+
+@receiver(post_delete, sender=Person)
+def split_component_on_person_delete(sender, instance, **kwargs):
+    """Räkna om komponenten som personen tillhörde"""
+    components.split({getattr(instance, '_component_id', None)})
@@ -1,3 +1,349 @@
-from django.test import TestCase
+import tempfile
+from array import array
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+
+from .models import (
+    Person, PersonChecklistItem, ChecklistTemplate, ChecklistTemplateItem, ChecklistCategory,
+    ChecklistPriority, ChecklistCompletionDaily, PersonAncestry, PersonRelationship,
+    RelationshipGraphVersion, RelationshipType,
+)
+from . import ancestry, checklist_bulk, checklist_rollups, checklist_store, components
+from .charts import get_pedigree_chart
+from .relationship_batch import apply_relationship_batch
+from .tree_checks import check_cycles
+
+
+class ChecklistCopyOnWriteTests(TestCase):
+    """Orörda mallrader tas bort, redigerade och kommenterade bevaras"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('test', password='test')
+        self.person = Person.objects.create(
+            user=self.user, firstname='Anna', surname='Berg', directory_name='berg_anna'
+        )
+        template = ChecklistTemplate.objects.create(name='Grund')
+        self.template_item = ChecklistTemplateItem.objects.create(
+            template=template, title='Födelsebok', order=1
+        )
+
+    def prune(self):
+        return checklist_store.prune_untouched(self.person.checklist_items.all())
+
+    def test_untouched_row_is_pruned(self):
+        checklist_store.get_or_create_row(self.person, self.template_item)
+        self.assertEqual(self.prune(), 1)
+        self.assertFalse(self.person.checklist_items.exists())
+
+    def test_completed_row_is_kept(self):
+        row = checklist_store.get_or_create_row(self.person, self.template_item)
+        row.is_completed = True
+        row.save()
+        self.assertEqual(self.prune(), 0)
+
+    def test_edited_row_is_kept(self):
+        for field, value in [('title', 'Dopbok'), ('order', 5), ('description', 'Egen')]:
+            row = checklist_store.get_or_create_row(self.person, self.template_item)
+            setattr(row, field, value)
+            row.save()
+            self.assertEqual(self.prune(), 0, field)
+            row.delete()
+
+    def test_effective_checklist_merges_template(self):
+        items = checklist_store.get_person_checklist(self.person)
+        self.assertEqual([item.title for item in items], ['Födelsebok'])
+        self.assertIsNone(items[0].pk)
+        self.assertEqual(checklist_store.get_checklist_totals(self.person), (1, 0))
+
+    def test_unedited_filter_excludes_custom_and_edited_rows(self):
+        PersonChecklistItem.objects.create(person=self.person, title='Eget')
+        row = checklist_store.get_or_create_row(self.person, self.template_item)
+        self.assertEqual(
+            list(self.person.checklist_items.exclude(checklist_store.unedited_filter())
+                 .values_list('title', flat=True)),
+            ['Eget']
+        )
+        row.priority = ChecklistPriority.HIGH
+        row.save()
+        self.assertEqual(
+            self.person.checklist_items.exclude(checklist_store.unedited_filter()).count(), 2
+        )
+
+
+class ChecklistRollupTests(TestCase):
+    """Massmarkering räknas korrekt in i den dagliga statistiken"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('test', password='test')
+        self.persons = [
+            Person.objects.create(user=self.user, firstname=name, directory_name=name)
+            for name in ('anna', 'bertil', 'cecilia')
+        ]
+        template = ChecklistTemplate.objects.create(name='Grund')
+        self.template_item = ChecklistTemplateItem.objects.create(template=template, title='Födelsebok')
+
+    def completed_total(self):
+        return sum(ChecklistCompletionDaily.objects.values_list('completed', flat=True))
+
+    def test_mark_and_unmark_template_item(self):
+        checklist_store.get_or_create_row(self.persons[0], self.template_item)
+        person_ids = [person.pk for person in self.persons]
+
+        changed = checklist_bulk.mark_template_item_for_persons(
+            self.user, self.template_item, person_ids, True
+        )
+        self.assertEqual(changed, 3)
+        self.assertEqual(self.completed_total(), 3)
+        self.assertEqual(
+            checklist_bulk.mark_template_item_for_persons(self.user, self.template_item, person_ids, True),
+            0
+        )
+        self.assertEqual(self.completed_total(), 3)
+
+        checklist_bulk.mark_template_item_for_persons(self.user, self.template_item, person_ids[:2], False)
+        self.assertEqual(self.completed_total(), 1)
+        # Orörda rader tas bort igen
+        self.assertEqual(PersonChecklistItem.objects.count(), 1)
+
+    def test_rebuild_matches_incremental(self):
+        checklist_bulk.mark_template_item_for_persons(
+            self.user, self.template_item, [person.pk for person in self.persons], True
+        )
+        before = sorted(ChecklistCompletionDaily.objects.values_list('date', 'category', 'completed'))
+        checklist_rollups.rebuild(self.user)
+        after = sorted(ChecklistCompletionDaily.objects.values_list('date', 'category', 'completed'))
+        self.assertEqual(before, after)
+
+    def test_one_row_per_day_without_template(self):
+        # Rader utan mall ska också vara unika, trots att template är NULL
+        fields = dict(user=self.user, date=date(2026, 1, 1), category=ChecklistCategory.RESEARCH, template=None)
+        ChecklistCompletionDaily.objects.create(completed=1, **fields)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ChecklistCompletionDaily.objects.create(completed=1, **fields)
+
+    def test_apply_removes_empty_rows(self):
+        key = (self.user.pk, date(2026, 1, 1), self.template_item.category, None)
+        checklist_rollups.apply({key: 2})
+        checklist_rollups.apply({key: 1})
+        self.assertEqual(self.completed_total(), 3)
+        checklist_rollups.apply({key: -3})
+        self.assertFalse(ChecklistCompletionDaily.objects.exists())
+
+
+class PedigreeChartCacheTests(TestCase):
+    """Diagram cachas per släktgrafversion och äldre versioner rensas"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        settings_override = override_settings(CHART_CACHE_DIR=self.cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('test', password='test')
+        self.person = Person.objects.create(
+            user=self.user, firstname='Anna', surname='Berg', directory_name='berg_anna'
+        )
+
+    def test_cached_until_graph_changes(self):
+        first_path, first_key = get_pedigree_chart(self.person, 3)
+        self.assertEqual(get_pedigree_chart(self.person, 3), (first_path, first_key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.person.notes = 'Ändrad'
+            self.person.save()
+        second_path, second_key = get_pedigree_chart(self.person, 3)
+        self.assertNotEqual(first_key, second_key)
+        self.assertTrue(second_path.exists())
+        self.assertFalse(first_path.exists())
+
+
+class TreeCycleCheckTests(TestCase):
+    """Cykler rapporteras som starkt sammanhängande komponenter"""
+
+    def run_check(self, count, edges):
+        data = type('TreeData', (), {})()
+        data.ids = array('q', range(100, 100 + count))
+        data.parent = array('l', [p for p, _ in edges])
+        data.child = array('l', [c for _, c in edges])
+        return [violation['person_ids'] for violation in check_cycles(data)]
+
+    def test_path_between_cycles_is_not_reported(self):
+        # A <-> B -> X -> C <-> D
+        edges = [(0, 1), (1, 0), (1, 2), (2, 3), (3, 4), (4, 3)]
+        self.assertEqual(self.run_check(5, edges), [[100, 101], [103, 104]])
+
+    def test_self_loop_and_acyclic(self):
+        self.assertEqual(self.run_check(3, [(0, 0), (0, 1), (1, 2)]), [[100]])
+        self.assertEqual(self.run_check(3, [(0, 1), (1, 2)]), [])
+
+
+class ComponentTests(TestCase):
+    """Komponenterna underhålls inkrementellt och stämmer med en ombyggnad"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('test', password='test')
+        self.persons = [
+            Person.objects.create(user=self.user, firstname=name, directory_name=name)
+            for name in ('a', 'b', 'c', 'd')
+        ]
+
+    def component_ids(self):
+        return [
+            Person.objects.get(pk=person.pk).component_id for person in self.persons
+        ]
+
+    def test_union_find_uses_smallest_id(self):
+        union_find = components.UnionFind([5, 3, 9])
+        union_find.union(9, 5)
+        union_find.union(5, 3)
+        self.assertEqual(union_find.roots(), {5: 3, 3: 3, 9: 3})
+
+    def test_merge_edges_includes_persons_without_component(self):
+        a, b, c, d = self.persons
+        Person.objects.filter(pk__in=[c.pk, d.pk]).update(component_id=None)
+        components.merge_edges([(a.pk, c.pk), (d.pk, b.pk)])
+        self.assertEqual(self.component_ids(), [a.pk, b.pk, a.pk, b.pk])
+
+    def test_relationship_delete_splits_component(self):
+        a, b, c, _ = self.persons
+        PersonRelationship.objects.create(
+            user=self.user, person_a=a, person_b=b,
+            relationship_a_to_b=RelationshipType.PARENT, relationship_b_to_a=RelationshipType.CHILD
+        )
+        link = PersonRelationship.objects.create(
+            user=self.user, person_a=b, person_b=c,
+            relationship_a_to_b=RelationshipType.SIBLING, relationship_b_to_a=RelationshipType.SIBLING
+        )
+        self.assertEqual(self.component_ids()[:3], [a.pk] * 3)
+
+        link.delete()
+        incremental = self.component_ids()
+        self.assertEqual(incremental[:3], [a.pk, a.pk, c.pk])
+        components.rebuild(self.user)
+        self.assertEqual(self.component_ids(), incremental)
+
+
+class FamilyTreeMixin:
+    """Fem personer i tre generationer och hjälpmetoder för closure-tabellen"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('test', password='test')
+        # farfar -> far -> barn -> barnbarn, samt mor -> barn
+        self.grandfather, self.father, self.mother, self.child, self.grandchild = [
+            Person.objects.create(user=self.user, firstname=name, directory_name=name)
+            for name in ('farfar', 'far', 'mor', 'barn', 'barnbarn')
+        ]
+
+    def add_parent(self, parent, child):
+        # Relationen sparas med kanonisk ordning (lägst id som person A)
+        if parent.pk < child.pk:
+            return PersonRelationship.objects.create(
+                user=self.user, person_a=parent, person_b=child,
+                relationship_a_to_b=RelationshipType.PARENT, relationship_b_to_a=RelationshipType.CHILD
+            )
+        return PersonRelationship.objects.create(
+            user=self.user, person_a=child, person_b=parent,
+            relationship_a_to_b=RelationshipType.CHILD, relationship_b_to_a=RelationshipType.PARENT
+        )
+
+    def closure(self):
+        return set(PersonAncestry.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def assert_matches_rebuild(self):
+        incremental = self.closure()
+        ancestry.rebuild(self.user)
+        self.assertEqual(incremental, self.closure())
+        return incremental
+
+
+class AncestryClosureTests(FamilyTreeMixin, TestCase):
+    """Den inkrementellt underhållna closure-tabellen ska stämma med en ombyggnad"""
+
+    def test_add_parent_edges(self):
+        self.add_parent(self.father, self.child)
+        self.add_parent(self.child, self.grandchild)
+        # En kant högre upp i trädet ska nå alla ättlingar
+        self.add_parent(self.grandfather, self.father)
+        self.add_parent(self.mother, self.child)
+
+        closure = self.assert_matches_rebuild()
+        self.assertIn((self.grandfather.pk, self.grandchild.pk, 3), closure)
+        self.assertIn((self.mother.pk, self.grandchild.pk, 2), closure)
+        self.assertEqual(ancestry.count_ancestors(self.grandchild), 4)
+        self.assertTrue(ancestry.is_ancestor(self.grandfather, self.child))
+
+    def test_remove_parent_edge(self):
+        self.add_parent(self.grandfather, self.father)
+        link = self.add_parent(self.father, self.child)
+        self.add_parent(self.mother, self.child)
+        self.add_parent(self.child, self.grandchild)
+
+        link.delete()
+        closure = self.assert_matches_rebuild()
+        self.assertNotIn(self.grandfather.pk, ancestry.get_ancestor_depths(self.grandchild))
+        self.assertIn((self.mother.pk, self.grandchild.pk, 2), closure)
+
+    def test_person_delete(self):
+        self.add_parent(self.grandfather, self.father)
+        self.add_parent(self.father, self.child)
+        self.father.delete()
+        self.assertEqual(self.assert_matches_rebuild(), set())
+
+
+class RelationshipBatchTests(FamilyTreeMixin, TestCase):
+    """Batchredigering håller closure-tabellen och komponenterna uppdaterade"""
+
+    def test_batch_edits_keep_closure(self):
+        results, applied = apply_relationship_batch(self.user, [
+            {'op': 'create', 'person': self.grandfather.pk, 'related_person': self.father.pk,
+             'relationship_type': RelationshipType.PARENT},
+            {'op': 'create', 'person': self.child.pk, 'related_person': self.father.pk,
+             'relationship_type': RelationshipType.CHILD},
+            {'op': 'create', 'person': self.child.pk, 'related_person': self.grandchild.pk,
+             'relationship_type': RelationshipType.PARENT},
+        ])
+        self.assertTrue(applied, results)
+        self.assertEqual(ancestry.count_descendants(self.grandfather), 3)
+        self.assert_matches_rebuild()
+
+        results, applied = apply_relationship_batch(self.user, [
+            {'op': 'change_type', 'person': self.child.pk, 'related_person': self.grandchild.pk,
+             'relationship_type': RelationshipType.SIBLING},
+        ])
+        self.assertTrue(applied, results)
+        self.assertEqual(ancestry.count_descendants(self.grandfather), 2)
+        self.assert_matches_rebuild()
+        self.assertEqual(
+            len({Person.objects.get(pk=person.pk).component_id for person in
+                 (self.grandfather, self.father, self.child, self.grandchild)}),
+            1
+        )
+
+    def test_batch_delete_recomputes_once_without_signals(self):
+        for parent, child in ((self.grandfather, self.father), (self.father, self.child),
+                              (self.mother, self.child), (self.child, self.grandchild)):
+            self.add_parent(parent, child)
+        version = RelationshipGraphVersion.get_version(self.user.id)
+
+        with mock.patch.object(components, 'split', wraps=components.split) as split:
+            results, applied = apply_relationship_batch(self.user, [
+                {'op': 'delete', 'person': self.father.pk, 'related_person': self.child.pk},
+                {'op': 'delete', 'person': self.mother.pk, 'related_person': self.child.pk},
+            ])
+        self.assertTrue(applied, results)
+        self.assertEqual(split.call_count, 1)
+        self.assertEqual(ancestry.count_descendants(self.grandfather), 1)
+        self.assert_matches_rebuild()
+
+        component = {p.pk: Person.objects.get(pk=p.pk).component_id for p in
+                     (self.grandfather, self.father, self.mother, self.child, self.grandchild)}
+        self.assertEqual(component[self.grandfather.pk], component[self.father.pk])
+        self.assertEqual(component[self.child.pk], component[self.grandchild.pk])
+        self.assertNotEqual(component[self.father.pk], component[self.child.pk])
+        self.assertNotEqual(component[self.mother.pk], component[self.child.pk])
+        self.assertGreater(RelationshipGraphVersion.get_version(self.user.id), version)
@@ -0,0 +1,246 @@
+"""
+Konsistenskontroll av släktträdet.
+
+Alla personers datum och alla relationskanter läses in i kompakta arrayer
+(två frågor totalt) och kontrollerna körs sedan som batchoperationer över
+arrayerna, så att även stora träd kontrolleras på några sekunder.
+"""
+from array import array
+from collections import Counter
+
+from .models import Person, PersonRelationship, RelationshipType
+
+# Saknat datum i datumarrayerna (date.toordinal() är alltid >= 1)
+NO_DATE = 0
+
+TOO_MANY_PARENTS = 'too_many_parents'
+CHILD_BORN_BEFORE_PARENT = 'child_born_before_parent'
+PARENT_CHILD_CYCLE = 'parent_child_cycle'
+SPOUSE_LIFETIMES = 'spouse_lifetimes'
+
+CHECK_LABELS = {
+    TOO_MANY_PARENTS: 'Fler än två föräldrar',
+    CHILD_BORN_BEFORE_PARENT: 'Barn fött före förälder',
+    PARENT_CHILD_CYCLE: 'Cykel i förälder/barn-relationer',
+    SPOUSE_LIFETIMES: 'Makar vars livstider inte överlappar',
+}
+
+
+class TreeData:
+    """Personer och relationskanter i arrayform"""
+
+    def __init__(self, user=None):
+        persons = Person.objects.all()
+        relationships = PersonRelationship.objects.all()
+        if user is not None:
+            persons = persons.filter(user=user)
+            relationships = relationships.filter(user=user)
+
+        self.ids = array('q')
+        self.birth = array('l')
+        self.death = array('l')
+        for person_id, birth_date, death_date in persons.values_list(
+            'id', 'birth_date', 'death_date'
+        ).iterator():
+            self.ids.append(person_id)
+            self.birth.append(birth_date.toordinal() if birth_date else NO_DATE)
+            self.death.append(death_date.toordinal() if death_date else NO_DATE)
+        self.index = {person_id: i for i, person_id in enumerate(self.ids)}
+
+        # Kanter som index i personarrayerna
+        self.parent = array('l')
+        self.child = array('l')
+        self.spouse_a = array('l')
+        self.spouse_b = array('l')
+        for person_a_id, person_b_id, a_to_b in relationships.values_list(
+            'person_a_id', 'person_b_id', 'relationship_a_to_b'
+        ).iterator():
+            a = self.index.get(person_a_id)
+            b = self.index.get(person_b_id)
+            if a is None or b is None:
+                continue
+            if a_to_b == RelationshipType.PARENT:
+                self.parent.append(a)
+                self.child.append(b)
+            elif a_to_b == RelationshipType.CHILD:
+                self.parent.append(b)
+                self.child.append(a)
+            elif a_to_b == RelationshipType.SPOUSE:
+                self.spouse_a.append(a)
+                self.spouse_b.append(b)
+
+
+def _violation(check, person_ids, message):
+    return {
+        'check': check,
+        'label': CHECK_LABELS[check],
+        'person_ids': list(person_ids),
+        'message': message,
+    }
+
+
+def check_too_many_parents(data):
+    """Personer med fler än två föräldrar"""
+    counts = Counter(data.child)
+    flagged = {child for child, count in counts.items() if count > 2}
+    if not flagged:
+        return []
+
+    parents = {}
+    for p, c in zip(data.parent, data.child):
+        if c in flagged:
+            parents.setdefault(c, []).append(data.ids[p])
+
+    return [
+        _violation(
+            TOO_MANY_PARENTS,
+            [data.ids[child]] + parents[child],
+            f'{counts[child]} föräldrar registrerade'
+        )
+        for child in sorted(flagged)
+    ]
+
+
+def check_child_born_before_parent(data):
+    """Förälder/barn-kanter där barnet är fött före föräldern"""
+    birth = data.birth
+    return [
+        _violation(
+            CHILD_BORN_BEFORE_PARENT,
+            [data.ids[c], data.ids[p]],
+            f'Barnet är fött {birth[p] - birth[c]} dagar före föräldern'
+        )
+        for p, c in zip(data.parent, data.child)
+        if birth[p] != NO_DATE and birth[c] != NO_DATE and birth[c] < birth[p]
+    ]
+
+
+def _unsorted_nodes(count, sources, targets):
+    """Kahns algoritm: returnera noder som inte kan topologiskt sorteras"""
+    indegree = array('l', [0]) * count
+    outgoing = [[] for _ in range(count)]
+    for s, t in zip(sources, targets):
+        indegree[t] += 1
+        outgoing[s].append(t)
+
+    queue = [n for n in range(count) if indegree[n] == 0]
+    for node in queue:
+        for target in outgoing[node]:
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+    return {n for n in range(count) if indegree[n] > 0}
+
+
+def _strongly_connected(nodes, outgoing):
+    """Tarjans algoritm (iterativ): starkt sammanhängande komponenter bland nodes"""
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(outgoing.get(root, ())))]
+        while work:
+            node, targets = work[-1]
+            for target in targets:
+                if target not in index:
+                    index[target] = lowlink[target] = len(index)
+                    stack.append(target)
+                    on_stack.add(target)
+                    work.append((target, iter(outgoing.get(target, ()))))
+                    break
+                if target in on_stack:
+                    lowlink[node] = min(lowlink[node], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def check_cycles(data):
+    """Personer som ingår i en cykel av förälder/barn-relationer"""
+    count = len(data.ids)
+    # Alla cykelnoder finns bland noderna som varken kan sorteras framåt
+    # eller bakåt; de kan dock även ligga på en väg mellan två cykler
+    forward = _unsorted_nodes(count, data.parent, data.child)
+    if not forward:
+        return []
+    candidates = forward & _unsorted_nodes(count, data.child, data.parent)
+
+    outgoing = {}
+    self_loops = set()
+    for p, c in zip(data.parent, data.child):
+        if p in candidates and c in candidates:
+            outgoing.setdefault(p, []).append(c)
+            if p == c:
+                self_loops.add(p)
+
+    # Bara komponenter med fler än en person, eller en person som är sin egen förälder
+    cycles = sorted(
+        sorted(component)
+        for component in _strongly_connected(sorted(candidates), outgoing)
+        if len(component) > 1 or component[0] in self_loops
+    )
+    return [
+        _violation(
+            PARENT_CHILD_CYCLE,
+            [data.ids[n] for n in component],
+            f'{len(component)} personer är sina egna anor'
+        )
+        for component in cycles
+    ]
+
+
+def check_spouse_lifetimes(data):
+    """Makar där den ena dog innan den andra föddes"""
+    birth, death = data.birth, data.death
+    violations = []
+    for a, b in zip(data.spouse_a, data.spouse_b):
+        if (death[a] != NO_DATE and birth[b] != NO_DATE and death[a] < birth[b]) or \
+                (death[b] != NO_DATE and birth[a] != NO_DATE and death[b] < birth[a]):
+            violations.append(_violation(
+                SPOUSE_LIFETIMES,
+                [data.ids[a], data.ids[b]],
+                'Den ena maken dog innan den andra föddes'
+            ))
+    return violations
+
+
+CHECKS = [
+    check_too_many_parents,
+    check_child_born_before_parent,
+    check_cycles,
+    check_spouse_lifetimes,
+]
+
+
+def check_tree(user=None):
+    """
+    Kör alla konsistenskontroller.
+
+    Returns:
+        Tuple (lista med avvikelser, antal kontrollerade personer)
+    """
+    data = TreeData(user)
+    violations = []
+    for check in CHECKS:
+        violations.extend(check(data))
+    return violations, len(data.ids)
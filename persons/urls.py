@@ -3,13 +3,16 @@ from .views import (
     PersonListView, PersonDetailView, PersonCreateView,
     PersonUpdateView, PersonDeleteView,
     PersonRelationshipCreateView, PersonRelationshipDeleteView,
-    PersonChecklistView, ChecklistItemToggleView,
+    PersonRelationshipBatchView,
+    PersonChecklistView, ChecklistItemToggleView, ChecklistTemplateItemToggleView,
+    ChecklistBulkUpdateView,
     ChecklistItemCreateView, ChecklistItemUpdateView, ChecklistItemDeleteView,
-    ChecklistReportView,
-    PersonRenameView, PersonDuplicateView, PersonExportView,
+    ChecklistReportView, ChecklistMatrixView,
+    PersonRenameView, PersonDuplicateView, PersonExportView, PersonArchiveView,
     PersonChronologicalReportView, PersonDocumentSyncView,
     SetProfileImageView, ImageUploadView, ImageDeleteView,
-    FamilyTreeView, toggle_bookmark, set_main_person
+    FamilyTreeView, PedigreeChartView, TreeCheckReportView,
+    TreeIslandsView, toggle_bookmark, set_main_person
 )
 
 app_name = 'persons'
@@ -17,6 +20,8 @@ app_name = 'persons'
 urlpatterns = [
     path('', PersonListView.as_view(), name='list'),
     path('tree/', FamilyTreeView.as_view(), name='family_tree'),
+    path('tree/check/', TreeCheckReportView.as_view(), name='tree_check'),
+    path('tree/islands/', TreeIslandsView.as_view(), name='tree_islands'),
     path('create/', PersonCreateView.as_view(), name='create'),
     path('<int:pk>/', PersonDetailView.as_view(), name='detail'),
     path('<int:pk>/edit/', PersonUpdateView.as_view(), name='update'),
@@ -28,11 +33,20 @@ urlpatterns = [
     path('relationships/<int:pk>/delete/',
          PersonRelationshipDeleteView.as_view(),
          name='relationship_delete'),
+    path('relationships/batch/',
+         PersonRelationshipBatchView.as_view(),
+         name='relationship_batch'),
     # Checklist management
     path('<int:pk>/checklist/', PersonChecklistView.as_view(), name='checklist'),
     path('checklist-item/<int:pk>/toggle/',
          ChecklistItemToggleView.as_view(),
          name='checklist_item_toggle'),
+    path('<int:person_pk>/checklist/template-item/<int:template_item_pk>/toggle/',
+         ChecklistTemplateItemToggleView.as_view(),
+         name='checklist_template_item_toggle'),
+    path('checklist-items/bulk/',
+         ChecklistBulkUpdateView.as_view(),
+         name='checklist_bulk_update'),
     path('<int:person_pk>/checklist/add/',
          ChecklistItemCreateView.as_view(),
          name='checklist_item_create'),
@@ -44,13 +58,18 @@ urlpatterns = [
          name='checklist_item_delete'),
     # Reports
     path('checklist-report/', ChecklistReportView.as_view(), name='checklist_report'),
+    path('checklist-matrix/', ChecklistMatrixView.as_view(), name='checklist_matrix'),
     # Tools menu
     path('<int:pk>/rename/', PersonRenameView.as_view(), name='rename'),
     path('<int:pk>/duplicate/', PersonDuplicateView.as_view(), name='duplicate'),
     path('<int:pk>/export/', PersonExportView.as_view(), name='export'),
+    path('archive/', PersonArchiveView.as_view(), name='archive'),
     path('<int:pk>/chronological-report/',
          PersonChronologicalReportView.as_view(),
          name='chronological_report'),
+    path('<int:pk>/pedigree-chart/',
+         PedigreeChartView.as_view(),
+         name='pedigree_chart'),
     path('<int:pk>/sync-documents/',
          PersonDocumentSyncView.as_view(),
          name='sync_documents'),
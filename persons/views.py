@@ -7,22 +7,29 @@ from django.views.generic import (
 )
 from django.urls import reverse_lazy
 from django.db.models import Q, Count, Sum, Case, When, IntegerField
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404, StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.db import transaction
 from pathlib import Path
 import json
 import csv
-import os
 import shutil
 from datetime import datetime
 
 from .models import (
     Person, PersonRelationship, RelationshipType,
-    PersonChecklistItem, ChecklistCategory, BookmarkedPerson
+    PersonChecklistItem, ChecklistCategory, ChecklistTemplateItem, BookmarkedPerson
 )
 from .forms import PersonForm, PersonRelationshipForm, PersonRenameForm, PersonExportForm
-from documents.models import Document, DocumentType
-from core.utils import get_media_root
+from documents.models import Document
+from documents.uploads import (
+    UPLOAD_IMAGE_TYPES, finalize_upload, get_image_document_type, unique_path
+)
+from documents.archive import stream_archive
+from documents.sync import get_person_dir, sync_person_documents
+from documents.tagging import tag_cloud
+from core.utils import IMAGE_TYPES, get_media_root
+from . import ancestry, checklist_store, components
 
 
 class PersonListView(LoginRequiredMixin, ListView):
@@ -68,6 +75,20 @@ class PersonListView(LoginRequiredMixin, ListView):
             ).values_list('person_id', flat=True)
             queryset = queryset.filter(id__in=bookmarked_person_ids)
 
+        # Filter: Ättlingar till / anor till en viss person (closure-tabell)
+        descendant_of = self.get_filter_person('descendant_of')
+        if descendant_of:
+            queryset = ancestry.filter_descendants(queryset, descendant_of)
+
+        ancestor_of = self.get_filter_person('ancestor_of')
+        if ancestor_of:
+            queryset = ancestry.filter_ancestors(queryset, ancestor_of)
+
+        # Filter: Samma sammanhängande del av trädet (ö) som en viss person
+        component_of = self.get_filter_person('component')
+        if component_of:
+            queryset = queryset.filter(component_id=component_of.component_id)
+
         # Sortering med svensk alfabetisk ordning
         sort = self.request.GET.get('sort', 'surname')
 
@@ -119,9 +140,22 @@ class PersonListView(LoginRequiredMixin, ListView):
 
         return queryset
 
+    def get_filter_person(self, param):
+        """Hämta personen som anges i en filterparameter (t.ex. descendant_of)"""
+        person_id = self.request.GET.get(param)
+        if not person_id or not person_id.isdigit():
+            return None
+        return Person.objects.filter(pk=person_id, user=self.request.user).first()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search'] = self.request.GET.get('search', '')
+        context['descendant_of'] = self.get_filter_person('descendant_of')
+        context['ancestor_of'] = self.get_filter_person('ancestor_of')
+        context['component_of'] = self.get_filter_person('component')
+        context['checklist_template_items'] = ChecklistTemplateItem.objects.filter(
+            template__is_active=True
+        ).select_related('template').order_by('template__name', 'order', 'title')
         context['sort'] = self.request.GET.get('sort', 'surname')
         context['has_documents'] = self.request.GET.get('has_documents', '')
         context['is_alive'] = self.request.GET.get('is_alive', '')
@@ -151,7 +185,7 @@ class PersonDetailView(LoginRequiredMixin, DetailView):
 
         # Hämta dokument för personen (exkludera bilder - de visas i eget galleri)
         documents = Document.objects.filter(person=person).exclude(
-            file_type__in=['jpg', 'jpeg', 'png', 'gif', 'bmp']
+            file_type__in=IMAGE_TYPES
         )
         context['documents'] = documents
 
@@ -207,9 +241,15 @@ class PersonDetailView(LoginRequiredMixin, DetailView):
         context['relationships_grouped'] = relationships_grouped
         context['total_relationships'] = all_relationships.count()
 
+        # Anor och ättlingar (indexerade frågor mot closure-tabellen)
+        context['descendant_count'] = ancestry.count_descendants(person)
+        context['ancestor_count'] = ancestry.count_ancestors(person)
+
         # Checklist-statistik
-        context['total_checklist_items'] = person.checklist_items.count()
-        context['completed_checklist_items'] = person.checklist_items.filter(is_completed=True).count()
+        (
+            context['total_checklist_items'],
+            context['completed_checklist_items']
+        ) = checklist_store.get_checklist_totals(person)
 
         # Bokmärkesstatus
         context['is_bookmarked'] = BookmarkedPerson.objects.filter(
@@ -221,6 +261,9 @@ class PersonDetailView(LoginRequiredMixin, DetailView):
         context['images'] = images
         context['total_images'] = images.count()
 
+        # Personens dokumenttaggar med antal (indexerat på person, tagg)
+        context['document_tags'] = tag_cloud(self.request.user, person)
+
         return context
 
 
@@ -339,6 +382,45 @@ class PersonRelationshipDeleteView(LoginRequiredMixin, DeleteView):
         return reverse_lazy('persons:detail', kwargs={'pk': self.person.pk})
 
 
+class PersonRelationshipBatchView(LoginRequiredMixin, View):
+    """
+    JSON-API för att skapa, ta bort och ändra många relationer i ett anrop.
+
+    Tar emot {"operations": [...], "atomic": true} och returnerar
+    resultat per operation. Se persons.relationship_batch för format.
+    """
+
+    def post(self, request) -> JsonResponse:
+        from .relationship_batch import apply_relationship_batch, BatchError
+
+        try:
+            payload = json.loads(request.body or b'{}')
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({'success': False, 'error': 'Ogiltig JSON'}, status=400)
+
+        operations = payload.get('operations') if isinstance(payload, dict) else None
+        if not isinstance(operations, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'Fältet "operations" måste vara en lista'
+            }, status=400)
+
+        try:
+            results, applied = apply_relationship_batch(
+                request.user,
+                operations,
+                atomic=payload.get('atomic', True) is not False
+            )
+        except BatchError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        return JsonResponse({
+            'success': applied,
+            'applied': applied,
+            'results': results,
+        }, status=200 if applied else 400)
+
+
 # Checklistvyer
 
 
@@ -359,28 +441,22 @@ class PersonChecklistView(LoginRequiredMixin, DetailView):
         category_filter = self.request.GET.get('category')
         status_filter = self.request.GET.get('status')
 
-        # Bas queryset
-        checklist_items = person.checklist_items.all()
-
-        # Applicera filter
-        if category_filter:
-            checklist_items = checklist_items.filter(category=category_filter)
-
-        if status_filter == 'completed':
-            checklist_items = checklist_items.filter(is_completed=True)
-        elif status_filter == 'incomplete':
-            checklist_items = checklist_items.filter(is_completed=False)
-
-        # Gruppera per kategori
-        items_by_category = {}
-        for category_code, category_name in ChecklistCategory.choices:
-            category_items = checklist_items.filter(category=category_code)
-            if category_items.exists():
-                items_by_category[category_name] = category_items
+        # Personens rader sammanslagna med orörda mallsobjekt, grupperade i Python
+        checklist_items = checklist_store.get_person_checklist(
+            person, category=category_filter, status=status_filter
+        )
+        grouped = {}
+        for item in checklist_items:
+            grouped.setdefault(item.category, []).append(item)
+
+        items_by_category = {
+            category_name: grouped[category_code]
+            for category_code, category_name in ChecklistCategory.choices
+            if category_code in grouped
+        }
 
-        # Statistik
-        total = person.checklist_items.count()
-        completed = person.checklist_items.filter(is_completed=True).count()
+        # Statistik (ofiltrerad)
+        total, completed = checklist_store.get_checklist_totals(person)
 
         context.update({
             'checklist_items': checklist_items,
@@ -410,6 +486,9 @@ class ChecklistItemToggleView(LoginRequiredMixin, View):
             item.is_completed = not item.is_completed
             item.save()
 
+            # En mallrad som åter är orörd läses från mallen i stället
+            checklist_store.prune_untouched(PersonChecklistItem.objects.filter(pk=item.pk))
+
             return JsonResponse({
                 'success': True,
                 'is_completed': item.is_completed,
@@ -419,6 +498,105 @@ class ChecklistItemToggleView(LoginRequiredMixin, View):
             return JsonResponse({'success': False, 'error': 'Objektet hittades inte'}, status=404)
 
 
+class ChecklistTemplateItemToggleView(LoginRequiredMixin, View):
+    """AJAX-vy för att bocka av/på ett mallsobjekt för en person"""
+
+    def post(self, request, person_pk, template_item_pk):
+        person = get_object_or_404(Person, pk=person_pk, user=request.user)
+        template_item = ChecklistTemplateItem.objects.filter(pk=template_item_pk).first()
+        if template_item is None:
+            return JsonResponse({'success': False, 'error': 'Objektet hittades inte'}, status=404)
+
+        # Personen får en egen rad först när den avviker från mallen
+        with transaction.atomic():
+            item = checklist_store.get_or_create_row(person, template_item)
+            item.is_completed = not item.is_completed
+            item.save()
+            checklist_store.prune_untouched(PersonChecklistItem.objects.filter(pk=item.pk))
+
+        return JsonResponse({
+            'success': True,
+            'is_completed': item.is_completed,
+            'completed_at': item.completed_at.isoformat() if item.completed_at else None
+        })
+
+
+class ChecklistBulkUpdateView(LoginRequiredMixin, View):
+    """
+    Sätt avklaradstatus för många checklistobjekt i ett anrop.
+
+    Tar emot item_ids (personernas checklistrader) och/eller template_items +
+    person_ids (mallsobjekt hos flera personer), samt completed.
+    Fungerar både som JSON-API och som vanligt formulär (med next).
+    """
+
+    def post(self, request) -> HttpResponse:
+        from .checklist_bulk import mark_items_by_id, mark_template_item_for_persons
+
+        is_json = request.content_type == 'application/json'
+        if is_json:
+            try:
+                payload = json.loads(request.body or b'{}')
+            except (ValueError, UnicodeDecodeError):
+                return JsonResponse({'success': False, 'error': 'Ogiltig JSON'}, status=400)
+            if not isinstance(payload, dict):
+                return JsonResponse({'success': False, 'error': 'Ogiltig JSON'}, status=400)
+            item_ids = payload.get('item_ids') or []
+            template_item_ids = payload.get('template_items') or []
+            if payload.get('template_item'):
+                template_item_ids.append(payload['template_item'])
+            person_ids = payload.get('person_ids') or []
+            completed = payload.get('completed', True) is not False
+        else:
+            item_ids = request.POST.getlist('item_ids')
+            template_item_ids = request.POST.getlist('template_items') + request.POST.getlist('template_item')
+            person_ids = request.POST.getlist('person_ids')
+            completed = request.POST.get('completed', '1') != '0'
+
+        try:
+            item_ids = [int(i) for i in item_ids]
+            person_ids = [int(i) for i in person_ids]
+            template_item_ids = [int(i) for i in template_item_ids if i]
+        except (TypeError, ValueError):
+            error = 'Id:n måste vara heltal'
+            if is_json:
+                return JsonResponse({'success': False, 'error': error}, status=400)
+            messages.error(request, error)
+            return redirect(self.get_next_url())
+
+        template_items = list(ChecklistTemplateItem.objects.filter(pk__in=template_item_ids))
+        if len(template_items) != len(set(template_item_ids)):
+            if is_json:
+                return JsonResponse({'success': False, 'error': 'Mallsobjektet hittades inte'}, status=404)
+            messages.error(request, 'Mallsobjektet hittades inte.')
+            return redirect(self.get_next_url())
+
+        with transaction.atomic():
+            updated = mark_items_by_id(request.user, item_ids, completed) if item_ids else 0
+            for template_item in template_items:
+                updated += mark_template_item_for_persons(
+                    request.user, template_item, person_ids, completed
+                )
+
+        if is_json:
+            return JsonResponse({'success': True, 'updated': updated, 'is_completed': completed})
+
+        status = 'avklarade' if completed else 'ej avklarade'
+        messages.success(request, f'{updated} checklistobjekt markerade som {status}.')
+        return redirect(self.get_next_url())
+
+    def get_next_url(self):
+        """Gå tillbaka till sidan formuläret skickades från"""
+        from django.utils.http import url_has_allowed_host_and_scheme
+
+        next_url = self.request.POST.get('next')
+        if next_url and url_has_allowed_host_and_scheme(
+            next_url, allowed_hosts={self.request.get_host()}
+        ):
+            return next_url
+        return reverse_lazy('persons:checklist_report')
+
+
 class ChecklistItemCreateView(LoginRequiredMixin, CreateView):
     """Skapa anpassat checklistobjekt för en person"""
     model = PersonChecklistItem
@@ -496,21 +674,20 @@ class ChecklistReportView(LoginRequiredMixin, ListView):
     context_object_name = 'persons'
 
     def get_queryset(self):
-        return Person.objects.filter(user=self.request.user).annotate(
-            total_items=Count('checklist_items'),
-            completed_items=Count(
-                'checklist_items',
-                filter=Q(checklist_items__is_completed=True)
-            )
+        return checklist_store.annotate_checklist_totals(
+            Person.objects.filter(user=self.request.user)
         ).order_by('-completed_items', 'surname', 'firstname')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Hämta alla unika checklistobjekt-titlar för dropdown
-        available_items = PersonChecklistItem.objects.filter(
-            person__user=self.request.user
-        ).values_list('title', flat=True).distinct().order_by('title')
+        # Hämta alla unika checklistobjekt-titlar för dropdown (mallar och anpassade)
+        available_items = sorted(
+            set(checklist_store.active_template_items().values_list('title', flat=True)) |
+            set(PersonChecklistItem.objects.filter(
+                person__user=self.request.user
+            ).values_list('title', flat=True).distinct())
+        )
         context['available_items'] = available_items
 
         # Filter efter specifikt checklistobjekt
@@ -520,17 +697,15 @@ class ChecklistReportView(LoginRequiredMixin, ListView):
         if item_title_filter and filter_status:
             if filter_status == 'has':
                 # Personer som har objektet avklarat
-                filtered_persons = Person.objects.filter(
-                    user=self.request.user,
-                    checklist_items__title__iexact=item_title_filter,
-                    checklist_items__is_completed=True
-                ).annotate(
-                    total_items=Count('checklist_items'),
-                    completed_items=Count(
-                        'checklist_items',
-                        filter=Q(checklist_items__is_completed=True)
-                    )
-                ).distinct().order_by('-completed_items', 'surname', 'firstname')
+                persons_with_completed = PersonChecklistItem.objects.filter(
+                    person__user=self.request.user,
+                    title__iexact=item_title_filter,
+                    is_completed=True
+                ).values_list('person_id', flat=True)
+
+                filtered_persons = self.get_queryset().filter(
+                    id__in=persons_with_completed
+                )
             elif filter_status == 'lacks':
                 # Personer som saknar objektet eller har det men ej avklarat
                 persons_with_completed = Person.objects.filter(
@@ -539,17 +714,9 @@ class ChecklistReportView(LoginRequiredMixin, ListView):
                     checklist_items__is_completed=True
                 ).values_list('id', flat=True)
 
-                filtered_persons = Person.objects.filter(
-                    user=self.request.user
-                ).exclude(
+                filtered_persons = self.get_queryset().exclude(
                     id__in=persons_with_completed
-                ).annotate(
-                    total_items=Count('checklist_items'),
-                    completed_items=Count(
-                        'checklist_items',
-                        filter=Q(checklist_items__is_completed=True)
-                    )
-                ).order_by('-completed_items', 'surname', 'firstname')
+                )
             else:
                 filtered_persons = None
 
@@ -557,17 +724,105 @@ class ChecklistReportView(LoginRequiredMixin, ListView):
             context['item_title_filter'] = item_title_filter
             context['filter_status'] = filter_status
 
-        # Övergripande statistik
-        all_items = PersonChecklistItem.objects.filter(person__user=self.request.user)
+        # Övergripande statistik: aktiva mallsobjekt för varje person plus övriga rader
+        total_persons = Person.objects.filter(user=self.request.user).count()
+        row_totals = PersonChecklistItem.objects.filter(
+            person__user=self.request.user
+        ).aggregate(
+            extra=Count('id', filter=checklist_store.extra_rows_filter()),
+            completed=Count('id', filter=Q(is_completed=True)),
+        )
         context.update({
-            'total_checklist_items': all_items.count(),
-            'total_completed': all_items.filter(is_completed=True).count(),
-            'total_persons': self.get_queryset().count(),
+            'total_checklist_items': (
+                checklist_store.active_template_items().count() * total_persons +
+                row_totals['extra']
+            ),
+            'total_completed': row_totals['completed'],
+            'total_persons': total_persons,
         })
 
         return context
 
 
+class ChecklistMatrixView(LoginRequiredMixin, View):
+    """Matris över avklarade checklistobjekt: personer × mallsobjekt"""
+
+    paginate_by = 50
+
+    def get(self, request) -> HttpResponse:
+        """Visa matrisen eller exportera den som CSV (?format=csv)"""
+        from django.core.paginator import Paginator
+        from django.http import StreamingHttpResponse
+        from .checklist_matrix import (
+            ChecklistMatrix, iter_csv, FILTER_DONE, FILTER_OPEN
+        )
+
+        item_ids = [int(i) for i in request.GET.getlist('items') if i.isdigit()]
+        matrix = ChecklistMatrix(request.user, item_ids)
+
+        conditions = []
+        filters = {}
+        for item in matrix.items:
+            wanted = request.GET.get(f'f{item.id}')
+            if wanted in (FILTER_DONE, FILTER_OPEN):
+                conditions.append((item.id, wanted))
+                filters[item.id] = wanted
+        matrix.filter(conditions)
+
+        sort = request.GET.get('sort', '')
+        sort_keys = [key for key in sort.split(',') if key]
+        matrix.sort(sort_keys)
+
+        if request.GET.get('format') == 'csv':
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            response = StreamingHttpResponse(
+                iter_csv(matrix), content_type='text/csv; charset=utf-8'
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="checklistmatris_{timestamp}.csv"'
+            )
+            return response
+
+        paginator = Paginator(matrix.persons, self.paginate_by)
+        page_obj = paginator.get_page(request.GET.get('page'))
+
+        # Frågesträng utan sida/sortering för länkar i tabellhuvudet
+        query = request.GET.copy()
+        query.pop('page', None)
+        query.pop('sort', None)
+        query.pop('format', None)
+
+        def next_sort(key):
+            """Klick på en kolumn gör den till första sorteringsnyckel (växlar riktning)"""
+            # Fallande (avklarade först) vid första klicket
+            primary = key if sort_keys[:1] == ['-' + key] else '-' + key
+            rest = [k for k in sort_keys if k.lstrip('-') != key]
+            return ','.join([primary] + rest[:2])
+
+        context = {
+            'items': [
+                {
+                    'item': item,
+                    'filter': filters.get(item.id, ''),
+                    'sort_value': next_sort(str(item.id)),
+                }
+                for item in matrix.items
+            ],
+            'completed_sort_value': next_sort('completed'),
+            'rows': [matrix.row(person) for person in page_obj],
+            'page_obj': page_obj,
+            'matrix_count': len(matrix.persons),
+            'sort': sort,
+            'primary_sort': sort_keys[0] if sort_keys else '',
+            'base_query': query.urlencode(),
+            'selected_items': item_ids,
+            'all_items': ChecklistTemplateItem.objects.filter(
+                template__is_active=True
+            ).select_related('template').order_by('template__name', 'order', 'title'),
+        }
+        return render(request, 'persons/checklist_matrix.html', context)
+
+
 class PersonRenameView(LoginRequiredMixin, View):
     """Döp om person och flytta katalog atomärt"""
 
@@ -662,12 +917,16 @@ class PersonDuplicateView(LoginRequiredMixin, View):
         context = {
             'person': person,
             'relationships_count': person.get_all_relationships().count(),
-            'checklist_count': person.checklist_items.count(),
+            'checklist_count': self.get_copied_checklist_items(person).count(),
         }
         return render(
             request, 'persons/person_duplicate_confirm.html', context
         )
 
+    def get_copied_checklist_items(self, person):
+        """Rader som kopieras: anpassade objekt och redigerade eller kommenterade mallsobjekt"""
+        return person.checklist_items.exclude(checklist_store.unedited_filter())
+
     def post(self, request, pk: int) -> HttpResponse:
         """Utför duplicering"""
         original_person = get_object_or_404(Person, pk=pk, user=request.user)
@@ -741,8 +1000,9 @@ class PersonDuplicateView(LoginRequiredMixin, View):
                             )
                         )
 
-                # Kopiera checklistobjekt
-                for item in original_person.checklist_items.all():
+                # Kopiera anpassade objekt och anteckningar (orörda mallsobjekt läses från mallen)
+                copied_items = self.get_copied_checklist_items(original_person)
+                for item in copied_items:
                     PersonChecklistItem.objects.create(
                         person=new_person,
                         template_item=item.template_item,
@@ -760,7 +1020,7 @@ class PersonDuplicateView(LoginRequiredMixin, View):
                     f'Person "{original_person.get_full_name()}" har '
                     f'duplicerats som "{new_person.get_full_name()}" med '
                     f'{relationships.count()} relationer och '
-                    f'{original_person.checklist_items.count()} '
+                    f'{copied_items.count()} '
                     f'checklistobjekt.'
                 )
 
@@ -796,6 +1056,8 @@ class PersonExportView(LoginRequiredMixin, View):
         include_relationships = form.cleaned_data['include_relationships']
         include_checklist = form.cleaned_data['include_checklist']
         include_documents = form.cleaned_data['include_documents']
+        include_descendants = form.cleaned_data['include_descendants']
+        include_component = form.cleaned_data['include_component']
 
         # Bygg exportdata
         data = {
@@ -842,7 +1104,7 @@ class PersonExportView(LoginRequiredMixin, View):
 
         if include_checklist:
             checklist = []
-            for item in person.checklist_items.all():
+            for item in checklist_store.get_person_checklist(person):
                 checklist.append({
                     'title': item.title,
                     'description': item.description,
@@ -871,6 +1133,51 @@ class PersonExportView(LoginRequiredMixin, View):
                 })
             data['documents'] = documents
 
+        if include_descendants:
+            depths = ancestry.get_descendant_depths(person)
+            descendants = ancestry.filter_descendants(
+                Person.objects.filter(user=request.user), person
+            )
+            data['descendants'] = [
+                {
+                    'name': descendant.get_full_name(),
+                    'generation': depths.get(descendant.id),
+                    'birth_date': (
+                        descendant.birth_date.isoformat()
+                        if descendant.birth_date else None
+                    ),
+                    'death_date': (
+                        descendant.death_date.isoformat()
+                        if descendant.death_date else None
+                    ),
+                    'directory_name': descendant.directory_name,
+                }
+                for descendant in sorted(
+                    descendants,
+                    key=lambda d: (depths.get(d.id, 0), d.surname, d.firstname)
+                )
+            ]
+
+        if include_component:
+            members = Person.objects.filter(
+                user=request.user, component_id=person.component_id
+            ).exclude(pk=person.pk)
+            data['component'] = [
+                {
+                    'name': member.get_full_name(),
+                    'birth_date': (
+                        member.birth_date.isoformat()
+                        if member.birth_date else None
+                    ),
+                    'death_date': (
+                        member.death_date.isoformat()
+                        if member.death_date else None
+                    ),
+                    'directory_name': member.directory_name,
+                }
+                for member in members
+            ]
+
         # Generera fil baserat på format
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename_base = f"{person.directory_name}_{timestamp}"
@@ -960,7 +1267,64 @@ class PersonExportView(LoginRequiredMixin, View):
                         doc['relative_path'],
                         doc['tags']
                     ])
+                writer.writerow([])
+
+            # Ättlingar
+            if include_descendants and 'descendants' in data:
+                writer.writerow(['ÄTTLINGAR'])
+                writer.writerow([
+                    'Namn', 'Generation', 'Födelsedatum',
+                    'Dödsdatum', 'Katalognamn'
+                ])
+                for descendant in data['descendants']:
+                    writer.writerow([
+                        descendant['name'],
+                        descendant['generation'],
+                        descendant['birth_date'] or '',
+                        descendant['death_date'] or '',
+                        descendant['directory_name']
+                    ])
+                writer.writerow([])
 
+            # Samma ö i trädet
+            if include_component and 'component' in data:
+                writer.writerow(['SAMMA Ö I TRÄDET'])
+                writer.writerow([
+                    'Namn', 'Födelsedatum', 'Dödsdatum', 'Katalognamn'
+                ])
+                for member in data['component']:
+                    writer.writerow([
+                        member['name'],
+                        member['birth_date'] or '',
+                        member['death_date'] or '',
+                        member['directory_name']
+                    ])
+
+        return response
+
+
+class PersonArchiveView(LoginRequiredMixin, View):
+    """Ladda ner en eller flera personers alla filer som ett ZIP-arkiv"""
+
+    def get(self, request) -> HttpResponse:
+        """Strömma arkivet för personerna i ?person=<id> (kan anges flera gånger)"""
+        person_ids = [i for i in request.GET.getlist('person') if i.isdigit()]
+        persons = list(
+            Person.objects.filter(user=request.user, pk__in=person_ids)
+            .order_by('directory_name')
+        )
+        if not persons:
+            raise Http404("Inga personer valda")
+
+        if len(persons) == 1:
+            filename = f"{persons[0].directory_name}.zip"
+        else:
+            filename = f"genlib_arkiv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+
+        response = StreamingHttpResponse(
+            stream_archive(persons), content_type='application/zip'
+        )
+        response['Content-Disposition'] = content_disposition_header(True, filename)
         return response
 
 
@@ -1007,126 +1371,123 @@ class PersonChronologicalReportView(LoginRequiredMixin, DetailView):
         return context
 
 
-class PersonDocumentSyncView(LoginRequiredMixin, View):
-    """Synkronisera dokument från filsystemet till databasen"""
+class PedigreeChartView(LoginRequiredMixin, View):
+    """Antavla för utskrift som SVG eller PDF, serverad från diskcachen"""
+
+    def get(self, request, pk: int) -> HttpResponse:
+        """Visa förhandsgranskning eller returnera diagramfilen"""
+        from .charts import (
+            get_pedigree_chart, pdf_available, CONTENT_TYPES,
+            MIN_DEPTH, MAX_DEPTH, DEFAULT_DEPTH
+        )
 
-    def post(self, request, pk: int) -> HttpResponse:
-        """Utför synkronisering av dokument för en person"""
         person = get_object_or_404(Person, pk=pk, user=request.user)
 
         try:
-            # Räknare för statistik
-            added_count = 0
-            removed_count = 0
-            updated_count = 0
+            depth = int(request.GET.get('depth', DEFAULT_DEPTH))
+        except ValueError:
+            depth = DEFAULT_DEPTH
+        depth = max(MIN_DEPTH, min(MAX_DEPTH, depth))
+
+        chart_format = request.GET.get('format')
+        if not chart_format:
+            return render(request, 'persons/pedigree_chart.html', {
+                'person': person,
+                'depth': depth,
+                'depth_choices': range(MIN_DEPTH, MAX_DEPTH + 1),
+                'pdf_available': pdf_available(),
+            })
 
-            # Hämta personens katalog
-            person_dir = Path(get_media_root()) / 'persons' / person.directory_name
+        if chart_format not in CONTENT_TYPES:
+            raise Http404('Okänt diagramformat')
+        if chart_format == 'pdf' and not pdf_available():
+            messages.error(request, 'PDF-export kräver att paketet fpdf2 är installerat.')
+            return redirect('persons:pedigree_chart', pk=pk)
+
+        cache_path, cache_key = get_pedigree_chart(person, depth, chart_format)
+
+        etag = f'"{cache_key}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=304)
+        else:
+            filename = f"antavla_{person.directory_name}_{depth}gen.{chart_format}"
+            response = FileResponse(
+                open(cache_path, 'rb'),
+                content_type=CONTENT_TYPES[chart_format],
+                as_attachment=request.GET.get('download') == '1',
+                filename=filename
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
-            if not person_dir.exists():
-                messages.warning(
-                    request,
-                    f'Katalogen {person_dir} finns inte ännu. '
-                    'Inga dokument att synkronisera.'
-                )
-                return redirect('persons:detail', pk=pk)
-
-            # Hämta alla dokumenttyper
-            document_types = DocumentType.objects.all()
-
-            # Skapa en mappning av (target_directory, filename) -> DocumentType
-            doc_type_map = {}
-            for doc_type in document_types:
-                doc_type_map[(doc_type.target_directory, doc_type.filename)] = doc_type
-
-            # Samla alla filer som finns i filsystemet
-            files_in_fs = set()
-            new_documents_to_create = []
-
-            # Skanna igenom alla kataloger i personens katalog
-            for item in person_dir.rglob('*'):
-                if item.is_file():
-                    # Beräkna relativ sökväg från personens katalog
-                    rel_path = item.relative_to(person_dir)
-                    target_dir = str(rel_path.parent) if rel_path.parent != Path('.') else ''
-                    filename = item.name
-
-                    # Normalisera target_dir för att hantera Windows vs Unix-sökvägar
-                    target_dir = target_dir.replace('\\', '/')
-
-                    # Lägg till i set med filsystemfiler
-                    files_in_fs.add((target_dir, filename))
-
-                    # Kolla om dokumentet redan finns i databasen
-                    existing_doc = Document.objects.filter(
-                        person=person,
-                        relative_path=str(rel_path).replace('\\', '/')
-                    ).first()
-
-                    if existing_doc:
-                        # Uppdatera metadata för befintligt dokument
-                        old_size = existing_doc.file_size
-                        new_size = item.stat().st_size
-
-                        if old_size != new_size:
-                            existing_doc.file_size = new_size
-                            existing_doc.file_modified_at = datetime.fromtimestamp(
-                                item.stat().st_mtime
-                            )
-                            existing_doc.save()
-                            updated_count += 1
-                    else:
-                        # Nytt dokument - försök hitta matchande DocumentType
-                        doc_type = doc_type_map.get((target_dir, filename))
-
-                        if doc_type:
-                            # Skapa nytt Document-objekt
-                            file_size = item.stat().st_size
-                            _, ext = os.path.splitext(filename)
-                            file_type = ext.lstrip('.').lower()
-
-                            new_doc = Document(
-                                person=person,
-                                document_type=doc_type,
-                                filename=filename,
-                                relative_path=str(rel_path).replace('\\', '/'),
-                                file_size=file_size,
-                                file_type=file_type,
-                                file_modified_at=datetime.fromtimestamp(
-                                    item.stat().st_mtime
-                                )
-                            )
 
-                            # Sätt filsökvägen
-                            upload_path = os.path.join(
-                                'persons',
-                                person.directory_name,
-                                str(rel_path).replace('\\', '/')
-                            )
-                            new_doc.file.name = upload_path
+class TreeCheckReportView(LoginRequiredMixin, View):
+    """Rapport över inkonsistenser i släktträdet"""
+
+    def get(self, request) -> HttpResponse:
+        """Kör konsistenskontrollerna och visa avvikelserna grupperade per kontroll"""
+        from .tree_checks import check_tree, CHECK_LABELS
+
+        violations, person_count = check_tree(user=request.user)
+
+        persons = Person.objects.filter(user=request.user).in_bulk(
+            {person_id for v in violations for person_id in v['person_ids']}
+        )
+
+        groups = {check: [] for check in CHECK_LABELS}
+        for violation in violations:
+            violation['persons'] = [
+                persons[person_id] for person_id in violation['person_ids']
+                if person_id in persons
+            ]
+            groups[violation['check']].append(violation)
+
+        context = {
+            'groups': [
+                {'check': check, 'label': label, 'violations': groups[check]}
+                for check, label in CHECK_LABELS.items()
+            ],
+            'total_violations': len(violations),
+            'person_count': person_count,
+        }
+        return render(request, 'persons/tree_check_report.html', context)
 
-                            new_documents_to_create.append(new_doc)
-                            added_count += 1
 
-            # Skapa alla nya dokument
-            if new_documents_to_create:
-                Document.objects.bulk_create(new_documents_to_create)
+class TreeIslandsView(LoginRequiredMixin, View):
+    """Rapport över släktträdets sammanhängande delar (öar)"""
 
-            # Ta bort dokument som inte längre finns i filsystemet
-            existing_documents = Document.objects.filter(person=person)
-            for doc in existing_documents:
-                # Extrahera target_directory och filename från relative_path
-                rel_path_parts = Path(doc.relative_path)
-                target_dir = str(rel_path_parts.parent) if rel_path_parts.parent != Path('.') else ''
-                filename = rel_path_parts.name
+    def get(self, request) -> HttpResponse:
+        """Visa öarna med storlek och representativ person, största först"""
+        islands = components.get_islands(request.user)
+        connected = [island for island in islands if island['size'] > 1]
+
+        context = {
+            'islands': connected,
+            'isolated_count': len(islands) - len(connected),
+            'total_persons': sum(island['size'] for island in islands),
+        }
+        return render(request, 'persons/tree_islands.html', context)
+
+
+class PersonDocumentSyncView(LoginRequiredMixin, View):
+    """Synkronisera dokument från filsystemet till databasen"""
+
+    def post(self, request, pk: int) -> HttpResponse:
+        """Utför synkronisering av dokument för en person"""
+        person = get_object_or_404(Person, pk=pk, user=request.user)
 
-                # Normalisera
-                target_dir = target_dir.replace('\\', '/')
+        person_dir = get_person_dir(person)
+        if not person_dir.exists():
+            messages.warning(
+                request,
+                f'Katalogen {person_dir} finns inte ännu. '
+                'Inga dokument att synkronisera.'
+            )
+            return redirect('persons:detail', pk=pk)
 
-                if (target_dir, filename) not in files_in_fs:
-                    # Filen finns inte längre i filsystemet
-                    doc.delete()
-                    removed_count += 1
+        try:
+            added_count, updated_count, removed_count = sync_person_documents(person)
 
             # Bygg meddelande
             message_parts = []
@@ -1166,7 +1527,7 @@ class SetProfileImageView(LoginRequiredMixin, View):
         document = get_object_or_404(Document, pk=document_pk, person=person)
 
         # Validera att dokumentet är en bild
-        if document.file_type not in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+        if document.file_type not in IMAGE_TYPES:
             return JsonResponse({
                 'success': False,
                 'error': 'Dokumentet är inte en bildfil'
@@ -1205,8 +1566,6 @@ class ImageUploadView(LoginRequiredMixin, View):
 
     def post(self, request, pk: int) -> HttpResponse:
         """Hantera uppladdning av flera bilder"""
-        from documents.models import DocumentType
-
         person = get_object_or_404(Person, pk=pk, user=request.user)
         files = request.FILES.getlist('images')
 
@@ -1215,12 +1574,7 @@ class ImageUploadView(LoginRequiredMixin, View):
             return redirect('persons:detail', pk=pk)
 
         # Hämta DocumentType för bilder (standard: "bild")
-        # Försök först hitta "bild", annars leta efter en DocumentType med "bilder" i target_directory
-        doc_type = DocumentType.objects.filter(name='bild').first()
-        if not doc_type:
-            doc_type = DocumentType.objects.filter(
-                target_directory__icontains='bilder'
-            ).first()
+        doc_type = get_image_document_type()
 
         if not doc_type:
             messages.error(
@@ -1244,27 +1598,16 @@ class ImageUploadView(LoginRequiredMixin, View):
             try:
                 # Validera att det är en bildfil
                 file_ext = uploaded_file.name.split('.')[-1].lower()
-                if file_ext not in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+                if file_ext not in UPLOAD_IMAGE_TYPES:
                     errors.append(f'{uploaded_file.name}: Inte en giltig bildfiltyp')
                     continue
 
                 # Generera unikt filnamn om filen redan finns
-                filename = uploaded_file.name
-                file_path = image_path / filename
-                counter = 1
-                while file_path.exists():
-                    name_parts = filename.rsplit('.', 1)
-                    if len(name_parts) == 2:
-                        filename = f"{name_parts[0]}_{counter}.{name_parts[1]}"
-                    else:
-                        filename = f"{filename}_{counter}"
-                    file_path = image_path / filename
-                    counter += 1
+                file_path = unique_path(image_path, uploaded_file.name)
+                filename = file_path.name
 
-                # Spara filen
-                with open(file_path, 'wb+') as destination:
-                    for chunk in uploaded_file.chunks():
-                        destination.write(chunk)
+                # Flytta filen på plats (eller skriv den från minnet) och hasha den
+                file_size, content_hash = finalize_upload(uploaded_file, file_path)
 
                 # Skapa Document-post
                 relative_path = f"{image_dir_name}/{filename}"
@@ -1273,8 +1616,9 @@ class ImageUploadView(LoginRequiredMixin, View):
                     document_type=doc_type,
                     filename=filename,
                     relative_path=relative_path,
-                    file_size=file_path.stat().st_size,
-                    file_type=file_ext
+                    file_size=file_size,
+                    file_type=file_ext,
+                    content_hash=content_hash
                 )
 
                 # Sätt file.name till rätt sökväg från media root
@@ -1310,7 +1654,7 @@ class ImageDeleteView(LoginRequiredMixin, View):
         document = get_object_or_404(Document, pk=image_pk, person=person)
 
         # Validera att dokumentet är en bild
-        if document.file_type not in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
+        if document.file_type not in IMAGE_TYPES:
             return JsonResponse({
                 'success': False,
                 'error': 'Dokumentet är inte en bildfil'
@@ -1383,22 +1727,24 @@ class FamilyTreeView(LoginRequiredMixin, View):
             )
         ).order_by('first_name_first_word', 'sort_firstname_full', 'sort_surname')
 
+        # Begränsa till en sammanhängande del av trädet (ö) om en sådan valts
+        component_of = None
+        component = request.GET.get('component')
+        if component and component.isdigit():
+            component_of = Person.objects.filter(pk=component, user=request.user).first()
+        if component_of:
+            persons = persons.filter(component_id=component_of.component_id)
+
         # Hämta vald person (om någon)
         selected_person_id = request.GET.get('person_id')
         selected_person = None
         if selected_person_id:
-            selected_person = Person.objects.filter(
-                pk=selected_person_id,
-                user=request.user
-            ).first()
+            selected_person = persons.filter(pk=selected_person_id).first()
 
         # Om ingen person vald, välj huvudperson, annars person med många relationer
         if not selected_person and persons.exists():
             # Först, försök hitta huvudpersonen
-            main_person = Person.objects.filter(
-                user=request.user,
-                is_main_person=True
-            ).first()
+            main_person = persons.filter(is_main_person=True).first()
 
             if main_person:
                 selected_person = main_person
@@ -1423,6 +1769,11 @@ class FamilyTreeView(LoginRequiredMixin, View):
             'selected_person': selected_person,
             'total_persons': persons.count(),
             'tree_data': tree_data,
+            'component_of': component_of,
+            'islands': [
+                island for island in components.get_islands(request.user)
+                if island['size'] > 1 and island['representative']
+            ],
         }
 
         return render(request, 'persons/family_tree.html', context)